@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+admission.py
+Admission control: token-bucket rate limits and load shedding shared
+by every gunicorn worker through a small SQLite file
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, jsonify, make_response, request
+
+from config import ADMISSION_DATABASE, ADMISSION_MAX_INFLIGHT
+
+CRITICAL = 0
+NORMAL = 1
+BACKGROUND = 2
+
+# A priority is shed once this fraction of the in-flight cap is in use,
+# so order placement and claims keep the last slots to themselves
+SHED_AT = {CRITICAL: 1.0, NORMAL: 0.8, BACKGROUND: 0.5}
+
+# In-flight cap of a service run outside serve.py, e.g. by the Flask
+# development server, when ADMISSION_MAX_INFLIGHT is 0
+DEFAULT_MAX_INFLIGHT = 5
+
+# Per-user token buckets: (tokens refilled per second, burst size)
+USER_LIMITS = {
+    CRITICAL: (2.0, 10),
+    NORMAL: (5.0, 20),
+    BACKGROUND: (0.5, 3),
+}
+
+# Header app.py names the signed-in user in when calling the data
+# server, whose requests all come from the same address
+USER_HEADER = "X-User-Id"
+
+# Endpoints admitted without limits; health checks must keep answering
+# under load so that a busy worker is not taken for a dead one
+EXEMPT = (None, "static", "assets.serve_asset", "healthz", "readyz")
+
+# Workers that have not been seen for this long no longer count
+# towards the in-flight total, e.g. after being killed mid-request
+STALE_WORKER_SECONDS = 60
+# Buckets untouched for this long have refilled, so dropping them
+# changes no limit; every limit refills well within it
+IDLE_BUCKET_SECONDS = 60 * 60
+# Seconds between each process's sweeps of idle buckets and workers
+PRUNE_INTERVAL_SECONDS = 60
+
+_local = threading.local()
+# This process's in-flight requests per service. The store holds a copy
+# that is overwritten whole, so a write that fails is made good by the
+# next one rather than leaking a slot
+_inflight = {}
+_inflight_lock = threading.Lock()
+_pruned = {"at": 0.0}
+_max_inflight = ADMISSION_MAX_INFLIGHT or DEFAULT_MAX_INFLIGHT
+
+
+def set_capacity(slots):
+    """Sizes the in-flight cap to the slots the service has.
+
+    serve.py calls it with its workers times their threads before
+    loading the service; ADMISSION_MAX_INFLIGHT overrides it if set.
+    """
+    global _max_inflight  # pylint: disable=global-statement
+    _max_inflight = ADMISSION_MAX_INFLIGHT or slots
+
+
+def _connect():
+    """Returns this thread's connection to the admission store."""
+    owner = (os.getpid(), ADMISSION_DATABASE)
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.owner == owner:
+        return conn
+    conn = sqlite3.connect(ADMISSION_DATABASE, timeout=1)
+    # The state is ephemeral; losing it in a crash only resets limits
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS inflight (
+            service TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            seen REAL NOT NULL,
+            PRIMARY KEY (service, pid)
+        )
+        """)
+    conn.commit()
+    _local.conn = conn
+    _local.owner = owner
+    return conn
+
+
+def _take_token(cursor, key, rate, burst, now):
+    """Takes one token from a bucket.
+
+    Returns 0 if a token was taken, else the seconds until one refills.
+    """
+    row = cursor.execute(
+        "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+    ).fetchone()
+    tokens = burst if row is None else row[0]
+    if row is not None:
+        tokens = min(burst, tokens + (now - row[1]) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cursor.execute(
+        "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+        (key, tokens - 1, now),
+    )
+    return 0
+
+
+def _write_inflight(cursor, service, count, now):
+    """Stores count as this process's in-flight total for service."""
+    cursor.execute(
+        """INSERT INTO inflight (service, pid, count, seen)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (service, pid)
+        DO UPDATE SET count = excluded.count, seen = excluded.seen""",
+        (service, os.getpid(), count, now),
+    )
+
+
+def _prune(cursor, now):
+    """Drops buckets that have refilled and workers that are gone."""
+    cursor.execute(
+        "DELETE FROM buckets WHERE updated < ?",
+        (now - IDLE_BUCKET_SECONDS,),
+    )
+    cursor.execute(
+        "DELETE FROM inflight WHERE seen < ?",
+        (now - STALE_WORKER_SECONDS,),
+    )
+    _pruned["at"] = now
+
+
+def admit(service, endpoint, priority, user_key, route_limit=None):
+    """Decides whether a request may run.
+
+    Returns None to admit it, or (status, retry_after) to reject it.
+    The in-flight count of this worker is incremented on admission and
+    must be released with release().
+    """
+    now = time.time()
+    conn = _connect()
+    cursor = conn.cursor()
+    with _inflight_lock:
+        mine = _inflight.get(service, 0)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if now - _pruned["at"] > PRUNE_INTERVAL_SECONDS:
+                _prune(cursor, now)
+            others = cursor.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM inflight "
+                "WHERE service = ? AND pid != ? AND seen > ?",
+                (service, os.getpid(), now - STALE_WORKER_SECONDS),
+            ).fetchone()[0]
+            if others + mine >= _max_inflight * SHED_AT[priority]:
+                conn.rollback()
+                return 503, 1
+
+            rate, burst = USER_LIMITS[priority]
+            wait = _take_token(
+                cursor,
+                f"{service}:user:{user_key}:{priority}",
+                rate,
+                burst,
+                now,
+            )
+            if not wait and route_limit:
+                wait = _take_token(
+                    cursor,
+                    f"{service}:route:{endpoint}",
+                    *route_limit,
+                    now,
+                )
+            if wait:
+                conn.rollback()
+                return 429, wait
+
+            _write_inflight(cursor, service, mine + 1, now)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        _inflight[service] = mine + 1
+        return None
+
+
+def release(service):
+    """Releases the in-flight slot taken by admit().
+
+    The slot is freed even if the store cannot be written; the next
+    admission or release of this process stores the right count.
+    """
+    conn = _connect()
+    with _inflight_lock:
+        count = max(_inflight.get(service, 0) - 1, 0)
+        _inflight[service] = count
+        try:
+            _write_inflight(conn.cursor(), service, count, time.time())
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+
+def init_app(app, service, priorities, user_key, route_limits=None):
+    """Puts admission control in front of every route of app.
+
+    priorities maps endpoint names to CRITICAL or BACKGROUND; others
+    are NORMAL. route_limits maps endpoint names to (rate, burst)
+    buckets shared by all users. If the admission store itself fails,
+    requests are admitted rather than rejected.
+    """
+    route_limits = route_limits or {}
+
+    @app.before_request
+    def _admit():
+        if request.endpoint in EXEMPT:
+            return None
+        priority = priorities.get(request.endpoint, NORMAL)
+        try:
+            rejected = admit(
+                service,
+                request.endpoint,
+                priority,
+                user_key(),
+                route_limits.get(request.endpoint),
+            )
+        except sqlite3.Error as error:
+            print(f"Admission control unavailable: {error}")
+            return None
+        if rejected is None:
+            g.admitted = True
+            return None
+
+        status, retry_after = rejected
+        message = (
+            "Server busy, please retry"
+            if status == 503
+            else "Too many requests, please slow down"
+        )
+        response = make_response(jsonify({"error": message}), status)
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return response
+
+    @app.teardown_request
+    def _release(_error):
+        if g.pop("admitted", False):
+            try:
+                release(service)
+            except sqlite3.Error as error:
+                print(f"Admission control unavailable: {error}")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+analytics.py
+Order history aggregates for the admin dashboard: daily volume,
+revenue, time to delivery, top items and deliverer earnings
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config import DELIVERY_FEE_PERCENTAGE
+
+# Rows turned into arrays at a time while loading order history
+CHUNK_ROWS = 50000
+SECONDS_PER_DAY = 86400
+
+# Columns of the rows aggregate_days reads; times are Unix seconds and
+# missing values are None
+ORDER_COLUMNS = (
+    "order_id",
+    "placed_at",
+    "fulfilled",
+    "claimed_by",
+    "delivered_at",
+)
+LINE_COLUMNS = ("order_id", "item_id", "quantity", "price")
+
+
+def epoch_seconds(timestamp):
+    """Returns a CURRENT_TIMESTAMP-style UTC time as Unix seconds."""
+    return (
+        datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+def day_name(day):
+    """Returns the ISO date of a day counted from the Unix epoch."""
+    return str(np.datetime64(int(day), "D"))
+
+
+def load_columns(chunks, width):
+    """Stacks chunks of row tuples into one float array per column.
+
+    Only one chunk of Python tuples is alive at a time; None becomes
+    NaN.
+    """
+    arrays = [
+        np.asarray(rows, dtype=np.float64).reshape(-1, width)
+        for rows in chunks
+    ]
+    if not arrays:
+        return np.empty((width, 0))
+    return np.concatenate(arrays).T
+
+
+def _grouped(index, groups, weights=None):
+    """Sums weights (or counts rows) per group index."""
+    return np.bincount(index, weights=weights, minlength=groups)
+
+
+def aggregate_days(
+    order_chunks, line_chunks
+):  # pylint: disable=too-many-locals
+    """Returns {ISO day: aggregates} for the orders in order_chunks.
+
+    order_chunks yields lists of ORDER_COLUMNS rows and line_chunks
+    lists of LINE_COLUMNS rows, one per cart line of every fulfilled
+    order among them. Orders count towards the day they were placed;
+    revenue, items and earnings only come from fulfilled orders. The
+    aggregates are plain JSON-ready dicts, so days can be cached and
+    added up with summarize.
+    """
+    order_id, placed_at, fulfilled, claimed_by, delivered_at = (
+        load_columns(order_chunks, len(ORDER_COLUMNS))
+    )
+    line_order, line_item, quantity, price = load_columns(
+        line_chunks, len(LINE_COLUMNS)
+    )
+
+    days, day_index = np.unique(
+        placed_at // SECONDS_PER_DAY, return_inverse=True
+    )
+    fulfilled = fulfilled == 1
+
+    # Subtotal of every order, from its lines
+    by_id = np.argsort(order_id)
+    line_position = by_id[
+        np.searchsorted(order_id, line_order, sorter=by_id)
+    ]
+    line_total = quantity * price
+    subtotal = _grouped(line_position, len(order_id), line_total)
+
+    orders = _grouped(day_index, len(days))
+    fulfilled_orders = _grouped(day_index[fulfilled], len(days))
+    revenue = _grouped(
+        day_index[fulfilled], len(days), subtotal[fulfilled]
+    )
+
+    delivery_seconds = delivered_at - placed_at
+    timed = fulfilled & ~np.isnan(delivery_seconds)
+    timed_orders = _grouped(day_index[timed], len(days))
+    timed_seconds = _grouped(
+        day_index[timed], len(days), delivery_seconds[timed]
+    )
+
+    # Quantity and revenue of each item on each day, as one grid
+    items, item_index = np.unique(line_item, return_inverse=True)
+    cell = day_index[line_position] * len(items) + item_index
+    cells = len(days) * len(items)
+    item_quantity = _grouped(cell, cells, quantity).reshape(
+        len(days), len(items)
+    )
+    item_revenue = _grouped(cell, cells, line_total).reshape(
+        len(days), len(items)
+    )
+
+    # Deliveries and earnings of each deliverer on each day
+    paid = fulfilled & ~np.isnan(claimed_by)
+    deliverers, deliverer_index = np.unique(
+        claimed_by[paid], return_inverse=True
+    )
+    cell = day_index[paid] * len(deliverers) + deliverer_index
+    cells = len(days) * len(deliverers)
+    deliveries = _grouped(cell, cells).reshape(
+        len(days), len(deliverers)
+    )
+    earnings = _grouped(
+        cell, cells, subtotal[paid] * DELIVERY_FEE_PERCENTAGE
+    ).reshape(len(days), len(deliverers))
+
+    result = {}
+    for row, day in enumerate(days):
+        sold = np.flatnonzero(item_quantity[row])
+        delivered = np.flatnonzero(deliveries[row])
+        result[day_name(day)] = {
+            "orders": int(orders[row]),
+            "fulfilled": int(fulfilled_orders[row]),
+            "revenue": float(revenue[row]),
+            "timed_orders": int(timed_orders[row]),
+            "delivery_seconds": float(timed_seconds[row]),
+            "items": {
+                str(int(items[column])): [
+                    int(item_quantity[row, column]),
+                    float(item_revenue[row, column]),
+                ]
+                for column in sold
+            },
+            "deliverers": {
+                str(int(deliverers[column])): [
+                    int(deliveries[row, column]),
+                    float(earnings[row, column]),
+                ]
+                for column in delivered
+            },
+        }
+    return result
+
+
+def summarize(days, top=10):  # pylint: disable=too-many-locals
+    """Adds up daily aggregates for the dashboard.
+
+    Returns {"days": [...], "totals": {...}, "top_items": [...],
+    "deliverers": [...]}; days are newest first, items are ranked by
+    quantity sold and deliverers by earnings. Item and deliverer ids
+    are ints.
+    """
+    daily = []
+    items = {}
+    deliverers = {}
+    for day in sorted(days, reverse=True):
+        aggregates = days[day]
+        timed = aggregates["timed_orders"]
+        daily.append(
+            {
+                "day": day,
+                "orders": aggregates["orders"],
+                "fulfilled": aggregates["fulfilled"],
+                "revenue": round(aggregates["revenue"], 2),
+                "delivery_minutes": (
+                    round(
+                        aggregates["delivery_seconds"] / timed / 60, 1
+                    )
+                    if timed
+                    else None
+                ),
+            }
+        )
+        for totals, key in (
+            (items, "items"),
+            (deliverers, "deliverers"),
+        ):
+            for entity, (count, amount) in aggregates[key].items():
+                total = totals.setdefault(int(entity), [0, 0.0])
+                total[0] += count
+                total[1] += amount
+
+    timed = sum(days[day]["timed_orders"] for day in days)
+    delivery_seconds = sum(
+        days[day]["delivery_seconds"] for day in days
+    )
+    totals = {
+        "orders": sum(day["orders"] for day in daily),
+        "fulfilled": sum(day["fulfilled"] for day in daily),
+        "revenue": round(sum(day["revenue"] for day in daily), 2),
+        "delivery_minutes": (
+            round(delivery_seconds / timed / 60, 1) if timed else None
+        ),
+    }
+    top_items = sorted(
+        items.items(), key=lambda entry: entry[1][0], reverse=True
+    )[:top]
+    earners = sorted(
+        deliverers.items(), key=lambda entry: entry[1][1], reverse=True
+    )
+    return {
+        "days": daily,
+        "totals": totals,
+        "top_items": [
+            {
+                "item_id": item_id,
+                "quantity": count,
+                "revenue": round(amount, 2),
+            }
+            for item_id, (count, amount) in top_items
+        ],
+        "deliverers": [
+            {
+                "user_id": user_id,
+                "deliveries": count,
+                "earnings": round(amount, 2),
+            }
+            for user_id, (count, amount) in earners
+        ],
+    }
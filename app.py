@@ -3,9 +3,9 @@
 app.py
 Authors: TigerCart team
 """
+
 import os
-import json
-import requests
+import sqlite3
 from flask import (
     Flask,
     render_template,
@@ -15,27 +15,107 @@ from flask import (
     session,
     jsonify,
     flash,
+    Response,
 )
-from config import get_debug_mode, SECRET_KEY
-from database import (
-    get_main_db_connection,
-    get_user_db_connection,
-    init_user_db,
+from config import (
+    get_debug_mode,
+    SECRET_KEY,
+    BREAKER_RESET_SECONDS,
+    ADMIN_USERS,
+    DELIVERY_FEE_PERCENTAGE,
+    TEMPLATE_CACHE_DIR,
+    COMPRESS_MIN_SIZE,
+    COMPRESS_LEVEL,
 )
+import admission
 import auth
-
-# Import and register the auth Blueprint
+import backend
+import etags
+import export
+import health
+import jobs
+import locations
+import order_events
+import repository
+import response_compression
+import warmup
+from backend import BackendUnavailable
+from fragment_cache import FragmentCacheExtension
+from records import JSONProvider
+
+# Import and register the auth and asset Blueprints
 from auth import auth_bp
-
+from assets import assets_bp
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 app.secret_key = SECRET_KEY
 app.register_blueprint(auth_bp)
+app.register_blueprint(assets_bp)
+app.jinja_env.add_extension(FragmentCacheExtension)
+# Compiled templates are kept on disk, so a restart loads them rather
+# than compiling every template again
+app.jinja_env.bytecode_cache = warmup.bytecode_cache(
+    TEMPLATE_CACHE_DIR, [FragmentCacheExtension]
+)
+
+# Order placement and claims win over timeline polling under load
+admission.init_app(
+    app,
+    service="app",
+    priorities={
+        "place_order": admission.CRITICAL,
+        "accept_delivery": admission.CRITICAL,
+        "decline_delivery": admission.CRITICAL,
+        "update_checklist": admission.CRITICAL,
+        "order_status": admission.BACKGROUND,
+        "order_changes": admission.BACKGROUND,
+    },
+    user_key=lambda: session.get("user_id") or request.remote_addr,
+)
+
+# Ready once the databases answer and every template is compiled
+health.init_app(
+    app,
+    checks={
+        **health.data_checks(),
+        "templates": lambda: warmup.compile_templates(app),
+    },
+)
+
+# Repeat views of unchanged pages are answered 304, and the rest are
+# compressed
+etags.init_app(app)
+response_compression.init_app(app, COMPRESS_MIN_SIZE, COMPRESS_LEVEL)
+
+
+CHANGE_FEED_LIMIT = 200
+# What the dispatch board shows of each order it lists
+BOARD_FIELDS = (
+    "id",
+    "total_items",
+    "user_id",
+    "location",
+    "zone_id",
+    "earnings",
+)
 
 
-SERVER_URL = "http://localhost:5150"
-REQUEST_TIMEOUT = 5
-DELIVERY_FEE_PERCENTAGE = 0.1
+@app.errorhandler(BackendUnavailable)
+def backend_unavailable(error):
+    """Fails fast with a degraded page while the data server is down."""
+    print(f"Data server unavailable: {error}")
+    headers = {"Retry-After": str(BREAKER_RESET_SECONDS)}
+    if request.is_json:
+        message = "Service temporarily unavailable, please retry"
+        return jsonify({"error": message}), 503, headers
+    return (
+        render_template(
+            "degraded.html", username=session.get("username")
+        ),
+        503,
+        headers,
+    )
 
 
 # Root route
@@ -44,7 +124,10 @@ DELIVERY_FEE_PERCENTAGE = 0.1
 def home():
     """Redirects to login if the user is not logged in, else shows home page."""
     username = auth.authenticate()
-    return render_template("home.html", username=username,)
+    return render_template(
+        "home.html",
+        username=username,
+    )
 
 
 @app.route("/settings", methods=["GET", "POST"])
@@ -52,21 +135,13 @@ def settings():
     username = auth.authenticate()
     """Settings page where user can update their Venmo handle."""
     user_id = session["user_id"]
-    conn = get_user_db_connection()
-    cursor = conn.cursor()
+    users = repository.get().users
     if request.method == "POST":
         venmo_handle = request.form.get("venmo_handle")
-        cursor.execute(
-            "UPDATE users SET venmo_handle = ? WHERE user_id = ?",
-            (venmo_handle, user_id),
-        )
-        conn.commit()
+        users.set_venmo_handle(user_id, venmo_handle)
         flash("Venmo handle updated successfully.")
         return redirect(url_for("settings"))
-    user = cursor.execute(
-        "SELECT venmo_handle FROM users WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    conn.close()
+    user = users.get(user_id)
     return render_template(
         "settings.html",
         venmo_handle=user["venmo_handle"] if user else "",
@@ -78,32 +153,26 @@ def settings():
 def shop():
     """Displays items available in the shop and current order if any."""
     username = auth.authenticate()
-    response = requests.get(
-        f"{SERVER_URL}/items", timeout=REQUEST_TIMEOUT
-    )
-    sample_items = response.json()
 
     # Check if the user is logged in
     user_id = session.get("user_id")
     current_order = None
 
     if user_id:
-        conn = get_main_db_connection()
-        cursor = conn.cursor()
-
         # Fetch the user's current order (status 'placed' or 'claimed')
-        cursor.execute(
-            "SELECT * FROM orders WHERE user_id = ? AND status IN ('placed', 'claimed') ORDER BY timestamp DESC LIMIT 1",
-            (user_id,),
+        current_order = repository.get().orders.latest_for_user(
+            user_id, active_only=True
         )
-        current_order = cursor.fetchone()
-        conn.close()
     else:
         # If not logged in, redirect to login or home page
         return redirect(url_for("auth.login"))
 
+    # Items are only fetched if the cached category list is stale
     return render_template(
-        "shop.html", items=sample_items, current_order=current_order,
+        "shop.html",
+        load_items=backend.get_items,
+        catalog_version=repository.get().items.catalog_version(),
+        current_order=current_order,
         username=username,
     )
 
@@ -116,46 +185,24 @@ def shopper_timeline():
     if not user_id:
         return redirect(url_for("home"))
 
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
+    repo = repository.get()
 
     # Retrieve the most recent order for this user
-    cursor.execute(
-        "SELECT * FROM orders WHERE user_id = ? ORDER BY timestamp DESC LIMIT 1",
-        (user_id,),
-    )
-    order = cursor.fetchone()
+    order = repo.orders.latest_for_user(user_id)
+    if not order:
+        return "No orders found."
+    order["timeline"] = repo.orders.timeline(order["id"])
 
     # Get the deliverer's Venmo handle from the database
     deliverer_venmo = None
-    if order and order["claimed_by"]:
-
-        user_conn = get_user_db_connection()
-        user_cursor = user_conn.cursor()
-        user_cursor.execute(
-            "SELECT venmo_handle FROM users WHERE user_id = ?",
-            (order["claimed_by"],),
-        )
-        deliverer = user_cursor.fetchone()
+    if order["claimed_by"]:
+        deliverer = repo.users.get(order["claimed_by"])
         if deliverer:
             deliverer_venmo = deliverer["venmo_handle"]
-        user_conn.close()
-
-    conn.close()
-
-    if not order:
-        return "No orders found."
-
-    # Convert SQLite Row object to a dictionary
-    order_dict = dict(order)
-    order_dict["timeline"] = json.loads(
-        order_dict.get("timeline", "{}")
-    )
-    order_dict["cart"] = json.loads(order_dict.get("cart", "{}"))
 
     return render_template(
         "shopper_timeline.html",
-        order=order_dict,
+        order=order,
         deliverer_venmo=deliverer_venmo,
         username=username,
     )
@@ -165,17 +212,20 @@ def shopper_timeline():
 def category_view(category):
     """Displays items in a specific category."""
     username = auth.authenticate()
-    response = requests.get(
-        f"{SERVER_URL}/items", timeout=REQUEST_TIMEOUT
-    )
-    sample_items = response.json()
-    items_in_category = {
-        k: v
-        for k, v in sample_items.items()
-        if v.get("category") == category
-    }
+    favorites, cart_counts = get_catalog_overlay(session.get("user_id"))
+
+    items = repository.get().items
+
+    # The item table is cached per catalog version; favorites, cart
+    # counts and stock are applied over it in the browser
     return render_template(
-        "category_view.html", category=category, items=items_in_category,
+        "category_view.html",
+        category=category,
+        load_items=backend.get_items,
+        catalog_version=items.catalog_version(),
+        favorites=favorites,
+        cart_counts=cart_counts,
+        stock=items.available_stock(),
         username=username,
     )
 
@@ -189,17 +239,10 @@ def cart_view():
         return redirect(url_for("home"))
 
     # Proceed with your existing code
-    items_response = requests.get(
-        f"{SERVER_URL}/items", timeout=REQUEST_TIMEOUT
-    )
-    cart_response = requests.get(
-        f"{SERVER_URL}/cart",
-        json={"user_id": session["user_id"]},
-        timeout=REQUEST_TIMEOUT,
-    )
-
-    sample_items = items_response.json()
-    cart = cart_response.json()
+    sample_items = backend.get_items()
+    cart = backend.get(
+        "/cart", json={"user_id": session["user_id"]}
+    ).json()
 
     subtotal = sum(
         details.get("quantity", 0)
@@ -224,14 +267,13 @@ def cart_view():
 @app.route("/add_to_cart/<item_id>", methods=["POST"])
 def add_to_cart(item_id):
     """Adds an item to the cart."""
-    response = requests.post(
-        f"{SERVER_URL}/cart",
+    response = backend.post(
+        "/cart",
         json={
             "user_id": session["user_id"],
             "item_id": item_id,
             "action": "add",
         },
-        timeout=REQUEST_TIMEOUT,
     )
     return jsonify(response.json())
 
@@ -239,14 +281,13 @@ def add_to_cart(item_id):
 @app.route("/delete_item/<item_id>", methods=["POST"])
 def delete_item(item_id):
     """Deletes an item from the cart."""
-    response = requests.post(
-        f"{SERVER_URL}/cart",
+    response = backend.post(
+        "/cart",
         json={
             "user_id": session["user_id"],
             "item_id": item_id,
             "action": "delete",
         },
-        timeout=REQUEST_TIMEOUT,
     )
     return jsonify(response.json())
 
@@ -254,78 +295,70 @@ def delete_item(item_id):
 @app.route("/update_cart/<item_id>/<action>", methods=["POST"])
 def update_cart(item_id, action):
     """Updates the cart by increasing or decreasing item quantities."""
-    user_id = session["user_id"]
-    if action == "increase":
-        requests.post(
-            f"{SERVER_URL}/cart",
+    if action in ("increase", "decrease"):
+        backend.post(
+            "/cart",
             json={
-                "user_id": user_id,
+                "user_id": session["user_id"],
                 "item_id": item_id,
-                "action": "add",
+                "action": action,
             },
-            timeout=REQUEST_TIMEOUT,
-        )
-    elif action == "decrease":
-        cart_response = requests.get(
-            f"{SERVER_URL}/cart",
-            json={"user_id": user_id},
-            timeout=REQUEST_TIMEOUT,
         )
-        cart = cart_response.json()
-        quantity = cart.get(item_id, {}).get("quantity", 0)
-        if quantity > 1:
-            requests.post(
-                f"{SERVER_URL}/cart",
-                json={
-                    "user_id": user_id,
-                    "item_id": item_id,
-                    "quantity": quantity - 1,
-                    "action": "update",
-                },
-                timeout=REQUEST_TIMEOUT,
-            )
-        elif quantity == 1:
-            requests.post(
-                f"{SERVER_URL}/cart",
-                json={
-                    "user_id": user_id,
-                    "item_id": item_id,
-                    "action": "delete",
-                },
-                timeout=REQUEST_TIMEOUT,
-            )
     return jsonify({"success": True})
 
 
+@app.route("/cart/batch", methods=["POST"])
+def batch_cart():
+    """Applies a burst of cart edits and returns the updated totals."""
+    ops = request.get_json().get("ops", [])
+    response = backend.post(
+        "/cart/batch",
+        json={"user_id": session["user_id"], "ops": ops},
+    )
+    cart = response.json()
+    if response.status_code != 200:
+        return jsonify(cart), response.status_code
+
+    delivery_fee = round(cart["subtotal"] * DELIVERY_FEE_PERCENTAGE, 2)
+    cart["delivery_fee"] = delivery_fee
+    cart["total"] = round(cart["subtotal"] + delivery_fee, 2)
+    return jsonify(cart)
+
+
 @app.route("/order_status/<int:order_id>")
 def order_status(order_id):
     """Returns the timeline status of an order in JSON format."""
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT timeline FROM orders WHERE id = ?", (order_id,)
-    )
-    order = cursor.fetchone()
-    conn.close()
+    orders = repository.get().orders
+    order = orders.get(order_id)
     if not order:
         return jsonify({"error": "Order not found."}), 404
-
-    timeline = json.loads(order["timeline"])
-    return jsonify({"timeline": timeline})
+    events = orders.events(order_id)
+    unchanged = etags.check(order["timestamp"], events)
+    if unchanged:
+        return unchanged
+
+    return jsonify(
+        {
+            "timeline": order_events.project_timeline(events),
+            "durations": order_events.project_durations(
+                events, order["timestamp"]
+            ),
+        }
+    )
 
 
 @app.route("/order_confirmation")
 def order_confirmation():
     """Displays the order confirmation page with items in cart."""
     username = auth.authenticate()
-    response = requests.get(
-        f"{SERVER_URL}/cart",
+    response = backend.get(
+        "/cart",
         json={"user_id": session["user_id"]},
-        timeout=REQUEST_TIMEOUT,
     )
     items_in_cart = len(response.json())
     return render_template(
-        "order_confirmation.html", items_in_cart=items_in_cart,
+        "order_confirmation.html",
+        items_in_cart=items_in_cart,
         username=username,
     )
 
@@ -340,20 +373,13 @@ def place_order():
     if not delivery_location:
         return jsonify({"error": "Delivery location is required"}), 400
 
-    user_conn = get_user_db_connection()
-    user_cursor = user_conn.cursor()
-    user = user_cursor.execute(
-        "SELECT cart FROM users WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    cart = json.loads(user["cart"]) if user and user["cart"] else {}
+    repo = repository.get()
+    cart = repo.carts.get(user_id)
 
     if not cart:
         return jsonify({"error": "Cart is empty"}), 400
 
-    items_response = requests.get(
-        f"{SERVER_URL}/items", timeout=REQUEST_TIMEOUT
-    )
-    items = items_response.json()
+    items = backend.get_items()
 
     for item_id in cart:
         item = items.get(item_id)
@@ -361,103 +387,125 @@ def place_order():
             cart[item_id]["price"] = item["price"]
             cart[item_id]["name"] = item["name"]
 
-    total_items = sum(details["quantity"] for details in cart.values())
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-    # Initialize the timeline
-    timeline = {
-        "Order Accepted": False,
-        "Venmo Payment Recieved": False,
-        "Shopping in U-Store": False,
-        "Checked Out": False,
-        "On Delivery": False,
-        "Delivered": False,
-    }
-
-    cursor.execute(
-        """INSERT INTO orders
-        (status, user_id, total_items, cart, location, timeline)
-        VALUES (?, ?, ?, ?, ?, ?)""",
-        (
-            "placed",
-            user_id,
-            total_items,
-            json.dumps(cart),
-            delivery_location,
-            json.dumps(timeline),
-        ),
-    )
+    _, sold_out = repo.orders.place(user_id, cart, delivery_location)
+    if sold_out is not None:
+        name = cart[sold_out].get("name", "An item")
+        return jsonify({"error": f"{name} is out of stock"}), 409
 
-    user_cursor.execute(
-        "UPDATE users SET cart = '{}' WHERE user_id = ?", (user_id,)
-    )
-    conn.commit()
-    user_conn.commit()
-    conn.close()
-    user_conn.close()
+    repo.carts.clear(user_id)
+    queue_stats_refresh(user_id)
 
     return jsonify({"success": True}), 200
 
 
 @app.route("/deliver")
 def deliver():
-    """Displays available deliveries for deliverers."""
+    """Displays available deliveries for deliverers.
+
+    ?zone= limits available deliveries to one campus zone and ?near=
+    sorts them by distance from the deliverer's zone.
+    """
     username = auth.authenticate()
     user_id = session.get("user_id")
     if not user_id:
         return redirect(url_for("home"))
+    zone_filter = request.args.get("zone", type=int)
+    near = request.args.get("near", type=int)
 
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-
-    # Fetch available deliveries (status 'placed')
-    cursor.execute("SELECT * FROM orders WHERE status = 'placed'")
-    available_deliveries = cursor.fetchall()
+    orders = repository.get().orders
 
-    # Fetch deliverer's own deliveries (status 'claimed' and claimed_by = user_id)
-    cursor.execute(
-        "SELECT * FROM orders WHERE status = 'claimed' AND claimed_by = ?",
-        (user_id,),
+    # Read the feed position first; changes made while the lists are
+    # read are replayed by the board, which applies them idempotently
+    change_seq = orders.latest_change_seq()
+    unchanged = etags.check(
+        change_seq, user_id, username, zone_filter, near
     )
-    my_deliveries = cursor.fetchall()
+    if unchanged:
+        return unchanged
 
-    # Convert SQLite Row objects to dictionaries and calculate earnings
+    # Available deliveries are placed orders; the deliverer's own are
+    # the ones they have claimed
     available_deliveries = [
-        dict(delivery) for delivery in available_deliveries
+        delivery_summary(delivery)
+        for delivery in orders.available(zone_filter)
+    ]
+    my_deliveries = [
+        delivery_summary(delivery)
+        for delivery in orders.claimed_by(user_id)
     ]
-    my_deliveries = [dict(delivery) for delivery in my_deliveries]
 
-    for delivery in available_deliveries + my_deliveries:
-        # Calculate earnings
-        cart = json.loads(delivery["cart"])
-        subtotal = sum(
-            item["quantity"] * item["price"] for item in cart.values()
-        )
-        delivery["earnings"] = round(
-            subtotal * DELIVERY_FEE_PERCENTAGE, 2
+    zones = orders.zones()
+    if near:
+        available_deliveries.sort(
+            key=lambda delivery: locations.zone_distance(
+                zones, near, delivery["zone_id"]
+            )
         )
 
-    conn.close()
-
     return render_template(
         "deliver.html",
         available_deliveries=available_deliveries,
         my_deliveries=my_deliveries,
+        change_seq=change_seq,
+        zones=zones,
+        zone_names={
+            zone_id: zone["name"] for zone_id, zone in zones.items()
+        },
+        zone_filter=zone_filter,
+        near=near,
         username=username,
     )
 
 
+@app.route("/orders/changes")
+def order_changes():
+    """Returns the orders that changed since the client's cursor."""
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    since = request.args.get("since", 0, type=int)
+
+    orders = repository.get().orders
+    if since < orders.removal_seq():
+        # Deleted orders leave nothing in the feed to remove them by,
+        # so the board is loaded again instead
+        return jsonify({"reload": True})
+    rows = orders.changes_since(since, CHANGE_FEED_LIMIT + 1)
+    more = len(rows) > CHANGE_FEED_LIMIT
+    rows = rows[:CHANGE_FEED_LIMIT]
+    seq = rows[-1]["change_seq"] if rows else orders.latest_change_seq()
+
+    changes = []
+    for row in rows:
+        if row["status"] == "placed":
+            board = "available"
+        elif (
+            row["status"] == "claimed" and row["claimed_by"] == user_id
+        ):
+            board = "mine"
+        else:
+            # Orders leaving the caller's boards are only named, so
+            # other users' orders are never shown to them
+            changes.append({"id": row["id"], "board": None})
+            continue
+        summary = delivery_summary(row)
+        change = {field: summary[field] for field in BOARD_FIELDS}
+        change["board"] = board
+        changes.append(change)
+
+    return jsonify({"seq": seq, "changes": changes, "more": more})
+
+
 @app.route("/delivery/<delivery_id>")
 def delivery_details(delivery_id):
     """Displays details of a specific delivery."""
     username = auth.authenticate()
-    response = requests.get(
-        f"{SERVER_URL}/delivery/{delivery_id}", timeout=REQUEST_TIMEOUT
-    )
+    response = backend.get(f"/delivery/{delivery_id}")
     if response.status_code == 200:
         delivery = response.json()
         return render_template(
-            "delivery_details.html", delivery=delivery,
+            "delivery_details.html",
+            delivery=delivery,
             username=username,
         )
     return "Delivery not found", 404
@@ -471,30 +519,25 @@ def accept_delivery(delivery_id):
     if not user_id:
         return redirect(url_for("login"))
 
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-
-    # Update the order status to 'claimed' and set 'claimed_by' to the current user
-    cursor.execute(
-        "UPDATE orders SET status = 'claimed', claimed_by = ? WHERE id = ?",
-        (user_id, delivery_id),
-    )
-    conn.commit()
-    conn.close()
+    # Claim the order only if nobody else has claimed it yet
+    claimed = repository.get().orders.claim(delivery_id, user_id)
+    if not claimed:
+        return "Delivery is no longer available", 409
 
     # Redirect to the delivery timeline
     return redirect(
-        url_for("delivery_timeline", delivery_id=delivery_id, username=username)
+        url_for(
+            "delivery_timeline",
+            delivery_id=delivery_id,
+            username=username,
+        )
     )
 
 
 @app.route("/decline_delivery/<delivery_id>", methods=["POST"])
 def decline_delivery(delivery_id):
     """Declines a delivery by forwarding the request to the backend server."""
-    response = requests.post(
-        f"{SERVER_URL}/decline_delivery/{delivery_id}",
-        timeout=REQUEST_TIMEOUT,
-    )
+    response = backend.post(f"/decline_delivery/{delivery_id}")
     if response.status_code == 200:
         return redirect(url_for("deliver"))
     return "Error declining delivery", response.status_code
@@ -516,25 +559,23 @@ def update_checklist():
             401,
         )
 
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
+    if step not in order_events.STEPS:
+        return (
+            jsonify({"success": False, "error": "Unknown step"}),
+            400,
+        )
 
     # Retrieve the order
-    cursor.execute(
-        "SELECT timeline, claimed_by FROM orders WHERE id = ?",
-        (order_id,),
-    )
-    order = cursor.fetchone()
+    orders = repository.get().orders
+    order = orders.get(order_id)
 
     if not order:
-        conn.close()
         return (
             jsonify({"success": False, "error": "Order not found"}),
             404,
         )
 
     if order["claimed_by"] != user_id:
-        conn.close()
         return (
             jsonify(
                 {
@@ -545,62 +586,16 @@ def update_checklist():
             403,
         )
 
-    # Load the existing timeline
-    timeline = json.loads(order["timeline"])
-
-    # Enforce sequential steps
-    steps = [
-        "Order Accepted",
-        "Venmo Payment Recieved",
-        "Shopping in U-Store",
-        "Checked Out",
-        "On Delivery",
-        "Delivered",
-    ]
-    step_index = steps.index(step)
-
-    # Check if previous steps are completed
-    if checked:
-        if step_index > 0:
-            previous_step = steps[step_index - 1]
-            if not timeline.get(previous_step, False):
-                conn.close()
-                return (
-                    jsonify(
-                        {
-                            "success": False,
-                            "error": f'Previous step "{previous_step}" must be completed first.',
-                        }
-                    ),
-                    400,
-                )
-    else:
-        # Prevent unchecking a step if subsequent steps are completed
-        if any(
-            timeline.get(steps[i], False)
-            for i in range(step_index + 1, len(steps))
-        ):
-            conn.close()
-            return (
-                jsonify(
-                    {
-                        "success": False,
-                        "error": "Cannot uncheck this step because subsequent steps are completed.",
-                    }
-                ),
-                400,
-            )
-
-    # Update the timeline
-    timeline[step] = checked
-
-    # Update the database
-    cursor.execute(
-        "UPDATE orders SET timeline = ? WHERE id = ?",
-        (json.dumps(timeline), order_id),
-    )
-    conn.commit()
-    conn.close()
+    # Delivering an order fulfills it; unchecking "Delivered" reopens it
+    if not orders.record_step(order_id, step, checked, user_id):
+        if checked:
+            previous_step = order_events.STEPS[
+                order_events.STEPS.index(step) - 1
+            ]
+            error = f'Previous step "{previous_step}" must be completed first.'
+        else:
+            error = "Cannot uncheck this step because subsequent steps are completed."
+        return jsonify({"success": False, "error": error}), 400
 
     return jsonify({"success": True}), 200
 
@@ -614,20 +609,30 @@ def profile():
         return redirect(url_for("login"))
 
     user_id = session["user_id"]
-    user_data = get_user_data(user_id)
-    orders = get_user_orders(user_id)
-    stats = calculate_user_stats(orders)
+    repo = repository.get()
+    user_data = repo.users.get(user_id)
+    stats = repo.orders.stats(user_id)
+    # The history changes only with the orders' change sequence; the
+    # statistics are refreshed later by worker.py, so they are part of
+    # the tag themselves
+    unchanged = etags.check(
+        repo.orders.latest_change_seq(), user_data, stats, username
+    )
+    if unchanged:
+        return unchanged
+    orders = repo.orders.history(user_id)
+    if stats is None:
+        stats = calculate_user_stats(orders)
+        queue_stats_refresh(user_id)
 
     orders_with_totals = []
     for order in orders:
-        cart = json.loads(order["cart"])
         subtotal = sum(
             details.get("quantity", 0) * details.get("price", 0)
-            for item_id, details in cart.items()
+            for details in order["cart"].values()
         )
-        order_data = dict(order)
-        order_data["total"] = round(subtotal, 2)
-        orders_with_totals.append(order_data)
+        order["total"] = round(subtotal, 2)
+        orders_with_totals.append(order)
 
     return render_template(
         "profile.html",
@@ -641,53 +646,53 @@ def profile():
 @app.route("/add_favorite/<item_id>", methods=["POST"])
 def add_favorite(item_id):
     """Adds an item to the user's favorites."""
-    user_id = session["user_id"]
-    conn = get_user_db_connection()
-    conn.execute(
-        "INSERT OR IGNORE INTO favorites (user_id, item_id) VALUES (?, ?)",
-        (user_id, item_id),
-    )
-    conn.commit()
-    conn.close()
+    repository.get().favorites.add(session["user_id"], item_id)
     return jsonify({"success": True})
 
 
 @app.route("/remove_favorite/<item_id>", methods=["POST"])
 def remove_favorite(item_id):
     """Removes an item from the user's favorites."""
-    user_id = session["user_id"]
-    conn = get_user_db_connection()
-    conn.execute(
-        "DELETE FROM favorites WHERE user_id = ? AND item_id = ?",
-        (user_id, item_id),
-    )
-    conn.commit()
-    conn.close()
+    repository.get().favorites.remove(session["user_id"], item_id)
     return jsonify({"success": True})
 
 
 # Helper functions
-def get_user_data(user_id):
-    """Fetches user data from the database."""
-    conn = get_user_db_connection()
-    cursor = conn.cursor()
-    user = cursor.execute(
-        "SELECT * FROM users WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    conn.close()
-    return user
-
-
-def get_user_orders(user_id):
-    """Fetches all orders made by the user."""
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-    orders = cursor.execute(
-        "SELECT * FROM orders WHERE user_id = ? ORDER BY timestamp DESC",
-        (user_id,),
-    ).fetchall()
-    conn.close()
-    return orders
+def delivery_summary(order):
+    """Adds the deliverer's earnings to an order and returns it."""
+    subtotal = sum(
+        item["quantity"] * item["price"]
+        for item in order["cart"].values()
+    )
+    order["earnings"] = round(subtotal * DELIVERY_FEE_PERCENTAGE, 2)
+    return order
+
+
+def get_catalog_overlay(user_id):
+    """Returns the user's favorite item ids and cart quantities."""
+    if not user_id:
+        return [], {}
+    repo = repository.get()
+    favorites = repo.favorites.list(user_id)
+    cart = repo.carts.get(user_id) or {}
+    cart_counts = {
+        item_id: details.get("quantity", 0)
+        for item_id, details in cart.items()
+    }
+    return favorites, cart_counts
+
+
+def queue_stats_refresh(user_id):
+    """Asks worker.py to recompute the user's statistics."""
+    try:
+        jobs.enqueue(
+            "refresh_user_stats",
+            {"user_id": user_id},
+            dedupe_key=f"user_stats:{user_id}",
+        )
+    except sqlite3.Error as error:
+        # Stale statistics are better than a failed request
+        print(f"Could not queue stats refresh: {error}")
 
 
 def calculate_user_stats(orders):
@@ -696,10 +701,9 @@ def calculate_user_stats(orders):
     total_items = 0
     for order in orders:
         total_items += order["total_items"]
-        cart = json.loads(order["cart"])
         subtotal = sum(
             details.get("quantity", 0) * details.get("price", 0)
-            for details in cart.values()
+            for details in order["cart"].values()
         )
         total_spent += subtotal
 
@@ -719,37 +723,19 @@ def delivery_timeline(delivery_id):
     if not user_id:
         return redirect(url_for("login"))
 
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
+    repo = repository.get()
 
     # Retrieve the order from the database
-    cursor.execute("SELECT * FROM orders WHERE id = ?", (delivery_id,))
-    order_row = cursor.fetchone()
+    order = repo.orders.get(delivery_id)
+    if not order:
+        return "Order not found.", 404
+    order["timeline"] = repo.orders.timeline(delivery_id)
 
     # Get the shopper's Venmo handle from the database
     shopper_venmo = None
-    if order_row:
-        # Use user database connection here
-        user_conn = get_user_db_connection()
-        user_cursor = user_conn.cursor()
-        user_cursor.execute(
-            "SELECT venmo_handle FROM users WHERE user_id = ?",
-            (order_row["user_id"],),
-        )
-        shopper = user_cursor.fetchone()
-        if shopper:
-            shopper_venmo = shopper["venmo_handle"]
-        user_conn.close()
-
-    conn.close()
-
-    if not order_row:
-        return "Order not found.", 404
-
-    # Convert the order row to a dictionary
-    order = dict(order_row)
-    order["timeline"] = json.loads(order.get("timeline", "{}"))
-    order["cart"] = json.loads(order.get("cart", "{}"))
+    shopper = repo.users.get(order["user_id"])
+    if shopper:
+        shopper_venmo = shopper["venmo_handle"]
 
     return render_template(
         "deliverer_timeline.html",
@@ -762,24 +748,73 @@ def delivery_timeline(delivery_id):
 @app.route("/order_details/<int:order_id>")
 def order_details(order_id):
     """Displays details of a specific order."""
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
+    # Retrieve the order, which may have been archived
+    order = repository.get().orders.get(order_id, include_archived=True)
+    if not order:
+        return "Order not found.", 404
 
-    # Retrieve the order from the database
-    cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
-    order_row = cursor.fetchone()
-    conn.close()
+    return render_template("order_details.html", order=order)
 
-    if not order_row:
-        return "Order not found.", 404
 
-    # Convert the order row to a dictionary
-    order = dict(order_row)
-    order["cart"] = json.loads(order.get("cart", "{}"))
+@app.route("/admin/analytics")
+def admin_analytics():
+    """Displays order volume, revenue and earnings across all orders."""
+    # analytics loads NumPy, which only this page needs
+    import analytics  # pylint: disable=import-outside-toplevel
 
-    return render_template("order_details.html", order=order)
+    username = auth.authenticate()
+    if username not in ADMIN_USERS:
+        return "Forbidden", 403
+
+    repo = repository.get()
+    summary = analytics.summarize(repo.reports.daily_analytics())
+    items = repo.items.all()
+    for entry in summary["top_items"]:
+        item = items.get(str(entry["item_id"]))
+        entry["name"] = (
+            item["name"] if item else f"Item {entry['item_id']}"
+        )
+    names = repo.users.names(
+        [entry["user_id"] for entry in summary["deliverers"]]
+    )
+    for entry in summary["deliverers"]:
+        entry["name"] = names.get(entry["user_id"], "Unknown")
+
+    return render_template(
+        "admin_analytics.html",
+        summary=summary,
+        username=username,
+    )
+
+
+@app.route("/admin/export/<name>")
+def admin_export(name):
+    """Streams an export such as orders.csv or earnings.jsonl.gz.
+
+    since, until and status query parameters filter the orders; see
+    export.py.
+    """
+    username = auth.authenticate()
+    if username not in ADMIN_USERS:
+        return "Forbidden", 403
+
+    try:
+        kind, fmt, compress, filters = export.parse(name, request.args)
+    except export.ExportError as error:
+        return str(error), 400
+    return Response(
+        export.stream(kind, fmt, compress, filters),
+        mimetype=export.mimetype(fmt, compress),
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}"'
+        },
+    )
 
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8000))  # Render assigns a dynamic port
-    app.run(host="0.0.0.0", port=port)        # Listen on all IPs for deployment
+    port = int(
+        os.environ.get("PORT", 8000)
+    )  # Render assigns a dynamic port
+    app.run(
+        host="0.0.0.0", port=port
+    )  # Listen on all IPs for deployment
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+assets.py
+Serves the fingerprinted files built by build_assets.py
+"""
+
+import functools
+import mimetypes
+import os
+
+from flask import (
+    Blueprint,
+    abort,
+    request,
+    send_from_directory,
+    url_for,
+)
+
+from build_assets import (
+    DEPLOYED_MANIFEST,
+    DIST_DIR,
+    MANIFEST,
+    read_manifest,
+)
+
+assets_bp = Blueprint("assets", __name__)
+
+# Fingerprinted names change with their content, so they can be cached
+# for a year and never revalidated
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Precompressed variants in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+@functools.cache
+def load_manifest():
+    """Returns the {name: fingerprinted name} map, read once per process."""
+    return read_manifest(MANIFEST)
+
+
+@functools.cache
+def servable():
+    """Returns the fingerprinted names this process serves.
+
+    Besides its own build's, these are the names of the build last
+    deployed: during a deploy, pages rendered by the old workers ask
+    the new ones for them.
+    """
+    deployed = read_manifest(DEPLOYED_MANIFEST)
+    return set(load_manifest().values()) | set(deployed.values())
+
+
+@assets_bp.app_template_global()
+def asset_url(name):
+    """Returns the URL of a static asset, fingerprinted when built.
+
+    Falls back to the plain static file when build_assets.py has not
+    been run, e.g. during local development.
+    """
+    built = load_manifest().get(name)
+    if built is None:
+        return url_for("static", filename=name)
+    return url_for("assets.serve_asset", filename=built)
+
+
+@assets_bp.route("/assets/<path:filename>")
+def serve_asset(filename):
+    """Serves a built asset, precompressed if the client accepts it."""
+    if filename not in servable():
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0]
+    encoding = None
+    served = filename
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.exists(
+            os.path.join(DIST_DIR, filename + suffix)
+        ):
+            encoding = name
+            served = filename + suffix
+            break
+
+    response = send_from_directory(
+        DIST_DIR,
+        served,
+        mimetype=mimetype,
+        max_age=IMMUTABLE_MAX_AGE,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -1,36 +1,42 @@
 #!/usr/bin/env python
-""" auth.py Authors: See below"""
+"""auth.py Authors: See below"""
 
 # -----------------------------------------------------------------------
 # auth.py
 # Authors: Alex Halderman, Scott Karlin, Brian Kernighan, Bob Dondero
 # -----------------------------------------------------------------------
 
+import functools
 import urllib.request
 import urllib.parse
 import re
-import flask
 import ssl
-from top import app
+import flask
 from flask import (
     Blueprint,
     session,
     redirect,
     render_template,
-    request,
-    abort,
 )
-from database import get_user_db_connection
-import urllib.request
-import urllib.parse
-import re
-import ssl
+import repository
 
 # -----------------------------------------------------------------------
 
 auth_bp = Blueprint("auth", __name__)
 _CAS_URL = "https://fed.princeton.edu/cas/"
-context = ssl._create_unverified_context()
+
+# -----------------------------------------------------------------------
+
+# Return the SSL context used to reach the CAS server. It is made on
+# the first login rather than when the app is imported.
+
+
+@functools.cache
+def ssl_context():
+    """see above for fxn definition"""
+    return ssl._create_unverified_context()
+
+
 # -----------------------------------------------------------------------
 
 # Return url after stripping out the "ticket" parameter that was
@@ -63,7 +69,7 @@ def validate(ticket):
         + urllib.parse.quote(ticket)
     )
     lines = []
-    with urllib.request.urlopen(val_url, context=context) as flo:
+    with urllib.request.urlopen(val_url, context=ssl_context()) as flo:
         lines = flo.readlines()  # Should return 2 lines.
     if len(lines) != 2:
         return None
@@ -114,24 +120,7 @@ def authenticate():
     flask.session["username"] = username
 
     # Now, retrieve or create the user_id in the database
-    conn = get_user_db_connection()
-    cursor = conn.cursor()
-
-    user = cursor.execute(
-        "SELECT user_id FROM users WHERE name = ?", (username,)
-    ).fetchone()
-
-    if user is None:
-        # User does not exist, create a new user
-        cursor.execute(
-            "INSERT INTO users (name) VALUES (?)", (username,)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-    else:
-        user_id = user["user_id"]
-
-    conn.close()
+    user_id = repository.get().users.get_or_create(username)
 
     # Store user_id in the session
     flask.session["user_id"] = user_id
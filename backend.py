@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+backend.py
+Calls from app.py to the data server, guarded by a circuit breaker,
+and the local catalog snapshot served while the data server is down
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+from flask import has_request_context, session
+
+import fragment_cache
+import repository
+from admission import USER_HEADER
+from config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    CATALOG_SNAPSHOT,
+)
+
+SERVER_URL = "http://localhost:5150"
+REQUEST_TIMEOUT = 5
+# Sends requests to the data server; takes the arguments of
+# requests.request. Tests replace it to call server.py in-process.
+transport = requests.request
+
+# (connect, read) timeouts per first path segment. The data server is
+# local, so connecting should be near-instant; reads are sized to what
+# each endpoint does.
+CONNECT_TIMEOUT = 0.5
+ENDPOINT_TIMEOUTS = {
+    "items": (CONNECT_TIMEOUT, 1.5),
+    "cart": (CONNECT_TIMEOUT, 2),
+    "delivery": (CONNECT_TIMEOUT, 2),
+    "decline_delivery": (CONNECT_TIMEOUT, 3),
+}
+
+
+class BackendUnavailable(Exception):
+    """Raised when the data server is down or the breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a failing service until it has had time to recover.
+
+    After failure_threshold consecutive failures the breaker opens and
+    calls fail immediately. Once reset_seconds have passed, one trial
+    call is let through (half-open); its outcome closes or reopens the
+    breaker.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """True while calls are being refused."""
+        return self.opened_at is not None
+
+    def allow(self):
+        """Returns True if a call may be attempted now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running:
+                return False
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        """Closes the breaker after a successful call."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Counts a failed call, opening the breaker at the threshold."""
+        with self._lock:
+            self.failures += 1
+            if (
+                self._trial_running
+                or self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+breaker = CircuitBreaker(
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS
+)
+
+_snapshot = {"version": None, "items": None}
+_snapshot_lock = threading.Lock()
+
+
+def request(method, path, **kwargs):
+    """Sends a request to the data server through the breaker.
+
+    Connection errors, timeouts and 5xx responses count as failures
+    and raise BackendUnavailable; any other response is returned. Any
+    other exception counts as a failure too, so a half-open trial
+    always ends.
+    """
+    if not breaker.allow():
+        raise BackendUnavailable(f"Circuit open, skipped {path}")
+
+    segment = path.strip("/").split("/")[0]
+    timeout = ENDPOINT_TIMEOUTS.get(
+        segment, (CONNECT_TIMEOUT, REQUEST_TIMEOUT)
+    )
+    headers = {**_user_headers(), **kwargs.pop("headers", {})}
+    succeeded = False
+    try:
+        try:
+            response = transport(
+                method,
+                f"{SERVER_URL}{path}",
+                timeout=timeout,
+                headers=headers,
+                **kwargs,
+            )
+        except requests.RequestException as error:
+            raise BackendUnavailable(str(error)) from error
+        if response.status_code >= 500:
+            raise BackendUnavailable(
+                f"{path} returned {response.status_code}"
+            )
+        succeeded = True
+    finally:
+        if succeeded:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+    return response
+
+
+def _user_headers():
+    """Returns headers naming the signed-in user, if there is one.
+
+    The data server rate limits per user, and every call reaches it
+    from this host, so the user has to be passed along.
+    """
+    if has_request_context() and session.get("user_id") is not None:
+        return {USER_HEADER: str(session["user_id"])}
+    return {}
+
+
+def get(path, **kwargs):
+    """GETs path from the data server."""
+    return request("GET", path, **kwargs)
+
+
+def post(path, **kwargs):
+    """POSTs to path on the data server."""
+    return request("POST", path, **kwargs)
+
+
+def get_items():
+    """Returns the catalog, from the snapshot whenever it can.
+
+    The snapshot is reused while the catalog version is unchanged, so
+    most calls never reach the data server. If the data server cannot
+    be reached, the last snapshot is served stale, from memory or from
+    disk after a restart, and fragments rendered from it are not
+    cached. Only a 200 answer replaces the snapshot; a
+    refusal such as a 429 is treated like an outage.
+    """
+    version = repository.get().items.catalog_version()
+    with _snapshot_lock:
+        if _snapshot["version"] == version:
+            return _snapshot["items"]
+
+    try:
+        response = get("/items")
+        if response.status_code != 200:
+            raise BackendUnavailable(
+                f"/items returned {response.status_code}"
+            )
+        items = response.json()
+    except BackendUnavailable:
+        stale = _snapshot["items"] or _load_snapshot_file()
+        if stale is None:
+            raise
+        # Fragments are cached under the current catalog version,
+        # which the stale catalog does not match
+        fragment_cache.uncacheable()
+        return stale
+
+    with _snapshot_lock:
+        _snapshot["version"] = version
+        _snapshot["items"] = items
+    _save_snapshot_file(items)
+    return items
+
+
+def _load_snapshot_file():
+    """Returns the catalog saved on disk, or None."""
+    try:
+        with open(CATALOG_SNAPSHOT, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_snapshot_file(items):
+    """Atomically replaces the catalog saved on disk."""
+    temp_path = f"{CATALOG_SNAPSHOT}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        os.replace(temp_path, CATALOG_SNAPSHOT)
+    except OSError as error:
+        print(f"Could not save catalog snapshot: {error}")
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""
+backup.py
+Online backups of tigercart.sqlite3 and the user database shards,
+taken while the app keeps serving, plus verify and restore
+
+Usage: python backup.py [backup | list | verify [name] | restore <name>]
+
+Copies are made with SQLite's online backup API a few pages at a
+time, sleeping between steps, so writers are never held up for more
+than one small step. Each database is copied as it was at one moment,
+but not all at the same moment, so a snapshot can catch a change that
+spans databases half made:
+
+- The user shards are copied before the main database. Placing an
+  order writes it to the main database and then clears the cart, so
+  a snapshot never has the cleared cart without the order. At worst
+  it has the order and the cart as it was before, and the shopper
+  finds the ordered items in their cart again.
+- A user whose first login comes during the copy may be in the user
+  directory without a row on their shard, which their next login
+  adds; one whose first order also comes during the copy may have
+  that order in the snapshot without being in it at all.
+
+The job queue is not backed up; its jobs are recreated.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import database
+from config import (
+    BACKUP_DIR,
+    BACKUP_KEEP,
+    BACKUP_PAGES_PER_STEP,
+    BACKUP_STEP_SLEEP,
+    USER_SHARDS,
+)
+
+# Restarts caused by concurrent writes before the rest of a copy is
+# taken in one step
+MAX_RESTARTS = 5
+# Copying and compressing should not take CPU from the web workers
+NICENESS = 10
+
+
+class BackupError(Exception):
+    """A snapshot is missing, damaged or does not fit this setup."""
+
+
+def live_databases():
+    """Returns {file name: path} of the databases to back up, in the
+    order they are copied: the user shards, then the main database."""
+    paths = [
+        database.user_shard_path(shard) for shard in range(USER_SHARDS)
+    ] + [database.MAIN_DATABASE]
+    return {os.path.basename(path): path for path in paths}
+
+
+def copy_database(source_path, target_path):
+    """Copies a live database with the online backup API.
+
+    Any connection writing to the source makes SQLite restart the
+    copy; after MAX_RESTARTS the remaining pages are copied in a
+    single step, which holds off writers only for that step.
+    """
+    progress = {"remaining": None, "restarts": 0}
+
+    def pause(_status, remaining, _total):
+        # A restart copies from the first page again, so fewer pages
+        # remaining is the only sign of progress
+        if (
+            progress["remaining"] is not None
+            and remaining >= progress["remaining"]
+        ):
+            progress["restarts"] += 1
+        progress["remaining"] = remaining
+        if progress["restarts"] >= MAX_RESTARTS:
+            raise InterruptedError
+        if remaining:
+            time.sleep(BACKUP_STEP_SLEEP)
+
+    with closing(sqlite3.connect(source_path)) as source:
+        try:
+            with closing(sqlite3.connect(target_path)) as target:
+                source.backup(
+                    target,
+                    pages=BACKUP_PAGES_PER_STEP,
+                    progress=pause,
+                    sleep=BACKUP_STEP_SLEEP,
+                )
+        except InterruptedError:
+            print(
+                f"{os.path.basename(source_path)} kept changing, "
+                "copying it in one step."
+            )
+            with closing(sqlite3.connect(target_path)) as target:
+                source.backup(target)
+    return progress["restarts"]
+
+
+def check_integrity(path):
+    """Raises BackupError unless the database at path is intact."""
+    with closing(sqlite3.connect(path)) as conn:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if result != "ok":
+        raise BackupError(f"{path} failed integrity check: {result}")
+
+
+def compress(source_path, target_path):
+    """Gzips a file; returns the sha256 of the compressed output."""
+    with open(source_path, "rb") as source, gzip.open(
+        target_path, "wb", compresslevel=6
+    ) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return file_sha256(target_path)
+
+
+def file_sha256(path):
+    """Returns the hex sha256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshots():
+    """Returns the names of complete snapshots, oldest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(BACKUP_DIR)
+        if not name.endswith(".partial")
+        and os.path.exists(
+            os.path.join(BACKUP_DIR, name, "manifest.json")
+        )
+    )
+
+
+def backup():
+    """Takes a snapshot of every database; returns its name."""
+    name = time.strftime("%Y%m%d-%H%M%S")
+    snapshot_dir = os.path.join(BACKUP_DIR, name)
+    # Written under a temporary name so a crash never leaves a
+    # snapshot that looks complete
+    partial_dir = f"{snapshot_dir}.partial"
+    os.makedirs(partial_dir)
+
+    manifest = {
+        "created": name,
+        "user_shards": USER_SHARDS,
+        "files": {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        for file_name, path in live_databases().items():
+            start = time.perf_counter()
+            copy_path = os.path.join(scratch, file_name)
+            restarts = copy_database(path, copy_path)
+            check_integrity(copy_path)
+            sha256 = compress(
+                copy_path, os.path.join(partial_dir, f"{file_name}.gz")
+            )
+            manifest["files"][file_name] = {
+                "sha256": sha256,
+                "size": os.path.getsize(copy_path),
+            }
+            print(
+                f"Copied {file_name} in "
+                f"{time.perf_counter() - start:.2f}s "
+                f"({restarts} restarts)."
+            )
+            os.remove(copy_path)
+
+    with open(
+        os.path.join(partial_dir, "manifest.json"),
+        "w",
+        encoding="utf-8",
+    ) as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(partial_dir, snapshot_dir)
+    rotate()
+    return name
+
+
+def rotate():
+    """Deletes all but the BACKUP_KEEP newest snapshots."""
+    for name in snapshots()[:-BACKUP_KEEP]:
+        shutil.rmtree(os.path.join(BACKUP_DIR, name))
+        print(f"Removed old snapshot {name}.")
+
+
+def extract(name, scratch):
+    """Checks and unpacks a snapshot into scratch.
+
+    Returns the manifest and {file name: unpacked path}. Raises
+    BackupError if any file is missing, does not match its checksum
+    or is not intact.
+    """
+    snapshot_dir = os.path.join(BACKUP_DIR, name)
+    try:
+        with open(
+            os.path.join(snapshot_dir, "manifest.json"),
+            encoding="utf-8",
+        ) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as error:
+        raise BackupError(f"No readable snapshot {name}") from error
+
+    paths = {}
+    for file_name, details in manifest["files"].items():
+        packed = os.path.join(snapshot_dir, f"{file_name}.gz")
+        if not os.path.exists(packed):
+            raise BackupError(f"{name} is missing {file_name}")
+        if file_sha256(packed) != details["sha256"]:
+            raise BackupError(f"{name}/{file_name} is corrupted")
+        path = os.path.join(scratch, file_name)
+        with gzip.open(packed, "rb") as source, open(
+            path, "wb"
+        ) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        check_integrity(path)
+        paths[file_name] = path
+    return manifest, paths
+
+
+def verify(name):
+    """Checks that a snapshot can be restored."""
+    with tempfile.TemporaryDirectory() as scratch:
+        _, paths = extract(name, scratch)
+        for file_name, path in paths.items():
+            with closing(sqlite3.connect(path)) as conn:
+                tables = conn.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'"
+                ).fetchone()[0]
+            print(f"{name}/{file_name}: ok, {tables} tables.")
+
+
+def restore(name):
+    """Replaces the live databases with a snapshot.
+
+    Stop app.py, server.py and worker.py first. The snapshot is
+    checked in full before any live database is touched.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        manifest, paths = extract(name, scratch)
+        if manifest["user_shards"] != USER_SHARDS:
+            raise BackupError(
+                f"{name} has {manifest['user_shards']} user shards; "
+                f"set USER_SHARDS={manifest['user_shards']} to restore it"
+            )
+        live = live_databases()
+        for file_name, path in paths.items():
+            # Copied through the backup API so a connection someone
+            # left open sees the restored data, not a swapped file
+            with closing(sqlite3.connect(path)) as source, closing(
+                sqlite3.connect(live[file_name])
+            ) as target:
+                source.backup(target)
+            print(f"Restored {file_name}.")
+
+
+def main():
+    """Runs the command named on the command line."""
+    command = sys.argv[1] if len(sys.argv) > 1 else "backup"
+    names = snapshots()
+    try:
+        if command == "backup":
+            os.nice(NICENESS)
+            print(f"Snapshot {backup()} taken.")
+        elif command == "list":
+            for name in names:
+                print(name)
+        elif command == "verify":
+            for name in sys.argv[2:] or names[-1:]:
+                verify(name)
+        elif command == "restore" and len(sys.argv) == 3:
+            restore(sys.argv[2])
+        else:
+            print(__doc__.split("\n\n")[1])
+            sys.exit(1)
+    except BackupError as error:
+        print(error)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+bench_analytics.py
+Builds a scratch order history spread over many days and computes the
+dashboard aggregates three ways: a row-by-row Python loop over the
+orders, the NumPy engine from scratch, and the NumPy engine again with
+the settled days cached.
+
+Usage: python bench_analytics.py [orders] [days]
+"""
+
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import closing
+
+import analytics
+import database
+import sqlite_repository
+from config import DELIVERY_FEE_PERCENTAGE
+
+
+def aggregate_rows(path):
+    """Computes the daily aggregates one order at a time."""
+    days = {}
+    with closing(sqlite3.connect(path)) as conn:
+        conn.row_factory = sqlite3.Row
+        delivered = dict(
+            conn.execute("""SELECT order_id, MAX(at) FROM order_events
+                WHERE step = 'Delivered' AND checked = 1
+                GROUP BY order_id""").fetchall()
+        )
+        for order in conn.execute("SELECT * FROM all_orders"):
+            day = days.setdefault(
+                order["timestamp"][:10],
+                {
+                    "orders": 0,
+                    "fulfilled": 0,
+                    "revenue": 0.0,
+                    "timed_orders": 0,
+                    "delivery_seconds": 0.0,
+                    "items": defaultdict(lambda: [0, 0.0]),
+                    "deliverers": defaultdict(lambda: [0, 0.0]),
+                },
+            )
+            day["orders"] += 1
+            if order["status"] != "fulfilled":
+                continue
+            subtotal = 0.0
+            for item_id, details in json.loads(order["cart"]).items():
+                line_total = details["quantity"] * details["price"]
+                subtotal += line_total
+                day["items"][item_id][0] += details["quantity"]
+                day["items"][item_id][1] += line_total
+            day["fulfilled"] += 1
+            day["revenue"] += subtotal
+            if order["id"] in delivered:
+                day["timed_orders"] += 1
+                day["delivery_seconds"] += analytics.epoch_seconds(
+                    delivered[order["id"]]
+                ) - analytics.epoch_seconds(order["timestamp"])
+            if order["claimed_by"] is not None:
+                earner = day["deliverers"][str(order["claimed_by"])]
+                earner[0] += 1
+                earner[1] += subtotal * DELIVERY_FEE_PERCENTAGE
+    return days
+
+
+def populate(path, count, days):
+    """Fills the scratch database with count orders over days days."""
+    random.seed(1)
+    now = time.time()
+    orders = []
+    events = []
+    for order_id in range(1, count + 1):
+        placed = now - random.uniform(0, days * 86400)
+        cart = {
+            str(item_id): {
+                "quantity": random.randint(1, 3),
+                "price": round(random.uniform(0.5, 6), 2),
+                "name": f"Item {item_id}",
+            }
+            for item_id in random.sample(range(1, 40), 3)
+        }
+        status = random.choice(
+            ["fulfilled"] * 8 + ["cancelled", "declined"]
+        )
+        orders.append(
+            (
+                order_id,
+                status,
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(placed)),
+                random.randint(1, 500),
+                sum(line["quantity"] for line in cart.values()),
+                json.dumps(cart),
+                "Frist",
+                random.randint(1, 50),
+            )
+        )
+        if status == "fulfilled":
+            delivered = placed + random.uniform(600, 3600)
+            events.append(
+                (
+                    order_id,
+                    time.strftime(
+                        "%Y-%m-%d %H:%M:%S", time.gmtime(delivered)
+                    ),
+                )
+            )
+
+    with closing(sqlite3.connect(path)) as conn:
+        conn.executemany(
+            """INSERT INTO orders_archive
+            (id, status, timestamp, user_id, total_items, cart,
+            location, claimed_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            orders,
+        )
+        conn.executemany(
+            """INSERT INTO order_events (order_id, step, checked, at)
+            VALUES (?, 'Delivered', 1, ?)""",
+            events,
+        )
+        conn.commit()
+
+
+def timed(run):
+    """Returns (seconds, result) of run()."""
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+
+def main():
+    """Runs the benchmark and prints a summary."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "tigercart.sqlite3")
+        database.MAIN_DATABASE = path
+        database.init_main_db()
+        populate(path, count, days)
+        reports = sqlite_repository.SQLiteReports()
+
+        print(f"{count} orders over {days} days")
+        row_time, by_rows = timed(lambda: aggregate_rows(path))
+        print(f"row by row     {row_time * 1000:8.1f} ms")
+        cold_time, by_arrays = timed(reports.daily_analytics)
+        print(f"numpy, cold    {cold_time * 1000:8.1f} ms")
+        warm_time, cached = timed(reports.daily_analytics)
+        print(f"numpy, cached  {warm_time * 1000:8.1f} ms")
+
+    mismatched = [
+        day
+        for day, aggregates in by_arrays.items()
+        if abs(aggregates["revenue"] - by_rows[day]["revenue"]) > 0.01
+        or aggregates["orders"] != by_rows[day]["orders"]
+        or cached[day] != aggregates
+    ]
+    if mismatched or by_arrays.keys() != by_rows.keys():
+        print(f"MISMATCHED days: {mismatched[:5]}")
+        sys.exit(1)
+    print(
+        f"numpy takes {cold_time / row_time:.0%} of the row-by-row "
+        f"time, {warm_time / row_time:.0%} once days are cached"
+    )
+
+
+if __name__ == "__main__":
+    main()
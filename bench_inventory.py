@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+bench_inventory.py
+Many buyers racing for one scarce item, against a scratch copy of
+the main database. Checks that stock never oversells and reports
+throughput and checkout latency.
+
+Usage: python bench_inventory.py [buyers] [orders_per_buyer] [stock]
+"""
+
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import database
+import inventory
+
+HOT_ITEM = "1"
+
+
+def _checkout(args):
+    """Places orders_per_buyer one-item orders; returns their latencies."""
+    path, buyer, orders_per_buyer = args
+    database.MAIN_DATABASE = path
+    cart = {HOT_ITEM: {"quantity": 1}}
+    results = []
+    for _ in range(orders_per_buyer):
+        start = time.perf_counter()
+        conn = database.get_main_db_connection()
+        conn.execute("PRAGMA busy_timeout = 10000")
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if inventory.take_stock(cursor, cart) is not None:
+            conn.rollback()
+            sold = False
+        else:
+            cursor.execute(
+                """INSERT INTO orders (status, user_id, total_items, cart)
+                VALUES ('placed', ?, 1, '{}')""",
+                (buyer,),
+            )
+            inventory.record_reservations(
+                cursor, cursor.lastrowid, cart
+            )
+            conn.commit()
+            sold = True
+        conn.close()
+        results.append((time.perf_counter() - start, sold))
+    return results
+
+
+def run(buyers, orders_per_buyer, stock):
+    """Has buyers check out HOT_ITEM in parallel on a new database.
+
+    Returns the (latency, sold) results of every checkout, the seconds
+    they took, and the stock left and reserved afterwards.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "tigercart.sqlite3")
+        database.MAIN_DATABASE = path
+        database.init_main_db()
+        database.populate_items()
+        conn = database.get_main_db_connection()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(
+            "UPDATE items SET stock = ? WHERE id = ?", (stock, HOT_ITEM)
+        )
+        conn.commit()
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(buyers) as pool:
+            runs = pool.map(
+                _checkout,
+                [
+                    (path, buyer, orders_per_buyer)
+                    for buyer in range(buyers)
+                ],
+            )
+        elapsed = time.perf_counter() - start
+
+        left = conn.execute(
+            "SELECT stock FROM items WHERE id = ?", (HOT_ITEM,)
+        ).fetchone()["stock"]
+        reserved = conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations"
+        ).fetchone()[0]
+        conn.close()
+
+    results = [result for run in runs for result in run]
+    return results, elapsed, left, reserved
+
+
+def main():
+    """Runs the benchmark and prints a summary."""
+    buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    orders_per_buyer = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    stock = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+    results, elapsed, left, reserved = run(
+        buyers, orders_per_buyer, stock
+    )
+    latencies = sorted(latency for latency, _ in results)
+    sold = sum(1 for _, ok in results if ok)
+    attempts = len(results)
+
+    print(f"{buyers} buyers, {attempts} checkouts, {stock} in stock")
+    print(f"sold {sold}, refused {attempts - sold}, {left} left")
+    print(f"throughput {attempts / elapsed:.0f} checkouts/s")
+    print(
+        f"latency p50 {statistics.median(latencies) * 1000:.2f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms"
+    )
+    if left < 0 or sold != min(stock, attempts) or reserved != sold:
+        print("OVERSOLD: stock and reservations disagree")
+        sys.exit(1)
+    print("no oversell")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+bench_records.py
+Lists thousands of orders from a scratch copy of the main database,
+once as dicts built from sqlite3.Row and once as Order records, and
+reports the time and memory each takes.
+
+Usage: python bench_records.py [orders] [items_per_order]
+"""
+
+import gc
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import closing
+
+import database
+from records import Order
+
+SELECT_ORDERS = f"SELECT {', '.join(Order.COLUMNS)} FROM orders"
+
+
+def list_as_dicts(path):
+    """Lists orders the way the routes did before records."""
+    with closing(sqlite3.connect(path)) as conn:
+        conn.row_factory = sqlite3.Row
+        orders = []
+        for row in conn.execute(SELECT_ORDERS):
+            order = dict(row)
+            order["cart"] = json.loads(order["cart"] or "{}")
+            orders.append(order)
+        return orders
+
+
+def list_as_records(path):
+    """Lists orders as Order records."""
+    with closing(sqlite3.connect(path)) as conn:
+        conn.row_factory = Order.from_row
+        return conn.execute(SELECT_ORDERS).fetchall()
+
+
+def measure(list_orders, path, rounds=5):
+    """Returns (best seconds, bytes held by the result) of list_orders."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        list_orders(path)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    orders = list_orders(path)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del orders
+    return best, held
+
+
+def main():
+    """Runs the benchmark and prints a summary."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    items_per_order = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    cart = json.dumps(
+        {
+            str(item_id): {
+                "quantity": 1,
+                "price": 1.09,
+                "name": f"Item {item_id}",
+            }
+            for item_id in range(1, items_per_order + 1)
+        }
+    )
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "tigercart.sqlite3")
+        database.MAIN_DATABASE = path
+        database.init_main_db()
+        with closing(sqlite3.connect(path)) as conn:
+            conn.executemany(
+                """INSERT INTO orders
+                (status, user_id, total_items, cart, location)
+                VALUES ('placed', ?, ?, ?, 'Frist')""",
+                [
+                    (order % 50 + 1, items_per_order, cart)
+                    for order in range(count)
+                ],
+            )
+            conn.commit()
+
+        print(f"{count} orders, {items_per_order} items each")
+        results = {}
+        for name, list_orders in (
+            ("dicts", list_as_dicts),
+            ("records", list_as_records),
+        ):
+            seconds, held = measure(list_orders, path)
+            results[name] = (seconds, held)
+            print(
+                f"{name:8} {seconds * 1000:8.1f} ms "
+                f"{held / 1024:10.0f} KiB"
+            )
+
+    (dict_time, dict_bytes), (record_time, record_bytes) = (
+        results["dicts"],
+        results["records"],
+    )
+    print(
+        f"records take {record_time / dict_time:.0%} of the time and "
+        f"{record_bytes / dict_bytes:.0%} of the memory"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+bench_startup.py
+Reports how long importing app.py and server.py takes and which of
+their imports cost the most, then starts each through serve.py with
+and without warm-up and reports how long it takes to answer at all
+and how slow its first requests are compared with the ones after them.
+
+Usage: python bench_startup.py [workers] [requests]
+
+Both services use the databases in this directory; the requests made,
+/items and the home page's redirect to CAS, change nothing.
+"""
+
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Scratch addresses and the request made to each service
+SERVICES = {
+    "app": (5998, "/"),
+    "server": (5999, "/items"),
+}
+# Imports listed per module in the import profile
+SLOWEST_IMPORTS = 5
+
+
+def import_profile(module):
+    """Returns (seconds, slowest) for importing module in a fresh
+    interpreter; slowest lists (seconds, name) of its direct imports,
+    each including what it imports in turn."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    direct = []
+    for line in output.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        _, cumulative, name = fields
+        seconds = int(cumulative) / 1e6
+        # Nesting is shown by two spaces per level, and a module is
+        # listed after everything it imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            direct.append((seconds, name.strip()))
+        elif depth == 0 and name.strip() == module:
+            return (
+                seconds,
+                sorted(direct, reverse=True)[:SLOWEST_IMPORTS],
+            )
+        elif depth == 0:
+            direct = []
+    raise RuntimeError(f"{module} was not imported")
+
+
+def request(port, path):
+    """Returns the seconds a GET took, or None if nothing answered."""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request("GET", path)
+        conn.getresponse().read()
+    except OSError:
+        return None
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def run(service, warm, workers, requests):
+    """Returns (seconds until the first answer, request latencies)."""
+    port, path = SERVICES[service]
+    env = dict(
+        os.environ,
+        WORKER_WARMUP="1" if warm else "0",
+        **{
+            f"{service.upper()}_BIND": f"127.0.0.1:{port}",
+            f"{service.upper()}_WORKERS": str(workers),
+        },
+    )
+    start = time.perf_counter()
+    with subprocess.Popen(
+        [sys.executable, "serve.py", service],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as process:
+        try:
+            while (first := request(port, path)) is None:
+                if time.perf_counter() - start > 30:
+                    raise TimeoutError(f"{service} did not start")
+                time.sleep(0.01)
+            ready = time.perf_counter() - start
+            latencies = [first] + [
+                request(port, path) for _ in range(requests - 1)
+            ]
+        finally:
+            process.terminate()
+    return ready, latencies
+
+
+def main():
+    """Runs the benchmark and prints a summary."""
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    for service in SERVICES:
+        seconds, slowest = import_profile(service)
+        print(
+            f"import {service:6} {seconds * 1000:6.1f} ms  "
+            + ", ".join(
+                f"{name} {took * 1000:.1f}" for took, name in slowest
+            )
+        )
+
+    print(f"{workers} workers, first {requests} requests after start")
+    for service in SERVICES:
+        for warm in (False, True):
+            ready, latencies = run(service, warm, workers, requests)
+            # Each worker's first request is among the first few
+            print(
+                f"{service:6} warm-up {'on ' if warm else 'off'} "
+                f"ready {ready:5.2f}s  "
+                f"slowest {max(latencies) * 1000:6.1f} ms  "
+                f"median {statistics.median(latencies) * 1000:5.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+bench_user_shards.py
+Many shoppers editing their carts at once, against scratch user
+databases split over 1 to N shards. Reports cart write throughput
+for each shard count.
+
+Usage: python bench_user_shards.py [max_shards] [shoppers] [writes]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import database
+import sqlite_repository
+
+
+def _add_to_cart(cart):
+    """Adds one more of item 1 to cart."""
+    details = cart.setdefault("1", {"quantity": 0})
+    details["quantity"] += 1
+
+
+def _shop(args):
+    """Makes writes cart updates for one shopper."""
+    path, shards, user_id, writes = args
+    database.USER_DATABASE = path
+    database.USER_SHARDS = shards
+    carts = sqlite_repository.SQLiteCarts()
+    for _ in range(writes):
+        carts.update(user_id, _add_to_cart)
+
+
+def run(shards, shoppers, writes):
+    """Returns cart writes per second with the given number of shards."""
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "users.sqlite3")
+        database.USER_DATABASE = path
+        database.USER_SHARDS = shards
+        database.init_user_db(shards)
+        for user_id in range(1, shoppers + 1):
+            conn = database.get_user_db_connection(user_id)
+            conn.execute(
+                "INSERT INTO users (user_id, name) VALUES (?, ?)",
+                (user_id, f"shopper{user_id}"),
+            )
+            conn.commit()
+            conn.close()
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(shoppers) as pool:
+            pool.map(
+                _shop,
+                [
+                    (path, shards, user_id, writes)
+                    for user_id in range(1, shoppers + 1)
+                ],
+            )
+        elapsed = time.perf_counter() - start
+
+        lost = 0
+        for user_id in range(1, shoppers + 1):
+            cart = sqlite_repository.SQLiteCarts().get(user_id)
+            lost += writes - cart["1"]["quantity"]
+    return shoppers * writes / elapsed, lost
+
+
+def main():
+    """Runs the benchmark and prints a summary."""
+    max_shards = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    shoppers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    writes = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    print(f"{shoppers} shoppers, {writes} cart writes each")
+    for shards in range(1, max_shards + 1):
+        throughput, lost = run(shards, shoppers, writes)
+        print(f"{shards} shards: {throughput:.0f} cart writes/s")
+        if lost:
+            print(f"LOST {lost} cart writes")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
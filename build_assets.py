@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+build_assets.py
+Minifies, fingerprints and precompresses the files in static/
+
+Usage: python build_assets.py [build | prune]
+
+A build leaves the files of earlier builds in place, since the
+running workers keep serving pages that refer to them until a deploy
+replaces those workers. Once the deploy has succeeded, prune removes
+every built file the new build does not use.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always built
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST = os.path.join(DIST_DIR, "manifest.json")
+# The manifest of the build last deployed, whose files the running
+# workers serve until the next deploy succeeds
+DEPLOYED_MANIFEST = os.path.join(DIST_DIR, "deployed.json")
+
+ASSETS = ["style.css", "script.js"]
+
+
+def minify_css(source):
+    """Strips comments and collapses whitespace in a stylesheet."""
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};:,>])\s*", r"\1", source)
+    return source.replace(";}", "}").strip()
+
+
+def minify_js(source):
+    """Drops comment-only lines, indentation and blank lines.
+
+    Statements are left untouched, so the output never changes how the
+    script parses.
+    """
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def fingerprint(name, content):
+    """Returns name with a content hash inserted before the extension."""
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"{stem}.{digest}{ext}"
+
+
+def read_manifest(path):
+    """Returns the {name: fingerprinted name} map saved at path."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_file(path, content):
+    """Writes content to path, replacing any earlier file at once.
+
+    Running workers may be serving the file being replaced, so they
+    must never see it half written.
+    """
+    with open(path + ".tmp", "wb") as f:
+        f.write(content)
+    os.replace(path + ".tmp", path)
+
+
+def write_manifest(path, manifest):
+    """Saves manifest at path."""
+    write_file(path, json.dumps(manifest, indent=2).encode("utf-8"))
+
+
+def build():
+    """Builds every asset into static/dist and writes the manifest."""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    for name in ASSETS:
+        with open(
+            os.path.join(STATIC_DIR, name), encoding="utf-8"
+        ) as f:
+            source = f.read()
+        minify = MINIFIERS[os.path.splitext(name)[1]]
+        content = minify(source).encode("utf-8")
+        built = fingerprint(name, content)
+        path = os.path.join(DIST_DIR, built)
+
+        write_file(path, content)
+        write_file(
+            path + ".gz",
+            gzip.compress(content, compresslevel=9, mtime=0),
+        )
+        if brotli is not None:
+            write_file(path + ".br", brotli.compress(content))
+
+        manifest[name] = built
+        print(
+            f"{name}: {len(source)} -> {len(content)} bytes as {built}"
+        )
+
+    write_manifest(MANIFEST, manifest)
+
+
+def prune():
+    """Removes the built files the current build does not use.
+
+    Run it only once the current build is deployed; it becomes the
+    build the running workers serve.
+    """
+    manifest = read_manifest(MANIFEST)
+    keep = set(manifest.values())
+    manifests = {
+        os.path.basename(MANIFEST),
+        os.path.basename(DEPLOYED_MANIFEST),
+    }
+    for name in os.listdir(DIST_DIR):
+        built = name.removesuffix(".gz").removesuffix(".br")
+        if name not in manifests and built not in keep:
+            os.remove(os.path.join(DIST_DIR, name))
+    write_manifest(DEPLOYED_MANIFEST, manifest)
+
+
+def main():
+    """Runs the command named on the command line."""
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        build()
+    elif command == "prune":
+        prune()
+    else:
+        print(__doc__.split("\n\n")[1])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,10 @@ Common files
 import os
 import secrets
 
-SECRET_KEY = secrets.token_hex(32)
+# Signs session cookies. Set it in production, so sessions survive
+# restarts and are accepted by both fleets while a deploy runs them side
+# by side; a random key is drawn per master when it is not set
+SECRET_KEY = os.getenv("SECRET_KEY") or secrets.token_hex(32)
 
 import os
 
@@ -19,6 +22,133 @@ CAS_LOGOUT_ROUTE = f"{CAS_SERVER}/logout"
 CAS_VALIDATE_ROUTE = f"{CAS_SERVER}/validate"
 CAS_SERVICE = f"{BASE_URL}/auth/cas"
 
+# Share of an order's subtotal paid to its deliverer
+DELIVERY_FEE_PERCENTAGE = 0.1
+# CAS usernames allowed to see the admin dashboard, comma separated
+ADMIN_USERS = frozenset(
+    name.strip()
+    for name in os.getenv("ADMIN_USERS", "").split(",")
+    if name.strip()
+)
+
+# Unclaimed orders older than this are cancelled by the sweeper
+ORDER_EXPIRY_MINUTES = int(os.getenv("ORDER_EXPIRY_MINUTES", "120"))
+# Seconds between sweeps run by worker.py; 0 disables them
+ORDER_SWEEP_INTERVAL = int(os.getenv("ORDER_SWEEP_INTERVAL", "300"))
+
+# Maximum number of rendered catalog fragments kept per worker
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "256"))
+# Responses smaller than this many bytes are sent uncompressed, and the
+# gzip level (1 to 9) the others are compressed at
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+# Rate limit and in-flight state shared by all workers of both services
+ADMISSION_DATABASE = os.getenv(
+    "ADMISSION_DATABASE",
+    os.path.join(os.path.dirname(__file__), "admission.sqlite3"),
+)
+# Requests allowed in flight per service before load shedding starts;
+# 0 allows one per worker thread serve.py runs for the service
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "0"))
+
+# Consecutive data server failures before app.py stops calling it, and
+# seconds before a trial call is let through again
+BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv("BREAKER_FAILURE_THRESHOLD", "3")
+)
+BREAKER_RESET_SECONDS = int(os.getenv("BREAKER_RESET_SECONDS", "5"))
+# Where the routes keep their data: "sqlite" or "memory"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+# The main database and shard 0 of the user database, which also holds
+# the user directory. Either may be a file: URI, such as
+# file:tigercart?mode=memory&cache=shared for an in-memory database
+# shared by every connection in the process
+MAIN_DATABASE = os.getenv(
+    "MAIN_DATABASE",
+    os.path.join(os.path.dirname(__file__), "tigercart.sqlite3"),
+)
+USER_DATABASE = os.getenv(
+    "USER_DATABASE",
+    os.path.join(os.path.dirname(__file__), "users.sqlite3"),
+)
+# Number of users.sqlite3 shards carts and favorites are spread over;
+# move existing users with reshard_users.py before changing it
+USER_SHARDS = int(os.getenv("USER_SHARDS", "1"))
+# Maximum number of user profiles each worker keeps cached
+USER_PROFILE_CACHE_SIZE = int(
+    os.getenv("USER_PROFILE_CACHE_SIZE", "1024")
+)
+
+# Addresses serve.py binds app.py and server.py to
+APP_BIND = os.getenv("APP_BIND", "127.0.0.1:8000")
+SERVER_BIND = os.getenv("SERVER_BIND", "127.0.0.1:5150")
+# Gunicorn worker class of each service, "sync" or "gthread"; app.py
+# spends most of a request waiting on server.py, so it gets threads
+APP_WORKER_CLASS = os.getenv("APP_WORKER_CLASS", "gthread")
+SERVER_WORKER_CLASS = os.getenv("SERVER_WORKER_CLASS", "sync")
+# Workers per service; 0 sizes them from the CPU count
+APP_WORKERS = int(os.getenv("APP_WORKERS", "0"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+# Threads in each gthread worker
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+# Requests a worker serves before it is replaced, give or take up to
+# the jitter, so slow leaks cannot build up
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "2000"))
+WORKER_MAX_REQUESTS_JITTER = int(
+    os.getenv("WORKER_MAX_REQUESTS_JITTER", "200")
+)
+# Whether serve.py warms each worker up before it takes traffic
+WORKER_WARMUP = os.getenv("WORKER_WARMUP", "true").lower() in (
+    "true",
+    "1",
+    "t",
+)
+# Where serve.py keeps each service's pidfile and control socket
+RUN_DIR = os.getenv(
+    "RUN_DIR", os.path.join(os.path.dirname(__file__), "run")
+)
+# Seconds deploy.py waits for new workers to report ready before it
+# rolls back to the running ones
+DEPLOY_READY_TIMEOUT = float(os.getenv("DEPLOY_READY_TIMEOUT", "60"))
+# Where app.py keeps compiled templates between restarts
+TEMPLATE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR", os.path.join(RUN_DIR, "templates")
+)
+
+# Background job queue shared by the app and worker.py
+JOBS_DATABASE = os.getenv(
+    "JOBS_DATABASE",
+    os.path.join(os.path.dirname(__file__), "jobs.sqlite3"),
+)
+# Seconds a claimed job stays hidden from other workers
+JOB_VISIBILITY_SECONDS = int(os.getenv("JOB_VISIBILITY_SECONDS", "60"))
+# Seconds an idle worker waits before polling the queue again
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+# Finished orders older than this are moved to orders_archive
+ORDER_ARCHIVE_DAYS = int(os.getenv("ORDER_ARCHIVE_DAYS", "30"))
+# Orders read from the database per step of a streamed export
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+# Rows maintenance.py changes per transaction, and seconds it pauses
+# between transactions so live requests get the write lock
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "200"))
+MAINTENANCE_PAUSE = float(os.getenv("MAINTENANCE_PAUSE", "0.05"))
+# Where backup.py keeps compressed snapshots, and how many it keeps
+BACKUP_DIR = os.getenv(
+    "BACKUP_DIR", os.path.join(os.path.dirname(__file__), "backups")
+)
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+# Pages copied per backup step and seconds slept between steps; each
+# step briefly holds off writers to the database being copied
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.005"))
+# Last catalog fetched from the data server, served while it is down
+CATALOG_SNAPSHOT = os.getenv(
+    "CATALOG_SNAPSHOT",
+    os.path.join(os.path.dirname(__file__), "catalog_snapshot.json"),
+)
+
+
 def get_debug_mode():
     """Determine debug mode from environment variable."""
     return os.getenv("FLASK_DEBUG", "False").lower() in (
@@ -1,88 +1,605 @@
 #!/usr/bin/env python
 """
 database.py
-Populates tigercart.sqlite3 and users.sqlite3
+Populates tigercart.sqlite3 and the user database shards
+
+Usage: python database.py [contract]
 """
 
+import bisect
+import functools
+import hashlib
 import sqlite3
+import sys
 
 import os
 
-MAIN_DATABASE = os.path.join(os.path.dirname(__file__), "tigercart.sqlite3")
-USER_DATABASE = os.path.join(os.path.dirname(__file__), "users.sqlite3")
+from config import MAIN_DATABASE, USER_DATABASE, USER_SHARDS
+from locations import canonical
+
+# Points per shard on the hash ring; more points spread users evenly
+SHARD_RING_POINTS = 64
+
+# Seed data, also loaded by the in-memory repository
+SAMPLE_ITEMS = {
+    "1": {
+        "name": "Coke",
+        "price": 1.09,
+        "category": "drinks",
+        "stock": 48,
+    },
+    "2": {
+        "name": "Diet Coke",
+        "price": 1.29,
+        "category": "drinks",
+        "stock": 24,
+    },
+    "3": {
+        "name": "Tropicana Orange Juice",
+        "price": 0.89,
+        "category": "drinks",
+        "stock": 24,
+    },
+    "4": {
+        "name": "Lay's Potato Chips",
+        "price": 1.59,
+        "category": "food",
+        "stock": 30,
+    },
+    "5": {
+        "name": "Snickers Bar",
+        "price": 0.99,
+        "category": "food",
+        "stock": 36,
+    },
+    "6": {
+        "name": "Notebook",
+        "price": 2.49,
+        "category": "other",
+        "stock": 12,
+    },
+}
+
+CAMPUS_ZONES = [
+    (1, "Central Campus", 0.0, 0.0),
+    (2, "Nassau Street", -0.2, 0.35),
+    (3, "South Campus", 0.05, -0.45),
+    (4, "Southwest Campus", -0.6, -0.55),
+    (5, "East Campus", 0.7, 0.1),
+    (6, "Graduate College", -0.9, -0.2),
+]
+CAMPUS_BUILDINGS = [
+    (1, "Frist Campus Center", 1, ["frist", "fcc"]),
+    (2, "Firestone Library", 1, ["firestone"]),
+    (3, "Nassau Hall", 1, []),
+    (4, "McCosh Hall", 1, ["mccosh"]),
+    (5, "Lewis Library", 1, ["lewis"]),
+    (6, "Rockefeller College", 2, ["rockefeller", "rocky"]),
+    (7, "Mathey College", 2, ["mathey"]),
+    (8, "Holder Hall", 2, ["holder"]),
+    (9, "Whitman College", 3, ["whitman"]),
+    (10, "Butler College", 3, ["butler"]),
+    (11, "First College", 3, ["wilson", "wilson college"]),
+    (12, "Dillon Gym", 3, ["dillon"]),
+    (13, "Spelman Halls", 3, ["spelman"]),
+    (14, "Forbes College", 4, ["forbes"]),
+    (15, "Yeh College", 4, ["yeh"]),
+    (16, "New College West", 4, ["ncw", "nc west"]),
+    (17, "Lakeside Apartments", 4, ["lakeside"]),
+    (18, "Engineering Quadrangle", 5, ["equad", "e quad"]),
+    (19, "Friend Center", 5, ["friend"]),
+    (20, "Graduate College", 6, ["grad college", "gc"]),
+]
+
+SAMPLE_USERS = [
+    (1, "Connor"),
+    (2, "Jacob"),
+    (3, "Alex"),
+    (4, "Matt"),
+    (5, "Okezie"),
+]
+
+
+# One connection to each in-memory database, which lasts only as long
+# as a connection to it is open
+_memory_databases = {}
+
+
+def connect(path):
+    """Opens a database file or file: URI.
+
+    An in-memory database opened through a URI with cache=shared is
+    kept for the rest of the process.
+    """
+    if not path.startswith("file:"):
+        return sqlite3.connect(path)
+    conn = sqlite3.connect(path, uri=True)
+    in_memory = ":memory:" in path or "mode=memory" in path
+    if in_memory and path not in _memory_databases:
+        _memory_databases[path] = sqlite3.connect(
+            path, uri=True, check_same_thread=False
+        )
+    return conn
 
 
+def close_memory_database(path):
+    """Lets an in-memory database go once no one else has it open."""
+    conn = _memory_databases.pop(path, None)
+    if conn is not None:
+        conn.close()
+
 
 def get_main_db_connection():
     """Establishes and returns a connection to the main database."""
-    conn = sqlite3.connect(MAIN_DATABASE)
+    conn = connect(MAIN_DATABASE)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def get_user_db_connection():
-    """Establishes and returns a connection to the user database."""
-    conn = sqlite3.connect(USER_DATABASE)
+def _ring_hash(key):
+    """Returns a stable 64-bit hash of key for the shard ring."""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+@functools.lru_cache(maxsize=None)
+def _shard_ring(shards):
+    """Returns the sorted ring points and the shard owning each."""
+    ring = sorted(
+        (_ring_hash(f"shard-{shard}:{point}"), shard)
+        for shard in range(shards)
+        for point in range(SHARD_RING_POINTS)
+    )
+    return [point for point, _ in ring], [shard for _, shard in ring]
+
+
+def user_shard(user_id, shards=None):
+    """Returns the number of the shard holding a user's data.
+
+    Users are placed on a consistent hash ring, so going from N to N+1
+    shards only moves the users the new shard takes over.
+    """
+    points, owners = _shard_ring(shards or USER_SHARDS)
+    index = bisect.bisect(points, _ring_hash(str(int(user_id))))
+    return owners[index % len(owners)]
+
+
+def user_shard_path(shard):
+    """Returns the file or URI of a user database shard."""
+    if shard == 0:
+        return USER_DATABASE
+    path, query = USER_DATABASE, ""
+    if USER_DATABASE.startswith("file:"):
+        path, _, query = USER_DATABASE.partition("?")
+    base, extension = os.path.splitext(path)
+    return f"{base}-{shard}{extension}" + (f"?{query}" if query else "")
+
+
+def group_by_shard(user_ids, shards=None):
+    """Returns {shard: [user_id, ...]} for a batch of users."""
+    groups = {}
+    for user_id in user_ids:
+        shard = user_shard(user_id, shards)
+        groups.setdefault(shard, []).append(user_id)
+    return groups
+
+
+def get_user_shard_connection(shard):
+    """Establishes and returns a connection to one user database shard."""
+    conn = connect(user_shard_path(shard))
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_user_db_connection(user_id):
+    """Establishes and returns a connection to the shard holding user_id."""
+    return get_user_shard_connection(user_shard(user_id))
+
+
+def get_user_directory_connection():
+    """Establishes and returns a connection to the user directory.
+
+    The directory maps names to user ids across all shards and hands
+    out new ids; it only takes writes on a user's first login.
+    """
+    return get_user_shard_connection(0)
+
+
+def add_column_if_missing(cursor, table, column, definition):
+    """Adds a column to an existing table unless it is already there."""
+    columns = [
+        row[1] for row in cursor.execute(f"PRAGMA table_info({table})")
+    ]
+    if column not in columns:
+        cursor.execute(
+            f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+        )
+
+
+# Orders leave the table when they are archived, so ids come from
+# AUTOINCREMENT: without it SQLite would hand the highest archived id
+# out again
+ORDERS_TABLE = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT CHECK(status IN
+            ('placed', 'claimed', 'fulfilled', 'declined', 'cancelled')),
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            user_id INTEGER,
+            total_items INTEGER,
+            cart TEXT,
+            location TEXT,
+            timeline TEXT DEFAULT '{{}}',
+            claimed_by INTEGER,
+            change_seq INTEGER,
+            building_id INTEGER,
+            zone_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """
+
+
+def make_order_ids_monotonic(cursor):
+    """Rebuilds an orders table created without AUTOINCREMENT.
+
+    The rebuilt table keeps every column, and the indexes and triggers
+    init_main_db creates on it are made again after this runs.
+    """
+    sql = cursor.execute("""SELECT sql FROM sqlite_master
+        WHERE type = 'table' AND name = 'orders'""").fetchone()[0]
+    if "AUTOINCREMENT" in sql.upper():
+        return
+    columns = ", ".join(
+        row[1] for row in cursor.execute("PRAGMA table_info(orders)")
+    )
+    # Renaming checks every view, and all_orders is made again anyway
+    cursor.execute("DROP VIEW IF EXISTS all_orders")
+    cursor.execute(ORDERS_TABLE.format(name="orders_rebuilt"))
+    cursor.execute(f"""INSERT INTO orders_rebuilt ({columns})
+        SELECT {columns} FROM orders""")
+    cursor.execute("DROP TABLE orders")
+    cursor.execute("ALTER TABLE orders_rebuilt RENAME TO orders")
+    print("Rebuilt orders with AUTOINCREMENT ids")
+
+
 def init_main_db():
-    """Initializes the main database with necessary tables."""
+    """Initializes the main database with necessary tables.
+
+    It runs while the previous code still serves, so it only adds to
+    the schema, and does so in one transaction: the running workers see
+    the schema either as it was or with every change made. What the
+    previous code needs and this code does not is dropped afterwards,
+    by contract_main_db.
+    """
     conn = get_main_db_connection()
     cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
 
-    cursor.execute(
-        """
+    cursor.execute("""
         CREATE TABLE IF NOT EXISTS items (
             id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             price REAL NOT NULL,
-            category TEXT NOT NULL
+            category TEXT NOT NULL,
+            stock INTEGER
         )
-        """
+        """)
+    # NULL stock means the item is not tracked and never runs out
+    add_column_if_missing(cursor, "items", "stock", "INTEGER")
+
+    # One counter per cache namespace, bumped by the write paths so
+    # per-process caches can tell their data changed (generations.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_generation (
+            namespace TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+    # The catalog generation takes over from the old catalog_version
+    # table, so fragments cached under old versions are never reused;
+    # the table is kept up to date for the previous code until
+    # contract_main_db drops it
+    if cursor.execute(
+        """SELECT 1 FROM sqlite_master
+        WHERE type = 'table' AND name = 'catalog_version'"""
+    ).fetchone():
+        cursor.execute(
+            """INSERT OR IGNORE INTO cache_generation (namespace, generation)
+            SELECT 'catalog', version FROM catalog_version"""
+        )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO cache_generation (namespace) VALUES (?)",
+        [(namespace,) for namespace in ("catalog", "stock")],
     )
 
+    # Every catalog change bumps the catalog generation, which cached
+    # fragments are keyed by; stock changes only bump the stock one
+    for name, event, namespaces in (
+        ("insert", "INSERT", "'catalog', 'stock'"),
+        ("update", "UPDATE OF name, price, category", "'catalog'"),
+        ("delete", "DELETE", "'catalog', 'stock'"),
+        ("stock", "UPDATE OF stock", "'stock'"),
+    ):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS items_{name}_generation
+            AFTER {event} ON items
+            BEGIN
+                UPDATE cache_generation SET generation = generation + 1
+                WHERE namespace IN ({namespaces});
+            END
+            """)
+
+    cursor.execute(ORDERS_TABLE.format(name="orders"))
+    add_column_if_missing(cursor, "orders", "change_seq", "INTEGER")
+    add_column_if_missing(cursor, "orders", "building_id", "INTEGER")
+    add_column_if_missing(cursor, "orders", "zone_id", "INTEGER")
+    make_order_ids_monotonic(cursor)
+
+    # Every insert and status or claim change stamps the order with the
+    # next sequence number, so clients can ask for changes since a seq
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS order_change_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        )
+        """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO order_change_seq (id, seq)
+        SELECT 1, COALESCE(MAX(id), 0) FROM orders
+        """)
     cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS orders (
+        "UPDATE orders SET change_seq = id WHERE change_seq IS NULL"
+    )
+    for name, event in (
+        ("insert", "INSERT"),
+        ("update", "UPDATE OF status, claimed_by"),
+    ):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS orders_{name}_seq
+            AFTER {event} ON orders
+            BEGIN
+                UPDATE order_change_seq SET seq = seq + 1;
+                UPDATE orders SET change_seq =
+                    (SELECT seq FROM order_change_seq)
+                WHERE id = NEW.id;
+            END
+            """)
+    # Deleting an order leaves no row to report, so it moves the
+    # sequence on, and deleting one a board may show also marks where
+    # boards patched from the feed have to be loaded again
+    add_column_if_missing(
+        cursor,
+        "order_change_seq",
+        "removal_seq",
+        "INTEGER NOT NULL DEFAULT 0",
+    )
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS orders_delete_seq
+        AFTER DELETE ON orders
+        BEGIN
+            UPDATE order_change_seq SET seq = seq + 1,
+            removal_seq = CASE WHEN OLD.status IN ('placed', 'claimed')
+            THEN seq + 1 ELSE removal_seq END;
+        END
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_change_seq
+        ON orders (change_seq)
+        """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS order_events (
             id INTEGER PRIMARY KEY,
-            status TEXT CHECK(status IN
-            ('placed', 'claimed', 'fulfilled', 'declined', 'cancelled')),
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            order_id INTEGER NOT NULL,
+            step TEXT NOT NULL,
+            checked INTEGER NOT NULL,
+            at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            actor INTEGER,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_events_order
+        ON order_events (order_id, step)
+        """)
+
+    # Carry timelines stored in the old orders.timeline blob over to
+    # the event log, once per order
+    cursor.execute("""
+        INSERT INTO order_events (order_id, step, checked, at, actor)
+        SELECT orders.id, entry.key, 1, orders.timestamp, orders.claimed_by
+        FROM orders, json_each(orders.timeline) AS entry
+        WHERE entry.value = 1
+        AND NOT EXISTS (
+            SELECT 1 FROM order_events WHERE order_id = orders.id
+        )
+        """)
+
+    # Partial indexes only cover live orders, so dispatch queries stay
+    # small no matter how many orders have been fulfilled or cancelled
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_placed
+        ON orders (timestamp) WHERE status = 'placed'
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_placed_zone
+        ON orders (zone_id, timestamp) WHERE status = 'placed'
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_claimed
+        ON orders (claimed_by) WHERE status = 'claimed'
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_user
+        ON orders (user_id, timestamp)
+        """)
+
+    # Finished orders are moved here by worker.py to keep the orders
+    # table, which every dispatch query scans, small
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            id INTEGER PRIMARY KEY,
+            status TEXT,
+            timestamp TIMESTAMP,
             user_id INTEGER,
             total_items INTEGER,
             cart TEXT,
             location TEXT,
-            timeline TEXT DEFAULT '{}',
             claimed_by INTEGER,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
+            building_id INTEGER,
+            zone_id INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        """
-    )
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_archive_user
+        ON orders_archive (user_id, timestamp)
+        """)
+    # Lets analytics read only the archive's newest days
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_archive_timestamp
+        ON orders_archive (timestamp)
+        """)
+    # New orders never reuse the id of an archived one, including ones
+    # archived before orders had AUTOINCREMENT
+    cursor.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'orders', 0 WHERE NOT EXISTS
+        (SELECT 1 FROM sqlite_sequence WHERE name = 'orders')
+        """)
+    cursor.execute("""
+        UPDATE sqlite_sequence SET seq = MAX(seq,
+        (SELECT COALESCE(MAX(id), 0) FROM orders_archive))
+        WHERE name = 'orders'
+        """)
+
+    # Order history reads live and archived orders alike
+    cursor.execute("DROP VIEW IF EXISTS all_orders")
+    cursor.execute("""
+        CREATE VIEW all_orders AS
+        SELECT id, status, timestamp, user_id, total_items, cart,
+        location, claimed_by, building_id, zone_id FROM orders
+        UNION ALL
+        SELECT id, status, timestamp, user_id, total_items, cart,
+        location, claimed_by, building_id, zone_id FROM orders_archive
+        """)
+
+    # Per-user order statistics, kept up to date by worker.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_orders INTEGER NOT NULL,
+            total_items INTEGER NOT NULL,
+            total_spent REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+    # Dashboard aggregates of past days; see analytics.py. An order
+    # that changes status after its day was cached drops that day and
+    # the ones after it, which are then computed again
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_days (
+            day TEXT PRIMARY KEY,
+            aggregates TEXT NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS orders_status_analytics
+        AFTER UPDATE OF status ON orders
+        BEGIN
+            DELETE FROM analytics_days
+            WHERE day >= date(NEW.timestamp);
+        END
+        """)
+
+    # Stock taken by each order, returned if the order is declined or
+    # expires
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            order_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'held'
+            CHECK(status IN ('held', 'released', 'consumed')),
+            PRIMARY KEY (order_id, item_id),
+            FOREIGN KEY (order_id) REFERENCES orders(id),
+            FOREIGN KEY (item_id) REFERENCES items(id)
+        )
+        """)
+
+    # Campus zones have planar coordinates in km from Frist, used to
+    # sort the dispatch board by distance
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS campus_zones (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            x REAL NOT NULL,
+            y REAL NOT NULL
+        )
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS campus_buildings (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            zone_id INTEGER NOT NULL,
+            FOREIGN KEY (zone_id) REFERENCES campus_zones(id)
+        )
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS building_aliases (
+            alias TEXT PRIMARY KEY,
+            building_id INTEGER NOT NULL,
+            FOREIGN KEY (building_id) REFERENCES campus_buildings(id)
+        )
+        """)
 
     conn.commit()
     conn.close()
 
 
-def init_user_db():
-    """Initializes the user database with necessary tables."""
-    conn = get_user_db_connection()
+def contract_main_db():
+    """Drops what only code older than this still reads.
+
+    Run it once every process runs this code, after a deploy has
+    succeeded; init_main_db leaves these in place for the old workers.
+    """
+    conn = get_main_db_connection()
     cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    # Replaced by the catalog generation in cache_generation
+    for name in ("insert", "update", "update_catalog", "delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS items_{name}_version")
+    cursor.execute("DROP TABLE IF EXISTS catalog_version")
+    conn.commit()
+    conn.close()
 
-    cursor.execute(
-        """
+
+def init_user_shard(shard):
+    """Initializes one user database shard with necessary tables."""
+    conn = get_user_shard_connection(shard)
+    cursor = conn.cursor()
+
+    cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             venmo_handle TEXT,
             cart TEXT DEFAULT '{}'
         )
-        """
+        """)
+    # When the cart last changed, so maintenance.py can clear carts
+    # that were abandoned; existing carts count from the migration
+    add_column_if_missing(
+        cursor, "users", "cart_updated_at", "TIMESTAMP"
     )
-
     cursor.execute(
-        """
+        """UPDATE users SET cart_updated_at = CURRENT_TIMESTAMP
+        WHERE cart_updated_at IS NULL"""
+    )
+
+    cursor.execute("""
         CREATE TABLE IF NOT EXISTS favorites (
             user_id INTEGER,
             item_id INTEGER,
@@ -90,8 +607,39 @@ def init_user_db():
             FOREIGN KEY (user_id) REFERENCES users(user_id),
             FOREIGN KEY (item_id) REFERENCES items(id)
         )
-        """
-    )
+        """)
+
+    conn.commit()
+    conn.close()
+
+
+def init_user_db(shards=None):
+    """Initializes the user directory and every user database shard."""
+    shards = shards or USER_SHARDS
+    for shard in range(shards):
+        init_user_shard(shard)
+
+    conn = get_user_directory_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_directory (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        """)
+
+    # Users created before the directory existed are listed in it
+    for shard in range(shards):
+        shard_conn = get_user_shard_connection(shard)
+        users = shard_conn.execute(
+            "SELECT user_id, name FROM users"
+        ).fetchall()
+        shard_conn.close()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO user_directory (user_id, name) VALUES (?, ?)",
+            [tuple(user) for user in users],
+        )
 
     conn.commit()
     conn.close()
@@ -102,60 +650,79 @@ def populate_items():
     conn = get_main_db_connection()
     cursor = conn.cursor()
 
-    sample_items = {
-        "1": {"name": "Coke", "price": 1.09, "category": "drinks"},
-        "2": {"name": "Diet Coke", "price": 1.29, "category": "drinks"},
-        "3": {
-            "name": "Tropicana Orange Juice",
-            "price": 0.89,
-            "category": "drinks",
-        },
-        "4": {
-            "name": "Lay's Potato Chips",
-            "price": 1.59,
-            "category": "food",
-        },
-        "5": {
-            "name": "Snickers Bar",
-            "price": 0.99,
-            "category": "food",
-        },
-        "6": {"name": "Notebook", "price": 2.49, "category": "other"},
-    }
-
-    for item_id, item in sample_items.items():
+    for item_id, item in SAMPLE_ITEMS.items():
         cursor.execute(
-            "INSERT OR IGNORE INTO items (id, name, price, category) VALUES (?, ?, ?, ?)",
-            (item_id, item["name"], item["price"], item["category"]),
+            "INSERT OR IGNORE INTO items (id, name, price, category, stock) VALUES (?, ?, ?, ?, ?)",
+            (
+                item_id,
+                item["name"],
+                item["price"],
+                item["category"],
+                item["stock"],
+            ),
         )
 
     conn.commit()
     conn.close()
 
 
-def populate_users():
-    """Populates the users table with initial users."""
-    conn = get_user_db_connection()
+def populate_locations():
+    """Populates campus zones, buildings and their common aliases."""
+    conn = get_main_db_connection()
     cursor = conn.cursor()
 
-    users = [
-        (1, "Connor"),
-        (2, "Jacob"),
-        (3, "Alex"),
-        (4, "Matt"),
-        (5, "Okezie"),
-    ]
     cursor.executemany(
-        "INSERT OR IGNORE INTO users (user_id, name) VALUES (?, ?)",
-        users,
+        "INSERT OR IGNORE INTO campus_zones (id, name, x, y) VALUES (?, ?, ?, ?)",
+        CAMPUS_ZONES,
     )
+    for building_id, name, zone_id, aliases in CAMPUS_BUILDINGS:
+        cursor.execute(
+            "INSERT OR IGNORE INTO campus_buildings (id, name, zone_id) VALUES (?, ?, ?)",
+            (building_id, name, zone_id),
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO building_aliases (alias, building_id) VALUES (?, ?)",
+            [
+                (canonical(alias), building_id)
+                for alias in [name] + aliases
+            ],
+        )
 
     conn.commit()
     conn.close()
 
 
-if __name__ == "__main__":
+def populate_users():
+    """Populates the user directory and shards with initial users."""
+    conn = get_user_directory_connection()
+    conn.executemany(
+        "INSERT OR IGNORE INTO user_directory (user_id, name) VALUES (?, ?)",
+        SAMPLE_USERS,
+    )
+    conn.commit()
+    conn.close()
+
+    for user_id, name in SAMPLE_USERS:
+        conn = get_user_db_connection(user_id)
+        conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, name) VALUES (?, ?)",
+            (user_id, name),
+        )
+        conn.commit()
+        conn.close()
+
+
+def init_all():
+    """Creates every database and fills in the seed data."""
     init_main_db()
     init_user_db()
     populate_items()
+    populate_locations()
     populate_users()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["contract"]:
+        contract_main_db()
+    else:
+        init_all()
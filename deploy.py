@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+deploy.py
+Reloads app.py or server.py with new code without dropping requests:
+a second gunicorn master is started next to the running one, and the
+old one is only stopped once every new worker reports ready
+
+Usage: python deploy.py <app | server>
+
+The running master is found through the pidfile serve.py writes to
+RUN_DIR and sent USR2, which starts a new master with the new code on
+the same sockets. Both fleets serve until each new worker has answered
+/readyz with 200; the old master is then sent TERM and lets its
+workers finish the requests they have, and the new one takes over the
+pidfile. If the new workers are not ready within DEPLOY_READY_TIMEOUT
+seconds, the new master is sent TERM instead, the old one keeps
+serving, and deploy.py exits with status 1. If the service is not
+running, it is started.
+"""
+
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import serve
+from config import DEPLOY_READY_TIMEOUT
+
+# Seconds between polls of pidfiles, processes and /readyz
+POLL_SECONDS = 0.05
+# Seconds an old master gets to finish its requests after TERM, a
+# little more than gunicorn's graceful timeout
+EXIT_GRACE_SECONDS = 35
+
+
+def alive(pid):
+    """Returns whether a process with pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_pid(path):
+    """Returns the pid in a pidfile if that process is alive."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            pid = int(file.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if alive(pid) else None
+
+
+def workers_of(master):
+    """Returns the pids of a gunicorn master's workers."""
+    result = subprocess.run(
+        ["pgrep", "-P", str(master)],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return {int(pid) for pid in result.stdout.split()}
+
+
+def probe(bind):
+    """Returns (status, pid) of a worker's /readyz answer.
+
+    Which worker answers is up to the kernel; (None, None) means none
+    did.
+    """
+    host, _, port = bind.rpartition(":")
+    if host in ("", "0.0.0.0", "[::]"):
+        host = "127.0.0.1"
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    try:
+        conn.request("GET", "/readyz")
+        response = conn.getresponse()
+        body = json.loads(response.read() or b"{}")
+    except (OSError, ValueError):
+        return None, None
+    finally:
+        conn.close()
+    return response.status, body.get("pid")
+
+
+def wait_for_master(path, old, deadline):
+    """Returns the pid of a master other than old once it has
+    written its pidfile, or None by the deadline.
+
+    A master started by USR2 writes to path + ".2" until the old one
+    exits.
+    """
+    while time.monotonic() < deadline:
+        for candidate in (path + ".2", path):
+            pid = read_pid(candidate)
+            if pid is not None and pid != old:
+                return pid
+        time.sleep(POLL_SECONDS)
+    return None
+
+
+def wait_until_ready(service, master, deadline):
+    """Returns whether every worker of master answered /readyz with
+    200 by the deadline.
+
+    Requests go to the service's address, so workers of the old
+    master answer some of them; only the new workers' answers count.
+    A worker that answers 503 has to answer 200 again afterwards.
+    """
+    bind = serve.settings(service)["bind"]
+    expected = serve.settings(service)["workers"]
+    ready = set()
+    while time.monotonic() < deadline and alive(master):
+        workers = workers_of(master)
+        ready &= workers
+        if len(workers) >= expected and ready == workers:
+            return True
+        status, pid = probe(bind)
+        if pid in workers:
+            if status == 200:
+                ready.add(pid)
+            else:
+                ready.discard(pid)
+        time.sleep(POLL_SECONDS)
+    return False
+
+
+def wait_for_exit(pid, timeout):
+    """Returns whether the process exited within timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while alive(pid):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(POLL_SECONDS)
+    return True
+
+
+def start(service, deadline):
+    """Starts a service that is not running; returns whether its
+    workers became ready."""
+    print(f"{service} is not running, starting it")
+    with open(os.devnull, "rb") as devnull:
+        # pylint: disable-next=consider-using-with
+        subprocess.Popen(
+            [sys.executable, "serve.py", service],
+            stdin=devnull,
+            start_new_session=True,
+        )
+    master = wait_for_master(serve.pidfile(service), None, deadline)
+    return master is not None and wait_until_ready(
+        service, master, deadline
+    )
+
+
+def reload(service):
+    """Replaces the running service; returns whether it was."""
+    path = serve.pidfile(service)
+    deadline = time.monotonic() + DEPLOY_READY_TIMEOUT
+    old = read_pid(path)
+    if old is None:
+        return start(service, deadline)
+
+    print(f"Starting a new {service} master next to {old}")
+    os.kill(old, signal.SIGUSR2)
+    new = wait_for_master(path, old, deadline)
+    if new is not None and wait_until_ready(service, new, deadline):
+        print(f"{service} workers of {new} are ready, stopping {old}")
+        os.kill(old, signal.SIGTERM)
+        if not wait_for_exit(old, EXIT_GRACE_SECONDS):
+            print(f"{old} is still finishing requests")
+        return True
+
+    # The old master never stopped serving, so rolling back is only
+    # a matter of stopping the new one
+    print(f"New {service} workers are not ready, keeping {old}")
+    if new is not None and alive(new):
+        os.kill(new, signal.SIGTERM)
+        wait_for_exit(new, EXIT_GRACE_SECONDS)
+    return False
+
+
+def main():
+    """Reloads the service named on the command line."""
+    if len(sys.argv) != 2 or sys.argv[1] not in serve.SERVICES:
+        print(__doc__.split("\n\n")[1])
+        sys.exit(1)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if not os.getenv("SECRET_KEY"):
+        print("SECRET_KEY is not set, so this deploy logs everyone out")
+    if not reload(sys.argv[1]):
+        sys.exit(1)
+    print(f"Deployed {sys.argv[1]}")
+
+
+if __name__ == "__main__":
+    main()
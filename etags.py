@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+etags.py
+Weak ETags built from data versions, so a client asking again for a
+response it already has gets a 304 before anything is read or rendered
+"""
+
+import hashlib
+import secrets
+
+from flask import current_app, g, request, session
+
+# Drawn once by the preloaded master, so all its workers agree on tags,
+# and again on every restart, so responses built by older code are not
+# taken for current ones
+RELEASE = secrets.token_hex(4)
+
+
+def check(*versions):
+    """Tags the current response with a weak ETag built from versions.
+
+    versions must cover everything the response is built from, such
+    as the catalog version or the orders' change sequence and the user
+    it is for. Returns a 304 response if the client's copy has the same
+    tag, or None, in which case the route builds the response as usual.
+    A page that would show flashed messages is never answered 304.
+    """
+    # Reading the session makes the response vary by cookie, so only
+    # requests that carry one are checked for flashed messages
+    cookie = current_app.config["SESSION_COOKIE_NAME"]
+    if cookie in request.cookies and "_flashes" in session:
+        return None
+    digest = hashlib.sha1(repr((RELEASE, versions)).encode())
+    g.etag = digest.hexdigest()[:20]
+    if request.if_none_match.contains_weak(g.etag):
+        return not_modified(g.etag)
+    return None
+
+
+def not_modified(etag):
+    """Returns an empty 304 response carrying etag."""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Adds the tag set by check to app's successful responses.
+
+    Tagged responses must be revalidated before every reuse, since the
+    data behind them can change at any moment.
+    """
+
+    @app.after_request
+    def add_etag(response):
+        etag = g.pop("etag", None)
+        if etag is not None and response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+export.py
+Streams orders or deliverer earnings as CSV or JSON Lines, optionally
+gzipped, without holding the whole export in memory
+
+Usage: python export.py <orders|earnings>.<csv|jsonl>[.gz]
+       [since=YYYY-MM-DD] [until=YYYY-MM-DD] [status=STATUS,...] > FILE
+
+Orders are read from the database EXPORT_CHUNK_ROWS at a time and
+written out as each chunk is encoded, so memory use stays the same
+however many orders an export covers. Earnings are one row per
+fulfilled order with a deliverer; status filters do not apply to them.
+The same exports are served to admins at /admin/export/<name>.
+"""
+
+import csv
+import io
+import itertools
+import json
+import sys
+import zlib
+from datetime import date
+
+import order_lifecycle
+import repository
+from config import DELIVERY_FEE_PERCENTAGE, EXPORT_CHUNK_ROWS
+
+ORDER_FIELDS = (
+    "id",
+    "timestamp",
+    "status",
+    "user_id",
+    "total_items",
+    "subtotal",
+    "location",
+    "claimed_by",
+    "building_id",
+    "zone_id",
+    "cart",
+)
+EARNING_FIELDS = (
+    "order_id",
+    "timestamp",
+    "deliverer_id",
+    "deliverer",
+    "subtotal",
+    "earnings",
+)
+FIELDS = {"orders": ORDER_FIELDS, "earnings": EARNING_FIELDS}
+MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+class ExportError(ValueError):
+    """An export name or filter that is not understood."""
+
+
+def parse(name, params):
+    """Returns (kind, fmt, compress, filters) for an export request.
+
+    name is e.g. "orders.csv" or "earnings.jsonl.gz"; params may hold
+    "since", "until" and a comma-separated "status". filters are the
+    keyword arguments of OrderRepository.export.
+    """
+    parts = name.split(".")
+    compress = parts[-1] == "gz"
+    if compress:
+        parts.pop()
+    if (
+        len(parts) != 2
+        or parts[0] not in FIELDS
+        or parts[1] not in MIMETYPES
+    ):
+        raise ExportError(f"Unknown export {name}")
+
+    filters = {}
+    for key in ("since", "until"):
+        if params.get(key):
+            try:
+                filters[key] = date.fromisoformat(
+                    params[key]
+                ).isoformat()
+            except ValueError:
+                raise ExportError(
+                    f"{key} must be a YYYY-MM-DD date"
+                ) from None
+    if params.get("status"):
+        statuses = tuple(params["status"].split(","))
+        unknown = set(statuses) - set(order_lifecycle.TRANSITIONS)
+        if unknown:
+            raise ExportError(
+                f"Unknown status {', '.join(sorted(unknown))}"
+            )
+        filters["statuses"] = statuses
+    return parts[0], parts[1], compress, filters
+
+
+def mimetype(fmt, compress):
+    """Returns the content type of an export."""
+    return "application/gzip" if compress else MIMETYPES[fmt]
+
+
+def _batches(rows):
+    """Yields lists of up to EXPORT_CHUNK_ROWS rows."""
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, EXPORT_CHUNK_ROWS)):
+        yield batch
+
+
+def _subtotal(order):
+    """Returns the order's subtotal in dollars."""
+    return round(
+        sum(
+            line["quantity"] * line["price"]
+            for line in order["cart"].values()
+        ),
+        2,
+    )
+
+
+def order_rows(orders):
+    """Yields an ORDER_FIELDS dict per order."""
+    for order in orders:
+        row = {field: order.get(field) for field in ORDER_FIELDS}
+        row["subtotal"] = _subtotal(order)
+        row["cart"] = {
+            item_id: dict(line)
+            for item_id, line in order["cart"].items()
+        }
+        yield row
+
+
+def earning_rows(orders):
+    """Yields an EARNING_FIELDS dict per order with a deliverer."""
+    users = repository.get().users
+    for batch in _batches(orders):
+        delivered = [
+            order for order in batch if order["claimed_by"] is not None
+        ]
+        # One lookup per batch rather than one per order
+        names = users.names(
+            {order["claimed_by"] for order in delivered}
+        )
+        for order in delivered:
+            subtotal = _subtotal(order)
+            yield {
+                "order_id": order["id"],
+                "timestamp": order["timestamp"],
+                "deliverer_id": order["claimed_by"],
+                "deliverer": names.get(order["claimed_by"]),
+                "subtotal": subtotal,
+                "earnings": round(
+                    subtotal * DELIVERY_FEE_PERCENTAGE, 2
+                ),
+            }
+
+
+def encode_csv(rows, fields):
+    """Yields CSV text a batch of rows at a time, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields)
+    writer.writeheader()
+    for batch in _batches(rows):
+        writer.writerows(
+            {
+                field: (
+                    json.dumps(value)
+                    if isinstance(value, dict)
+                    else value
+                )
+                for field, value in row.items()
+            }
+            for row in batch
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode_jsonl(rows, _fields):
+    """Yields JSON Lines text a batch of rows at a time."""
+    for batch in _batches(rows):
+        yield "".join(json.dumps(row) + "\n" for row in batch)
+
+
+def gzipped(chunks):
+    """Gzips a stream of bytes as it goes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(kind, fmt, compress, filters):
+    """Yields the bytes of an export, as returned by parse."""
+    reports = repository.get().reports
+    if kind == "earnings":
+        rows = earning_rows(
+            reports.export(
+                filters.get("since"),
+                filters.get("until"),
+                ("fulfilled",),
+            )
+        )
+    else:
+        rows = order_rows(reports.export(**filters))
+    encode = encode_csv if fmt == "csv" else encode_jsonl
+    chunks = (
+        text.encode("utf-8") for text in encode(rows, FIELDS[kind])
+    )
+    return gzipped(chunks) if compress else chunks
+
+
+def main():
+    """Writes the export named on the command line to stdout."""
+    try:
+        if len(sys.argv) < 2 or not all(
+            "=" in arg for arg in sys.argv[2:]
+        ):
+            raise ExportError(__doc__.split("\n\n")[1])
+        params = dict(arg.split("=", 1) for arg in sys.argv[2:])
+        kind, fmt, compress, filters = parse(sys.argv[1], params)
+    except ExportError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    for chunk in stream(kind, fmt, compress, filters):
+        sys.stdout.buffer.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
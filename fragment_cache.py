@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+fragment_cache.py
+LRU cache for rendered template fragments and the {% cache %} tag
+"""
+
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from config import FRAGMENT_CACHE_SIZE
+
+# Whether the fragment this thread is rendering may be cached
+_local = threading.local()
+
+
+class FragmentCache:
+    """A bounded, thread-safe LRU map from keys to rendered markup."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """Returns the fragment cached under key, rendering it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Render outside the lock; two workers threads may both render
+        # the same fragment once, which is harmless
+        outer = getattr(_local, "cacheable", True)
+        _local.cacheable = True
+        try:
+            fragment = render()
+            cacheable = _local.cacheable
+        finally:
+            _local.cacheable = outer and _local.cacheable
+        if not cacheable:
+            return fragment
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        """Drops every cached fragment."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+fragments = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+
+def uncacheable():
+    """Keeps the fragments this thread is rendering out of the cache.
+
+    Called by loaders that fell back to stale data, which must not be
+    cached under the key of the current data.
+    """
+    _local.cacheable = False
+
+
+class FragmentCacheExtension(Extension):
+    """Adds {% cache key %}...{% endcache %} to templates.
+
+    The body is rendered only when key is not cached. Keys should
+    include every version the body depends on, e.g.
+    {% cache ("category", category, catalog_version) %}. Anything
+    specific to the current user belongs outside the block.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=fragments)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        body = parser.parse_statements(
+            ("name:endcache",), drop_needle=True
+        )
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [key]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        """Returns the cached body for key, rendering it on a miss."""
+        return self.environment.fragment_cache.get_or_render(
+            key, caller
+        )
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+generations.py
+Per-namespace generation counters in the main database, which let
+caches kept inside each worker process notice writes made by others
+"""
+
+import os
+import threading
+
+import database
+
+# Namespaces; catalog and stock are bumped by triggers on items
+CATALOG = "catalog"
+STOCK = "stock"
+USERS = "users"
+
+_local = threading.local()
+
+
+def _connect():
+    """Returns this thread's connection for reading generations.
+
+    A new one is made after a fork, or when the main database has
+    been moved, e.g. by tests.
+    """
+    owner = (os.getpid(), database.MAIN_DATABASE)
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.owner == owner:
+        return conn
+    conn = database.get_main_db_connection()
+    _local.conn = conn
+    _local.owner = owner
+    _local.data_version = None
+    _local.generations = {}
+    return conn
+
+
+def current(namespace):
+    """Returns the namespace's generation.
+
+    PRAGMA data_version changes only when another connection commits
+    to the main database, so most calls cost that one pragma and the
+    table is re-read only after a write.
+    """
+    conn = _connect()
+    # Read the version before the table: a write in between is then
+    # picked up on the next call instead of being missed
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version != _local.data_version:
+        _local.generations = dict(
+            conn.execute(
+                "SELECT namespace, generation FROM cache_generation"
+            ).fetchall()
+        )
+        _local.data_version = version
+    return _local.generations.get(namespace, 0)
+
+
+def bump(cursor, namespace):
+    """Invalidates every process's caches in namespace.
+
+    Call it in the transaction making the write, on a cursor of the
+    main database.
+    """
+    cursor.execute(
+        """INSERT INTO cache_generation (namespace, generation)
+        VALUES (?, 1) ON CONFLICT (namespace)
+        DO UPDATE SET generation = generation + 1""",
+        (namespace,),
+    )
+
+
+class GenerationCache:  # pylint: disable=too-few-public-methods
+    """A value computed by load and reused while namespace is unchanged."""
+
+    def __init__(self, namespace, load):
+        self.namespace = namespace
+        self.load = load
+        self._generation = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the cached value, loading it again if it is stale."""
+        generation = current(self.namespace)
+        with self._lock:
+            if generation == self._generation:
+                return self._value
+
+        # Load outside the lock; a concurrent load of the same
+        # generation is wasted work, not a wrong answer
+        value = self.load()
+        with self._lock:
+            self._generation = generation
+            self._value = value
+        return value
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+health.py
+Liveness and readiness endpoints for load balancers and deploy.py
+"""
+
+import os
+
+from flask import jsonify
+
+import repository
+
+
+def data_checks():
+    """Returns readiness checks reading from every database.
+
+    Each goes through the repository, so a worker that passes them
+    has its connections open and the caches they read through filled.
+    """
+    # The repository is looked up on every check, not once here
+    # pylint: disable=unnecessary-lambda
+    return {
+        "catalog": lambda: repository.get().items.all(),
+        "orders": lambda: repository.get().orders.latest_change_seq(),
+        "users": lambda: repository.get().users.get_many([0]),
+    }
+
+
+def init_app(app, checks):
+    """Adds /healthz and /readyz to app.
+
+    /healthz answers as long as the worker does. /readyz runs checks,
+    a dict of names to functions raising if the worker cannot serve,
+    and answers 503 if any of them fails. Both report the worker's
+    pid, so a caller can tell which workers it has heard from.
+    """
+
+    @app.route("/healthz", methods=["GET"])
+    def healthz():
+        return jsonify({"status": "ok", "pid": os.getpid()})
+
+    @app.route("/readyz", methods=["GET"])
+    def readyz():
+        results = {}
+        for name, check in checks.items():
+            try:
+                check()
+                results[name] = "ok"
+            except Exception as error:  # pylint: disable=broad-except
+                results[name] = f"{type(error).__name__}: {error}"
+        ready = all(result == "ok" for result in results.values())
+        body = {
+            "status": "ready" if ready else "not ready",
+            "pid": os.getpid(),
+            "checks": results,
+        }
+        return jsonify(body), 200 if ready else 503
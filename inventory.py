@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+inventory.py
+Item stock and the reservations held by orders
+"""
+
+import sys
+
+import repository
+
+
+def take_stock(cursor, cart):
+    """Decrements stock for every line of cart.
+
+    Each decrement is a conditional UPDATE that only succeeds while
+    enough stock is left, so concurrent buyers can never oversell.
+    Items with NULL stock are not tracked and always succeed. Must run
+    inside the caller's transaction, which should be rolled back when
+    an item is returned.
+
+    Returns the id of the first item without enough stock, or None.
+    """
+    for item_id in sorted(cart):
+        quantity = cart[item_id]["quantity"]
+        cursor.execute(
+            """UPDATE items SET stock = stock - ?
+            WHERE id = ? AND (stock IS NULL OR stock >= ?)""",
+            (quantity, item_id, quantity),
+        )
+        if cursor.rowcount != 1:
+            return item_id
+    return None
+
+
+def record_reservations(cursor, order_id, cart):
+    """Records the stock taken for an order so it can be given back."""
+    cursor.executemany(
+        """INSERT INTO stock_reservations (order_id, item_id, quantity)
+        VALUES (?, ?, ?)""",
+        [
+            (order_id, item_id, details["quantity"])
+            for item_id, details in cart.items()
+        ],
+    )
+
+
+def release(cursor, order_id):
+    """Returns the stock held by an order that will not be delivered."""
+    cursor.execute(
+        """UPDATE items SET stock = stock + (
+            SELECT quantity FROM stock_reservations
+            WHERE order_id = ? AND item_id = items.id AND status = 'held'
+        )
+        WHERE stock IS NOT NULL AND id IN (
+            SELECT item_id FROM stock_reservations
+            WHERE order_id = ? AND status = 'held'
+        )""",
+        (order_id, order_id),
+    )
+    cursor.execute(
+        """UPDATE stock_reservations SET status = 'released'
+        WHERE order_id = ? AND status = 'held'""",
+        (order_id,),
+    )
+
+
+def consume(cursor, order_id):
+    """Marks the stock held by a delivered order as sold."""
+    cursor.execute(
+        """UPDATE stock_reservations SET status = 'consumed'
+        WHERE order_id = ? AND status = 'held'""",
+        (order_id,),
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: inventory.py <item_id> <stock|untracked>")
+        sys.exit(1)
+    new_stock = None if sys.argv[2] == "untracked" else int(sys.argv[2])
+    repository.get().items.set_stock(int(sys.argv[1]), new_stock)
+    print(f"Stock of item {sys.argv[1]} set to {sys.argv[2]}.")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+jobs.py
+Durable background job queue kept in a local SQLite file, so slow
+work can leave the request path without an external broker
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import JOB_VISIBILITY_SECONDS, JOBS_DATABASE
+
+CRITICAL = 0
+NORMAL = 1
+BACKGROUND = 2
+
+# Seconds before the first retry of a failed job; doubled per attempt
+RETRY_BASE_SECONDS = 5
+# Finished jobs are kept this long for inspection
+KEEP_FINISHED_SECONDS = 24 * 60 * 60
+
+# kind -> (function taking a list of payloads, batch size)
+_handlers = {}
+_local = threading.local()
+
+
+def _connect():
+    """Returns this thread's connection to the job store."""
+    owner = (os.getpid(), JOBS_DATABASE)
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.owner == owner:
+        return conn
+    conn = sqlite3.connect(JOBS_DATABASE, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            priority INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'queued'
+            CHECK(status IN ('queued', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_at REAL NOT NULL,
+            locked_until REAL,
+            locked_by TEXT,
+            last_error TEXT,
+            dedupe_key TEXT,
+            finished_at REAL
+        )
+        """)
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_jobs_ready
+        ON jobs (status, priority, run_at)""")
+    # At most one queued job per dedupe key; once it starts running a
+    # new one may be queued behind it
+    conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe
+        ON jobs (dedupe_key) WHERE status = 'queued'""")
+    conn.commit()
+    _local.conn = conn
+    _local.owner = owner
+    return conn
+
+
+def handler(kind, batch_size=1):
+    """Registers a function to run jobs of kind.
+
+    The function receives a list of up to batch_size payloads; jobs
+    of one kind that are ready together are run in a single call.
+    """
+
+    def register(function):
+        _handlers[kind] = (function, batch_size)
+        return function
+
+    return register
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def enqueue(
+    kind,
+    payload=None,
+    priority=NORMAL,
+    delay=0,
+    dedupe_key=None,
+    max_attempts=5,
+):
+    """Adds a job to the queue.
+
+    If a job with the same dedupe_key is already queued, nothing is
+    added. Returns True if a job was added.
+    """
+    conn = _connect()
+    cursor = conn.execute(
+        """INSERT OR IGNORE INTO jobs
+        (kind, payload, priority, run_at, dedupe_key, max_attempts)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+        (
+            kind,
+            json.dumps(payload or {}),
+            priority,
+            time.time() + delay,
+            dedupe_key,
+            max_attempts,
+        ),
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def claim(worker_id, visibility=JOB_VISIBILITY_SECONDS):
+    """Claims the next batch of ready jobs of one kind.
+
+    Jobs stay invisible to other workers for visibility seconds; a
+    worker that dies mid-job lets them be claimed again afterwards.
+    Returns (kind, [job rows]), or (None, []) if nothing is ready.
+    """
+    now = time.time()
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs that timed out on their last attempt are given up on
+        cursor.execute(
+            """UPDATE jobs SET status = 'failed', finished_at = ?,
+            last_error = COALESCE(last_error, 'visibility timeout')
+            WHERE status = 'running' AND locked_until <= ?
+            AND attempts >= max_attempts""",
+            (now, now),
+        )
+        ready = """(status = 'queued' AND run_at <= :now)
+            OR (status = 'running' AND locked_until <= :now)"""
+        first = cursor.execute(
+            f"""SELECT kind FROM jobs WHERE {ready}
+            ORDER BY priority, run_at LIMIT 1""",
+            {"now": now},
+        ).fetchone()
+        if first is None:
+            conn.commit()
+            return None, []
+
+        kind = first["kind"]
+        batch_size = _handlers.get(kind, (None, 1))[1]
+        rows = cursor.execute(
+            f"""SELECT * FROM jobs WHERE kind = :kind AND ({ready})
+            ORDER BY priority, run_at LIMIT :limit""",
+            {"kind": kind, "now": now, "limit": batch_size},
+        ).fetchall()
+        cursor.executemany(
+            """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+            locked_until = ?, locked_by = ? WHERE id = ?""",
+            [(now + visibility, worker_id, row["id"]) for row in rows],
+        )
+        conn.commit()
+        return kind, rows
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def complete(job_ids):
+    """Marks jobs as done."""
+    conn = _connect()
+    conn.executemany(
+        """UPDATE jobs SET status = 'done', finished_at = ?,
+        locked_until = NULL WHERE id = ?""",
+        [(time.time(), job_id) for job_id in job_ids],
+    )
+    conn.commit()
+
+
+def fail(jobs, error):
+    """Requeues failed jobs with backoff, or gives up after max_attempts."""
+    now = time.time()
+    conn = _connect()
+    for job in jobs:
+        attempts = job["attempts"] + 1
+        if attempts >= job["max_attempts"]:
+            conn.execute(
+                """UPDATE jobs SET status = 'failed', finished_at = ?,
+                last_error = ?, locked_until = NULL WHERE id = ?""",
+                (now, error, job["id"]),
+            )
+        else:
+            # If a duplicate was queued meanwhile, REPLACE drops it in
+            # favour of this job, which does the same work
+            conn.execute(
+                """UPDATE OR REPLACE jobs SET status = 'queued',
+                run_at = ?, last_error = ?, locked_until = NULL
+                WHERE id = ?""",
+                (
+                    now + RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+                    error,
+                    job["id"],
+                ),
+            )
+    conn.commit()
+
+
+def run_once(worker_id):
+    """Claims and runs one batch of jobs.
+
+    Returns the number of jobs run.
+    """
+    kind, rows = claim(worker_id)
+    if not rows:
+        return 0
+    if kind not in _handlers:
+        fail(rows, f"No handler for {kind}")
+        return len(rows)
+
+    function = _handlers[kind][0]
+    try:
+        function([json.loads(row["payload"]) for row in rows])
+    except Exception as error:  # pylint: disable=broad-except
+        print(f"Job {kind} failed: {error}")
+        fail(rows, str(error))
+    else:
+        complete([row["id"] for row in rows])
+    return len(rows)
+
+
+def purge_finished(keep_seconds=KEEP_FINISHED_SECONDS):
+    """Deletes done and failed jobs that finished long ago."""
+    conn = _connect()
+    cursor = conn.execute(
+        """DELETE FROM jobs WHERE status IN ('done', 'failed')
+        AND finished_at < ?""",
+        (time.time() - keep_seconds,),
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+def counts():
+    """Returns {status: number of jobs}."""
+    conn = _connect()
+    return {
+        row["status"]: row["total"]
+        for row in conn.execute(
+            "SELECT status, COUNT(*) AS total FROM jobs GROUP BY status"
+        )
+    }
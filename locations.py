@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+locations.py
+Maps free-text delivery locations to campus buildings and zones
+"""
+
+import math
+import re
+import threading
+
+# Alias and zone tables, read once per process
+_tables = {"aliases": None, "zones": None}
+_lock = threading.Lock()
+
+
+def canonical(text):
+    """Lowercases text and reduces it to words separated by one space."""
+    return " ".join(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def _load(cursor):
+    """Reads the alias and zone tables once per process."""
+    with _lock:
+        if _tables["aliases"] is None:
+            rows = cursor.execute(
+                """SELECT building_aliases.alias, campus_buildings.id,
+                campus_buildings.zone_id
+                FROM building_aliases JOIN campus_buildings
+                ON campus_buildings.id = building_aliases.building_id"""
+            ).fetchall()
+            _tables["aliases"] = sort_aliases(
+                (row[0], row[1], row[2]) for row in rows
+            )
+            _tables["zones"] = {
+                row["id"]: dict(row)
+                for row in cursor.execute(
+                    "SELECT id, name, x, y FROM campus_zones ORDER BY id"
+                )
+            }
+
+
+def sort_aliases(aliases):
+    """Orders (alias, building_id, zone_id) tuples for match_location."""
+    # Longest aliases first, so "new college west" wins over "west"
+    return sorted(aliases, key=lambda alias: -len(alias[0]))
+
+
+def match_location(aliases, text):
+    """Returns (building_id, zone_id) of the first alias found in text.
+
+    The location matches a building if one of the building's aliases
+    appears in it as whole words, e.g. "Whitman 302" or "frist lobby".
+    Returns (None, None) when no building matches.
+    """
+    padded = f" {canonical(text)} "
+    for alias, building_id, zone_id in aliases:
+        if f" {alias} " in padded:
+            return building_id, zone_id
+    return None, None
+
+
+def normalize_location(cursor, text):
+    """Returns (building_id, zone_id) for a delivery location."""
+    _load(cursor)
+    return match_location(_tables["aliases"], text)
+
+
+def get_zones(cursor):
+    """Returns {zone_id: {"id", "name", "x", "y"}} for every zone."""
+    _load(cursor)
+    return _tables["zones"]
+
+
+def zone_distance(zones, from_zone, to_zone):
+    """Returns the distance between two zones, or inf if either is unknown."""
+    if from_zone not in zones or to_zone not in zones:
+        return math.inf
+    start, end = zones[from_zone], zones[to_zone]
+    return math.hypot(start["x"] - end["x"], start["y"] - end["y"])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+maintenance.py
+Deletes old orders and clears abandoned carts in small batches, so
+maintenance can run while the app keeps serving
+
+Usage: python maintenance.py purge-orders [older_than_days=N]
+       [status=STATUS,...] [--dry-run]
+       python maintenance.py clear-carts [idle_days=N] [--dry-run]
+
+Every batch of MAINTENANCE_BATCH_SIZE rows is its own transaction,
+followed by a pause of MAINTENANCE_PAUSE seconds, so requests wait
+for the write lock for one small batch at most. Without filters every
+order is deleted or every cart emptied. --dry-run only counts the
+rows that would change.
+"""
+
+import os
+import sys
+import time
+from contextlib import closing
+
+import database
+import inventory
+import order_lifecycle
+from config import (
+    MAINTENANCE_BATCH_SIZE,
+    MAINTENANCE_PAUSE,
+    USER_SHARDS,
+)
+
+# Carts with something in them
+NOT_EMPTY = "cart IS NOT NULL AND cart NOT IN ('', '{}')"
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def in_batches(conn, table, key, where, params, apply, dry_run):
+    """Runs apply(cursor, rows) on the rows of table matching where.
+
+    Rows are taken in key order, MAINTENANCE_BATCH_SIZE per
+    transaction, and apply must make them stop matching. Rows that
+    start matching behind the last key handled are left for the next
+    run, so a busy table cannot keep it going. Returns the number of
+    rows handled, or that would be with dry_run.
+    """
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE {where}", params
+    ).fetchone()[0]
+    print(f"{table}: {total} matching")
+    if dry_run or not total:
+        return total
+
+    cursor = conn.cursor()
+    done = 0
+    last = 0
+    while True:
+        cursor.execute("BEGIN IMMEDIATE")
+        rows = cursor.execute(
+            f"""SELECT * FROM {table} WHERE {key} > ? AND {where}
+            ORDER BY {key} LIMIT ?""",
+            (last, *params, MAINTENANCE_BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            conn.rollback()
+            return done
+        apply(cursor, rows)
+        conn.commit()
+        done += len(rows)
+        last = rows[-1][key]
+        print(f"{table}: {done}/{total}")
+        time.sleep(MAINTENANCE_PAUSE)
+
+
+def _placeholders(values):
+    """Returns "?, ?, ..." with one ? per value."""
+    return ", ".join("?" for _ in values)
+
+
+def _delete_orders(table):
+    """Returns a batch step deleting orders from table."""
+
+    def apply(cursor, rows):
+        ids = [row["id"] for row in rows]
+        for order_id in ids:
+            inventory.release(cursor, order_id)
+        for dependent in ("order_events", "stock_reservations"):
+            cursor.execute(
+                f"""DELETE FROM {dependent}
+                WHERE order_id IN ({_placeholders(ids)})""",
+                ids,
+            )
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id IN ({_placeholders(ids)})",
+            ids,
+        )
+
+        # Statistics of their users are recomputed the next time they
+        # are shown, and analytics from the first affected day on
+        user_ids = sorted({row["user_id"] for row in rows} - {None})
+        cursor.execute(
+            f"""DELETE FROM user_stats
+            WHERE user_id IN ({_placeholders(user_ids)})""",
+            user_ids,
+        )
+        cursor.execute(
+            "DELETE FROM analytics_days WHERE day >= date(?)",
+            (min(row["timestamp"] for row in rows),),
+        )
+
+    return apply
+
+
+def purge_orders(older_than_days=None, statuses=None, dry_run=False):
+    """Deletes live and archived orders; returns how many.
+
+    Only orders placed more than older_than_days ago and with one of
+    statuses are deleted, if given. Stock held by deleted orders is
+    returned.
+    """
+    conditions = ["1"]
+    params = []
+    if older_than_days is not None:
+        conditions.append("timestamp < datetime('now', ?)")
+        params.append(f"-{int(older_than_days)} days")
+    if statuses:
+        conditions.append(f"status IN ({_placeholders(statuses)})")
+        params.extend(statuses)
+
+    purged = 0
+    with closing(database.get_main_db_connection()) as conn:
+        for table in ("orders", "orders_archive"):
+            purged += in_batches(
+                conn,
+                table,
+                "id",
+                " AND ".join(conditions),
+                params,
+                _delete_orders(table),
+                dry_run,
+            )
+    return purged
+
+
+def clear_carts(idle_days=None, dry_run=False):
+    """Empties carts on every shard; returns how many.
+
+    With idle_days, only carts unchanged for that many days are
+    emptied.
+    """
+    where = NOT_EMPTY
+    params = []
+    if idle_days is not None:
+        where += " AND cart_updated_at < datetime('now', ?)"
+        params.append(f"-{int(idle_days)} days")
+
+    def apply(cursor, rows):
+        user_ids = [row["user_id"] for row in rows]
+        cursor.execute(
+            f"""UPDATE users
+            SET cart = '{{}}', cart_updated_at = CURRENT_TIMESTAMP
+            WHERE user_id IN ({_placeholders(user_ids)})""",
+            user_ids,
+        )
+
+    cleared = 0
+    for shard in range(USER_SHARDS):
+        print(f"{os.path.basename(database.user_shard_path(shard))}:")
+        with closing(database.get_user_shard_connection(shard)) as conn:
+            cleared += in_batches(
+                conn, "users", "user_id", where, params, apply, dry_run
+            )
+    return cleared
+
+
+def main():
+    """Runs the command named on the command line."""
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    dry_run = "--dry-run" in sys.argv[2:]
+    options = dict(
+        arg.partition("=")[::2]
+        for arg in sys.argv[2:]
+        if arg != "--dry-run"
+    )
+    allowed = {
+        "purge-orders": {"older_than_days", "status"},
+        "clear-carts": {"idle_days"},
+    }
+    if command not in allowed or not set(options) <= allowed[command]:
+        print(__doc__.split("\n\n")[1])
+        sys.exit(1)
+
+    try:
+        if command == "purge-orders":
+            statuses = None
+            if options.get("status"):
+                statuses = tuple(options["status"].split(","))
+                for status in statuses:
+                    order_lifecycle.sources_for(status)
+            count = purge_orders(
+                options.get("older_than_days") or None,
+                statuses,
+                dry_run,
+            )
+            verb = "Would delete" if dry_run else "Deleted"
+            print(f"{verb} {count} orders.")
+        else:
+            count = clear_carts(
+                options.get("idle_days") or None, dry_run
+            )
+            verb = "Would empty" if dry_run else "Emptied"
+            print(f"{verb} {count} carts.")
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+#!/usr/bin/env python
+"""
+memory_repository.py
+Repositories kept in process memory, for tests and benchmarks that
+should not touch the disk
+"""
+
+import copy
+import threading
+from datetime import datetime, timedelta, timezone
+
+import locations
+import order_events
+import order_lifecycle
+import repository
+from database import (
+    CAMPUS_BUILDINGS,
+    CAMPUS_ZONES,
+    SAMPLE_ITEMS,
+    SAMPLE_USERS,
+)
+from records import Item, Order, User
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _now():
+    """Returns the current UTC time formatted like CURRENT_TIMESTAMP."""
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _ago(**delta):
+    """Returns a CURRENT_TIMESTAMP-style time delta before now."""
+    return (datetime.now(timezone.utc) - timedelta(**delta)).strftime(
+        TIMESTAMP_FORMAT
+    )
+
+
+def _order_id(order_id):
+    """Returns order_id as an int; routes may pass it as a string."""
+    try:
+        return int(order_id)
+    except (TypeError, ValueError):
+        return None
+
+
+# pylint: disable-next=too-many-instance-attributes,too-few-public-methods
+class MemoryState:
+    """Everything the in-memory repositories store, behind one lock."""
+
+    def __init__(self, seed=True):
+        self.lock = threading.RLock()
+        self.items = {}
+        self.catalog_version = 1
+        self.users = {}
+        self.favorites = set()
+        self.orders = {}
+        self.archive = {}
+        self.events = {}
+        self.reservations = {}
+        self.stats = {}
+        self.change_seq = 0
+        self.removal_seq = 0
+        self.zones = {
+            zone_id: {"id": zone_id, "name": name, "x": x, "y": y}
+            for zone_id, name, x, y in CAMPUS_ZONES
+        }
+        self.aliases = locations.sort_aliases(
+            (locations.canonical(alias), building_id, zone_id)
+            for building_id, name, zone_id, aliases in CAMPUS_BUILDINGS
+            for alias in [name] + aliases
+        )
+        if seed:
+            for item_id, item in SAMPLE_ITEMS.items():
+                self.items[item_id] = {"id": int(item_id), **item}
+            for user_id, name in SAMPLE_USERS:
+                self.users[user_id] = {
+                    "user_id": user_id,
+                    "name": name,
+                    "venmo_handle": None,
+                    "cart": {},
+                }
+
+    def touch(self, order):
+        """Stamps an order with the next change sequence number."""
+        self.change_seq += 1
+        order["change_seq"] = self.change_seq
+
+    def remove(self, order_id):
+        """Takes an order out of the live orders and returns it.
+
+        Like the delete trigger on orders, this moves the change
+        sequence on, and marks a removal if a board may show the order.
+        """
+        order = self.orders.pop(order_id)
+        self.change_seq += 1
+        if order["status"] not in order_lifecycle.FINISHED_STATUSES:
+            self.removal_seq = self.change_seq
+        return order
+
+
+class MemoryItems(repository.ItemRepository):
+    """Items held in memory."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def all(self):
+        with self.state.lock:
+            return {
+                item_id: Item.from_mapping(item)
+                for item_id, item in self.state.items.items()
+            }
+
+    def stock(self, item_ids):
+        with self.state.lock:
+            return {
+                str(item_id): self.state.items[str(item_id)]["stock"]
+                for item_id in item_ids
+                if str(item_id) in self.state.items
+            }
+
+    def available_stock(self):
+        with self.state.lock:
+            return {
+                item_id: item["stock"]
+                for item_id, item in self.state.items.items()
+                if item["stock"] is not None
+            }
+
+    def set_stock(self, item_id, stock):
+        with self.state.lock:
+            if str(item_id) in self.state.items:
+                self.state.items[str(item_id)]["stock"] = stock
+
+    def catalog_version(self):
+        return self.state.catalog_version
+
+
+class MemoryCarts(repository.CartRepository):
+    """Carts held in memory."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def get(self, user_id):
+        with self.state.lock:
+            user = self.state.users.get(user_id)
+            return copy.deepcopy(user["cart"]) if user else None
+
+    def update(self, user_id, change):
+        with self.state.lock:
+            user = self.state.users.get(user_id)
+            if user is None:
+                return None
+            cart = copy.deepcopy(user["cart"])
+            change(cart)
+            user["cart"] = cart
+            return copy.deepcopy(cart)
+
+    def clear(self, user_id):
+        with self.state.lock:
+            if user_id in self.state.users:
+                self.state.users[user_id]["cart"] = {}
+
+    def clear_all(self):
+        with self.state.lock:
+            for user in self.state.users.values():
+                user["cart"] = {}
+
+
+class MemoryUsers(repository.UserRepository):
+    """Users held in memory."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(int(user_id))
+
+    def get_many(self, user_ids):
+        with self.state.lock:
+            return {
+                user_id: User.from_mapping(self.state.users[user_id])
+                for user_id in {int(user_id) for user_id in user_ids}
+                if user_id in self.state.users
+            }
+
+    def get_or_create(self, name):
+        with self.state.lock:
+            for user in self.state.users.values():
+                if user["name"] == name:
+                    return user["user_id"]
+            user_id = max(self.state.users, default=0) + 1
+            self.state.users[user_id] = {
+                "user_id": user_id,
+                "name": name,
+                "venmo_handle": None,
+                "cart": {},
+            }
+            return user_id
+
+    def names(self, user_ids):
+        with self.state.lock:
+            return {
+                user_id: self.state.users[user_id]["name"]
+                for user_id in user_ids
+                if user_id in self.state.users
+            }
+
+    def set_venmo_handle(self, user_id, venmo_handle):
+        with self.state.lock:
+            if user_id in self.state.users:
+                self.state.users[user_id]["venmo_handle"] = venmo_handle
+
+
+class MemoryFavorites(repository.FavoriteRepository):
+    """Favorites held in memory."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def list(self, user_id):
+        with self.state.lock:
+            return sorted(
+                str(item_id)
+                for owner, item_id in self.state.favorites
+                if owner == user_id
+            )
+
+    def add(self, user_id, item_id):
+        with self.state.lock:
+            self.state.favorites.add((user_id, int(item_id)))
+
+    def remove(self, user_id, item_id):
+        with self.state.lock:
+            self.state.favorites.discard((user_id, int(item_id)))
+
+
+class MemoryOrders(repository.OrderRepository):
+    """Orders and timeline events held in memory."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def place(self, user_id, cart, location):
+        state = self.state
+        with state.lock:
+            for item_id in sorted(cart):
+                item = state.items.get(item_id)
+                quantity = cart[item_id]["quantity"]
+                if item is None or (
+                    item["stock"] is not None
+                    and item["stock"] < quantity
+                ):
+                    return None, item_id
+            for item_id, details in cart.items():
+                if state.items[item_id]["stock"] is not None:
+                    state.items[item_id]["stock"] -= details["quantity"]
+
+            order_id = (
+                max([*state.orders, *state.archive], default=0) + 1
+            )
+            building_id, zone_id = locations.match_location(
+                state.aliases, location
+            )
+            order = {
+                "id": order_id,
+                "status": "placed",
+                "timestamp": _now(),
+                "user_id": user_id,
+                "total_items": sum(
+                    details["quantity"] for details in cart.values()
+                ),
+                "cart": copy.deepcopy(cart),
+                "location": location,
+                "claimed_by": None,
+                "building_id": building_id,
+                "zone_id": zone_id,
+            }
+            state.touch(order)
+            state.orders[order_id] = order
+            state.events[order_id] = []
+            state.reservations[order_id] = {
+                "status": "held",
+                "items": {
+                    item_id: details["quantity"]
+                    for item_id, details in cart.items()
+                },
+            }
+            return order_id, None
+
+    def get(self, order_id, include_archived=False):
+        order_id = _order_id(order_id)
+        with self.state.lock:
+            order = self.state.orders.get(order_id)
+            if order is None and include_archived:
+                order = self.state.archive.get(order_id)
+            return Order.from_mapping(order) if order else None
+
+    def _select(self, orders, match):
+        """Returns Orders copied from those for which match(order) holds."""
+        with self.state.lock:
+            return [
+                Order.from_mapping(order)
+                for order in orders
+                if match(order)
+            ]
+
+    def latest_for_user(self, user_id, active_only=False):
+        statuses = (
+            order_lifecycle.ACTIVE_STATUSES
+            if active_only
+            else tuple(order_lifecycle.TRANSITIONS)
+        )
+        orders = self._select(
+            self.state.orders.values(),
+            lambda order: order["user_id"] == user_id
+            and order["status"] in statuses,
+        )
+        return max(
+            orders,
+            key=lambda order: (order["timestamp"], order["id"]),
+            default=None,
+        )
+
+    def history(self, user_id):
+        with self.state.lock:
+            orders = [
+                *self.state.orders.values(),
+                *self.state.archive.values(),
+            ]
+        orders = self._select(
+            orders, lambda order: order["user_id"] == user_id
+        )
+        orders.sort(
+            key=lambda order: (order["timestamp"], order["id"]),
+            reverse=True,
+        )
+        return orders
+
+    def available(self, zone_id=None):
+        return self._select(
+            self.state.orders.values(),
+            lambda order: order["status"] == "placed"
+            and (not zone_id or order["zone_id"] == zone_id),
+        )
+
+    def claimed_by(self, user_id):
+        return self._select(
+            self.state.orders.values(),
+            lambda order: order["status"] == "claimed"
+            and order["claimed_by"] == user_id,
+        )
+
+    def changes_since(self, seq, limit):
+        orders = self._select(
+            self.state.orders.values(),
+            lambda order: order["change_seq"] > seq,
+        )
+        orders.sort(key=lambda order: order["change_seq"])
+        return orders[:limit]
+
+    def latest_change_seq(self):
+        return self.state.change_seq
+
+    def removal_seq(self):
+        return self.state.removal_seq
+
+    def claim(self, order_id, user_id):
+        with self.state.lock:
+            order = self.state.orders.get(_order_id(order_id))
+            if order is None or order["status"] != "placed":
+                return False
+            order["status"] = "claimed"
+            order["claimed_by"] = user_id
+            self.state.touch(order)
+            return True
+
+    def transition(self, order_id, status):
+        sources = order_lifecycle.sources_for(status)
+        with self.state.lock:
+            order = self.state.orders.get(_order_id(order_id))
+            if order is None or order["status"] not in sources:
+                return False
+            order["status"] = status
+            self.state.touch(order)
+            if status in ("declined", "cancelled"):
+                self._settle(order["id"], "released")
+            elif status == "fulfilled":
+                self._settle(order["id"], "consumed")
+            return True
+
+    def _settle(self, order_id, outcome):
+        """Releases or consumes the stock held by an order."""
+        with self.state.lock:
+            reservation = self.state.reservations.get(order_id)
+            if not reservation or reservation["status"] != "held":
+                return
+            if outcome == "released":
+                for item_id, quantity in reservation["items"].items():
+                    item = self.state.items.get(item_id)
+                    if item and item["stock"] is not None:
+                        item["stock"] += quantity
+            reservation["status"] = outcome
+
+    def events(self, order_id):
+        with self.state.lock:
+            return copy.deepcopy(
+                self.state.events.get(_order_id(order_id), [])
+            )
+
+    def timeline(self, order_id):
+        return order_events.project_timeline(self.events(order_id))
+
+    def record_step(self, order_id, step, checked, actor):
+        with self.state.lock:
+            events = self.state.events.get(_order_id(order_id))
+            if events is None:
+                return False
+            timeline = order_events.project_timeline(events)
+            if timeline[step] == bool(checked):
+                return True
+            index = order_events.STEPS.index(step)
+            if checked:
+                allowed = (
+                    index == 0
+                    or timeline[order_events.STEPS[index - 1]]
+                )
+            else:
+                allowed = not any(
+                    timeline[later]
+                    for later in order_events.STEPS[index + 1 :]
+                )
+            if not allowed:
+                return False
+            events.append(
+                {
+                    "step": step,
+                    "checked": 1 if checked else 0,
+                    "at": _now(),
+                    "actor": actor,
+                }
+            )
+            if step == "Delivered":
+                self.transition(
+                    order_id, "fulfilled" if checked else "claimed"
+                )
+            return True
+
+    def zones(self):
+        return self.state.zones
+
+    def stats(self, user_id):
+        with self.state.lock:
+            stats = self.state.stats.get(user_id)
+            return dict(stats) if stats else None
+
+    def refresh_stats(self, user_ids):
+        for user_id in set(user_ids):
+            orders = self.history(user_id)
+            if not orders:
+                continue
+            spent = sum(
+                details.get("quantity", 0) * details.get("price", 0)
+                for order in orders
+                for details in order["cart"].values()
+            )
+            with self.state.lock:
+                self.state.stats[user_id] = {
+                    "total_orders": len(orders),
+                    "total_items": sum(
+                        order["total_items"] for order in orders
+                    ),
+                    "total_spent": round(spent, 2),
+                }
+
+    def expire_stale(self, max_age_minutes):
+        cutoff = _ago(minutes=max_age_minutes)
+        stale = self._select(
+            self.state.orders.values(),
+            lambda order: order["status"] == "placed"
+            and order["timestamp"] < cutoff,
+        )
+        return sum(
+            self.transition(order["id"], "cancelled") for order in stale
+        )
+
+    def archive_finished(self, max_age_days):
+        cutoff = _ago(days=max_age_days)
+        with self.state.lock:
+            finished = [
+                order_id
+                for order_id, order in self.state.orders.items()
+                if order["status"] in order_lifecycle.FINISHED_STATUSES
+                and order["timestamp"] < cutoff
+            ]
+            for order_id in finished:
+                order = self.state.remove(order_id)
+                order.pop("change_seq", None)
+                self.state.archive[order_id] = order
+            return len(finished)
+
+    def delete_all(self):
+        with self.state.lock:
+            for order_id in list(self.state.reservations):
+                self._settle(order_id, "released")
+            for order_id in list(self.state.orders):
+                self.state.remove(order_id)
+            self.state.archive.clear()
+            self.state.events.clear()
+            self.state.reservations.clear()
+            self.state.stats.clear()
+
+
+class MemoryReports(repository.ReportRepository):
+    """Reports over the orders held in memory."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def export(self, since=None, until=None, statuses=None):
+        def match(order):
+            day = order["timestamp"][:10]
+            return (
+                (since is None or day >= since)
+                and (until is None or day <= until)
+                and (not statuses or order["status"] in statuses)
+            )
+
+        with self.state.lock:
+            orders = [
+                Order.from_mapping(order)
+                for order in [
+                    *self.state.orders.values(),
+                    *self.state.archive.values(),
+                ]
+                if match(order)
+            ]
+        orders.sort(key=lambda order: order["id"])
+        yield from orders
+
+    def daily_analytics(self):
+        # analytics loads NumPy, which only the dashboard needs
+        import analytics  # pylint: disable=import-outside-toplevel
+
+        order_rows = []
+        line_rows = []
+        with self.state.lock:
+            for order in [
+                *self.state.orders.values(),
+                *self.state.archive.values(),
+            ]:
+                delivered = [
+                    event["at"]
+                    for event in self.state.events.get(order["id"], [])
+                    if event["step"] == "Delivered" and event["checked"]
+                ]
+                fulfilled = order["status"] == "fulfilled"
+                order_rows.append(
+                    (
+                        order["id"],
+                        analytics.epoch_seconds(order["timestamp"]),
+                        fulfilled,
+                        order["claimed_by"],
+                        (
+                            analytics.epoch_seconds(max(delivered))
+                            if delivered
+                            else None
+                        ),
+                    )
+                )
+                if fulfilled:
+                    line_rows.extend(
+                        (
+                            order["id"],
+                            int(item_id),
+                            details["quantity"],
+                            details["price"],
+                        )
+                        for item_id, details in order["cart"].items()
+                    )
+        return analytics.aggregate_days([order_rows], [line_rows])
+
+
+def create(seed=True):
+    """Returns a Repository whose data lives only in this process.
+
+    With seed, it starts with the sample items and users from
+    database.py.
+    """
+    state = MemoryState(seed)
+    return repository.Repository(
+        items=MemoryItems(state),
+        carts=MemoryCarts(state),
+        users=MemoryUsers(state),
+        favorites=MemoryFavorites(state),
+        orders=MemoryOrders(state),
+        reports=MemoryReports(state),
+    )
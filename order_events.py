@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+order_events.py
+Append-only log of delivery timeline steps
+"""
+
+from datetime import datetime
+
+STEPS = [
+    "Order Accepted",
+    "Venmo Payment Recieved",
+    "Shopping in U-Store",
+    "Checked Out",
+    "On Delivery",
+    "Delivered",
+]
+
+# The latest event for each step decides whether it is checked
+_LATEST_CHECKED = """
+    SELECT checked FROM order_events
+    WHERE order_id = :order_id AND step = {step}
+    ORDER BY id DESC LIMIT 1
+"""
+
+_INSERT_EVENT = """
+    INSERT INTO order_events (order_id, step, checked, actor)
+    SELECT :order_id, :step, :checked, :actor
+    WHERE {condition}
+"""
+
+
+def record_step(cursor, order_id, step, checked, actor):
+    """Appends a check/uncheck event if the step order allows it.
+
+    A step can only be checked once the previous step is checked, and
+    only unchecked while no later step is checked. The rule is part of
+    the INSERT itself, so concurrent updates cannot interleave between
+    the check and the write. A step already in the requested state
+    gets no event. Returns True if the step is now in that state.
+    """
+    step_index = STEPS.index(step)
+    params = {
+        "order_id": order_id,
+        "step": step,
+        "checked": 1 if checked else 0,
+        "actor": actor,
+    }
+    if checked:
+        if step_index == 0:
+            condition = "1"
+        else:
+            params["previous"] = STEPS[step_index - 1]
+            latest = _LATEST_CHECKED.format(step=":previous")
+            condition = f"COALESCE(({latest}), 0) = 1"
+    else:
+        later = STEPS[step_index + 1 :]
+        if not later:
+            condition = "1"
+        else:
+            clauses = []
+            for i, later_step in enumerate(later):
+                params[f"later{i}"] = later_step
+                latest = _LATEST_CHECKED.format(step=f":later{i}")
+                clauses.append(f"COALESCE(({latest}), 0) = 0")
+            condition = " AND ".join(clauses)
+    current = f"COALESCE(({_LATEST_CHECKED.format(step=':step')}), 0)"
+
+    cursor.execute(
+        _INSERT_EVENT.format(
+            condition=f"{current} != :checked AND {condition}"
+        ),
+        params,
+    )
+    if cursor.rowcount == 1:
+        return True
+    (state,) = cursor.execute(f"SELECT {current}", params).fetchone()
+    return state == params["checked"]
+
+
+def fetch_events(cursor, order_id):
+    """Returns all timeline events of an order in the order they happened."""
+    return cursor.execute(
+        """SELECT step, checked, at, actor FROM order_events
+        WHERE order_id = ? ORDER BY id""",
+        (order_id,),
+    ).fetchall()
+
+
+def project_timeline(events):
+    """Folds events into the {step: checked} timeline shown to users."""
+    timeline = {step: False for step in STEPS}
+    for event in events:
+        timeline[event["step"]] = bool(event["checked"])
+    return timeline
+
+
+def project_durations(events, placed_at=None):
+    """Returns seconds spent reaching each checked step.
+
+    Each step is measured from the previous step's completion, and the
+    first step from placed_at when it is given.
+    """
+    checked_at = {}
+    for event in events:
+        if event["checked"]:
+            checked_at[event["step"]] = _parse(event["at"])
+        else:
+            checked_at.pop(event["step"], None)
+
+    durations = {}
+    previous = _parse(placed_at) if placed_at else None
+    for step in STEPS:
+        if step not in checked_at:
+            break
+        if previous is not None:
+            durations[step] = (
+                checked_at[step] - previous
+            ).total_seconds()
+        previous = checked_at[step]
+    return durations
+
+
+def load_timeline(cursor, order_id):
+    """Returns the current {step: checked} timeline of an order."""
+    return project_timeline(fetch_events(cursor, order_id))
+
+
+def _parse(timestamp):
+    """Parses an SQLite CURRENT_TIMESTAMP value."""
+    return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
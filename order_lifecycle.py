@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+order_lifecycle.py
+Order status transitions, expiry of stale orders and archival of
+finished ones
+"""
+
+import inventory
+from config import ORDER_ARCHIVE_DAYS, ORDER_EXPIRY_MINUTES
+from database import get_main_db_connection
+
+# Maps each status to the statuses an order may move to from it.
+# 'fulfilled' -> 'claimed' reopens an order whose "Delivered" step
+# was unchecked by its deliverer.
+TRANSITIONS = {
+    "placed": ("claimed", "declined", "cancelled"),
+    "claimed": ("fulfilled",),
+    "fulfilled": ("claimed",),
+    "declined": (),
+    "cancelled": (),
+}
+
+ACTIVE_STATUSES = ("placed", "claimed")
+
+# Stock bookkeeping run in the same transaction as a transition
+ON_ENTER = {
+    "declined": inventory.release,
+    "cancelled": inventory.release,
+    "fulfilled": inventory.consume,
+}
+
+FINISHED_STATUSES = ("fulfilled", "declined", "cancelled")
+
+# Orders moved to orders_archive per transaction
+ARCHIVE_BATCH_SIZE = 500
+
+
+def sources_for(status):
+    """Returns the statuses from which an order may enter status."""
+    if status not in TRANSITIONS:
+        raise ValueError(f"Unknown order status: {status}")
+    return tuple(
+        source
+        for source, targets in TRANSITIONS.items()
+        if status in targets
+    )
+
+
+def transition(cursor, order_id, status):
+    """Moves an order to status if its current status allows it.
+
+    The check and the write are a single conditional UPDATE, so two
+    concurrent requests cannot both move the same order. Returns True
+    if the order was updated.
+    """
+    sources = sources_for(status)
+    placeholders = ", ".join("?" for _ in sources)
+    cursor.execute(
+        f"""UPDATE orders SET status = ?
+        WHERE id = ? AND status IN ({placeholders})""",
+        (status, order_id, *sources),
+    )
+    if cursor.rowcount != 1:
+        return False
+    if status in ON_ENTER:
+        ON_ENTER[status](cursor, order_id)
+    return True
+
+
+def claim(cursor, order_id, user_id):
+    """Claims a placed order for a deliverer.
+
+    Returns False if the order was already claimed or is no longer
+    available.
+    """
+    cursor.execute(
+        """UPDATE orders SET status = 'claimed', claimed_by = ?
+        WHERE id = ? AND status = 'placed'""",
+        (user_id, order_id),
+    )
+    return cursor.rowcount == 1
+
+
+def expire_stale_orders(max_age_minutes=ORDER_EXPIRY_MINUTES):
+    """Cancels placed orders nobody claimed within max_age_minutes.
+
+    Returns the number of orders cancelled.
+    """
+    conn = get_main_db_connection()
+    cursor = conn.cursor()
+    stale = cursor.execute(
+        """SELECT id FROM orders
+        WHERE status = 'placed' AND timestamp < datetime('now', ?)""",
+        (f"-{int(max_age_minutes)} minutes",),
+    ).fetchall()
+    # Each order goes through transition() so its stock is released
+    expired = sum(
+        transition(cursor, row["id"], "cancelled") for row in stale
+    )
+    conn.commit()
+    conn.close()
+    return expired
+
+
+def archive_finished_orders(max_age_days=ORDER_ARCHIVE_DAYS):
+    """Moves finished orders older than max_age_days to orders_archive.
+
+    Returns the number of orders archived. Order ids are never reused,
+    so an id already in the archive means something is wrong; the
+    insert then fails and the batch is rolled back rather than the
+    order being deleted without a copy.
+    """
+    conn = get_main_db_connection()
+    cursor = conn.cursor()
+    columns = """id, status, timestamp, user_id, total_items, cart,
+        location, claimed_by, building_id, zone_id"""
+    placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+    archived = 0
+    try:
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            ids = [
+                row["id"]
+                for row in cursor.execute(
+                    f"""SELECT id FROM orders
+                    WHERE status IN ({placeholders})
+                    AND timestamp < datetime('now', ?)
+                    ORDER BY id LIMIT ?""",
+                    (
+                        *FINISHED_STATUSES,
+                        f"-{int(max_age_days)} days",
+                        ARCHIVE_BATCH_SIZE,
+                    ),
+                )
+            ]
+            if not ids:
+                conn.rollback()
+                break
+            id_placeholders = ", ".join("?" for _ in ids)
+            cursor.execute(
+                f"""INSERT INTO orders_archive ({columns})
+                SELECT {columns} FROM orders
+                WHERE id IN ({id_placeholders})""",
+                ids,
+            )
+            cursor.execute(
+                f"DELETE FROM orders WHERE id IN ({id_placeholders})",
+                ids,
+            )
+            conn.commit()
+            archived += len(ids)
+    finally:
+        # Closing rolls back a batch left open by an error
+        conn.close()
+    return archived
+
+
+if __name__ == "__main__":
+    print(f"Expired {expire_stale_orders()} stale orders.")
+    print(f"Archived {archive_finished_orders()} finished orders.")
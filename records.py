@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+records.py
+Compact row types for items, orders, cart lines and users, built
+directly from SQLite rows instead of through per-row dicts
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class Record:
+    """A fixed set of named fields stored in slots.
+
+    Records read like the dicts they replace: record["name"],
+    record.get("name"), "name" in record and dict(record) all work, so
+    routes and templates treat both alike. COLUMNS lists the fields a
+    row supplies, in SELECT order; any other slot holds a value routes
+    attach later and is left unset until then.
+    """
+
+    __slots__ = ()
+    COLUMNS = ()
+    FIELDS = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = frozenset(cls.__slots__)
+
+    def __init__(self, *values):
+        for name, value in zip(self.COLUMNS, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, _cursor, row):
+        """Row factory for rows whose columns are COLUMNS, in order."""
+        return cls(*row)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Returns a record holding the fields present in mapping."""
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            if name in mapping:
+                setattr(record, name, mapping[name])
+        return record
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        """Returns the field's value, or default if it is unset."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """Returns the names of the fields that are set."""
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def as_dict(self):
+        """Returns the set fields as a new dict."""
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def copy(self):
+        """Returns a shallow copy."""
+        return self.from_mapping(self)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={value!r}"
+            for name, value in self.as_dict().items()
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class Item(Record):
+    """A catalog item."""
+
+    COLUMNS = ("id", "name", "price", "category")
+    __slots__ = COLUMNS
+
+
+class CartLine(Record):
+    """One item of an order's cart, priced when the order was placed."""
+
+    COLUMNS = ("quantity", "price", "name")
+    __slots__ = COLUMNS
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        # Spelled out for speed, like Order.__init__: every order row
+        # decodes a line per item
+        # pylint: disable=attribute-defined-outside-init
+        line = cls.__new__(cls)
+        if "quantity" in mapping:
+            line.quantity = mapping["quantity"]
+        if "price" in mapping:
+            line.price = mapping["price"]
+        if "name" in mapping:
+            line.name = mapping["name"]
+        return line
+
+
+class User(Record):
+    """A user's public profile."""
+
+    COLUMNS = ("user_id", "name", "venmo_handle")
+    __slots__ = COLUMNS
+
+
+class Order(Record):  # pylint: disable=too-many-instance-attributes
+    """An order; cart maps item ids to CartLines.
+
+    timeline, total and earnings are filled in by the routes that
+    show them.
+    """
+
+    COLUMNS = (
+        "id",
+        "status",
+        "timestamp",
+        "user_id",
+        "total_items",
+        "cart",
+        "location",
+        "claimed_by",
+        "change_seq",
+        "building_id",
+        "zone_id",
+    )
+    __slots__ = COLUMNS + ("timeline", "total", "earnings")
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # pylint: disable=redefined-builtin
+    def __init__(
+        self,
+        id,
+        status,
+        timestamp,
+        user_id,
+        total_items,
+        cart,
+        location,
+        claimed_by,
+        change_seq,
+        building_id,
+        zone_id,
+    ):
+        # Spelled out rather than looping over COLUMNS: this runs for
+        # every order row, and is three times faster this way
+        super().__init__()
+        self.id = id
+        self.status = status
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.total_items = total_items
+        self.cart = cart_lines(cart)
+        self.location = location
+        self.claimed_by = claimed_by
+        self.change_seq = change_seq
+        self.building_id = building_id
+        self.zone_id = zone_id
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        order = super().from_mapping(mapping)
+        if hasattr(order, "cart"):
+            order.cart = cart_lines(order.cart)
+        return order
+
+
+def cart_lines(cart):
+    """Returns {item_id: CartLine} for a cart stored as JSON or dicts."""
+    if isinstance(cart, str) or cart is None:
+        cart = json.loads(cart or "{}")
+    return {
+        item_id: CartLine.from_mapping(line)
+        for item_id, line in cart.items()
+    }
+
+
+def _default(value):
+    """Encodes records as JSON objects."""
+    if isinstance(value, Record):
+        return value.as_dict()
+    return DefaultJSONProvider.default(value)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, extended to encode records."""
+
+    default = staticmethod(_default)
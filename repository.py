@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+repository.py
+Storage interface used by the routes: items, carts, users, favorites,
+orders and admin reports, backed by SQLite or kept in memory
+"""
+
+import importlib
+import threading
+
+from config import STORAGE_BACKEND
+
+# The process-wide Repository, set on first use
+_current = {"repository": None}
+_lock = threading.Lock()
+
+
+class ItemRepository:
+    """The catalog and item stock."""
+
+    def all(self):
+        """Returns {item_id: {"id", "name", "price", "category"}}."""
+        raise NotImplementedError
+
+    def stock(self, item_ids):
+        """Returns {item_id: stock} for the items that exist.
+
+        Stock is None for items that are not tracked.
+        """
+        raise NotImplementedError
+
+    def available_stock(self):
+        """Returns {item_id: stock} for tracked items; may be stale."""
+        raise NotImplementedError
+
+    def set_stock(self, item_id, stock):
+        """Sets an item's stock; None stops tracking it."""
+        raise NotImplementedError
+
+    def catalog_version(self):
+        """Returns a number that changes whenever the catalog does."""
+        raise NotImplementedError
+
+
+class CartRepository:
+    """Each user's cart, {item_id: {"quantity"}}."""
+
+    def get(self, user_id):
+        """Returns the user's cart, or None if the user does not exist."""
+        raise NotImplementedError
+
+    def update(self, user_id, change):
+        """Applies change(cart) to the user's cart atomically.
+
+        change mutates the cart in place. Returns the new cart, or None
+        if the user does not exist.
+        """
+        raise NotImplementedError
+
+    def clear(self, user_id):
+        """Empties the user's cart."""
+        raise NotImplementedError
+
+    def clear_all(self):
+        """Empties every cart."""
+        raise NotImplementedError
+
+
+class UserRepository:
+    """Users and their Venmo handles."""
+
+    def get(self, user_id):
+        """Returns {"user_id", "name", "venmo_handle"}, or None."""
+        raise NotImplementedError
+
+    def get_many(self, user_ids):
+        """Returns {user_id: user} for the users that exist."""
+        raise NotImplementedError
+
+    def get_or_create(self, name):
+        """Returns the id of the user called name, creating them."""
+        raise NotImplementedError
+
+    def names(self, user_ids):
+        """Returns {user_id: name} for the users that exist."""
+        raise NotImplementedError
+
+    def set_venmo_handle(self, user_id, venmo_handle):
+        """Updates the user's Venmo handle."""
+        raise NotImplementedError
+
+
+class FavoriteRepository:
+    """Items each user has marked as favorite."""
+
+    def list(self, user_id):
+        """Returns the user's favorite item ids as strings."""
+        raise NotImplementedError
+
+    def add(self, user_id, item_id):
+        """Marks an item as a favorite of the user."""
+        raise NotImplementedError
+
+    def remove(self, user_id, item_id):
+        """Unmarks an item as a favorite of the user."""
+        raise NotImplementedError
+
+
+class OrderRepository:
+    """Orders, their delivery timelines and per-user statistics.
+
+    Orders are dicts with "id", "status", "timestamp", "user_id",
+    "total_items", "cart" (a dict), "location", "claimed_by",
+    "change_seq", "building_id" and "zone_id". Archived orders have
+    no change_seq.
+    """
+
+    def place(self, user_id, cart, location):
+        """Takes stock for cart and creates a placed order.
+
+        Returns (order_id, None), or (None, item_id) without placing
+        anything if item_id does not have enough stock.
+        """
+        raise NotImplementedError
+
+    def get(self, order_id, include_archived=False):
+        """Returns an order, or None."""
+        raise NotImplementedError
+
+    def latest_for_user(self, user_id, active_only=False):
+        """Returns the user's most recent order, or None."""
+        raise NotImplementedError
+
+    def history(self, user_id):
+        """Returns the user's live and archived orders, newest first."""
+        raise NotImplementedError
+
+    def available(self, zone_id=None):
+        """Returns placed orders, optionally in one zone only."""
+        raise NotImplementedError
+
+    def claimed_by(self, user_id):
+        """Returns the orders the deliverer is currently delivering."""
+        raise NotImplementedError
+
+    def changes_since(self, seq, limit):
+        """Returns up to limit orders changed after seq, oldest first."""
+        raise NotImplementedError
+
+    def latest_change_seq(self):
+        """Returns the sequence number of the most recent change."""
+        raise NotImplementedError
+
+    def removal_seq(self):
+        """Returns the sequence number of the last deletion of a placed
+        or claimed order, which changes_since cannot report."""
+        raise NotImplementedError
+
+    def claim(self, order_id, user_id):
+        """Claims a placed order; returns False if it is taken."""
+        raise NotImplementedError
+
+    def transition(self, order_id, status):
+        """Moves an order to status if allowed; returns True if moved."""
+        raise NotImplementedError
+
+    def events(self, order_id):
+        """Returns the order's timeline events, oldest first."""
+        raise NotImplementedError
+
+    def timeline(self, order_id):
+        """Returns the order's {step: checked} timeline."""
+        raise NotImplementedError
+
+    def record_step(self, order_id, step, checked, actor):
+        """Checks or unchecks a timeline step if the step order allows.
+
+        Checking "Delivered" fulfills the order and unchecking it
+        reopens it. A step already in the requested state is left
+        alone. Returns True if the step is now in that state.
+        """
+        raise NotImplementedError
+
+    def zones(self):
+        """Returns {zone_id: {"id", "name", "x", "y"}}."""
+        raise NotImplementedError
+
+    def stats(self, user_id):
+        """Returns the user's precomputed order statistics, or None."""
+        raise NotImplementedError
+
+    def refresh_stats(self, user_ids):
+        """Recomputes the order statistics of the given users."""
+        raise NotImplementedError
+
+    def expire_stale(self, max_age_minutes):
+        """Cancels old unclaimed orders; returns how many."""
+        raise NotImplementedError
+
+    def archive_finished(self, max_age_days):
+        """Archives old finished orders; returns how many."""
+        raise NotImplementedError
+
+    def delete_all(self):
+        """Deletes every order, returning any stock they held."""
+        raise NotImplementedError
+
+
+class ReportRepository:
+    """Reports over every live and archived order, for admins."""
+
+    def export(self, since=None, until=None, statuses=None):
+        """Yields live and archived orders in id order.
+
+        since and until are ISO days, both included, and statuses a
+        tuple of statuses; None means no limit. Orders are read as
+        they are yielded rather than all at once.
+        """
+        raise NotImplementedError
+
+    def daily_analytics(self):
+        """Returns {ISO day: aggregates} for every day with orders.
+
+        Covers live and archived orders; the aggregates are described
+        in analytics.aggregate_days.
+        """
+        raise NotImplementedError
+
+
+class Repository:  # pylint: disable=too-few-public-methods
+    """One storage backend's repositories, used together."""
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(self, items, carts, users, favorites, orders, reports):
+        self.items = items
+        self.carts = carts
+        self.users = users
+        self.favorites = favorites
+        self.orders = orders
+        self.reports = reports
+
+
+def create(backend):
+    """Returns a new Repository for backend, "sqlite" or "memory"."""
+    if backend not in ("sqlite", "memory"):
+        raise ValueError(f"Unknown storage backend: {backend}")
+    # Backends subclass the interfaces above, so they are looked up by
+    # name rather than imported here
+    return importlib.import_module(f"{backend}_repository").create()
+
+
+def get():
+    """Returns the process-wide Repository chosen by STORAGE_BACKEND."""
+    with _lock:
+        if _current["repository"] is None:
+            _current["repository"] = create(STORAGE_BACKEND)
+        return _current["repository"]
+
+
+def use(repository):
+    """Replaces the process-wide Repository, e.g. in benchmarks."""
+    with _lock:
+        _current["repository"] = repository
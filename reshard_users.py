@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+reshard_users.py
+Moves users, their carts and favorites to the shards they belong on
+for a new number of user database shards
+
+Stop app.py and server.py first: writes made while users are moving
+can be lost. Then restart them with USER_SHARDS set to the new count.
+
+Usage: python reshard_users.py <shards>
+"""
+
+import os
+import sys
+from contextlib import closing
+
+import database
+
+USER_COLUMNS = "user_id, name, venmo_handle, cart, cart_updated_at"
+# Users moved per transaction
+BATCH_SIZE = 500
+
+
+def existing_shards():
+    """Returns the numbers of the shard files that exist."""
+    shards = []
+    while os.path.exists(database.user_shard_path(len(shards))):
+        shards.append(len(shards))
+    return shards
+
+
+def move_users(source, target, user_ids):
+    """Moves users and their favorites from one shard to another.
+
+    The copy is committed first, so running the tool again after
+    an interruption finishes the move without losing anyone.
+    """
+    placeholders = ", ".join("?" for _ in user_ids)
+    with closing(database.get_user_shard_connection(source)) as conn:
+        users = conn.execute(
+            f"SELECT {USER_COLUMNS} FROM users WHERE user_id IN ({placeholders})",
+            user_ids,
+        ).fetchall()
+        favorites = conn.execute(
+            f"SELECT user_id, item_id FROM favorites WHERE user_id IN ({placeholders})",
+            user_ids,
+        ).fetchall()
+
+    with closing(database.get_user_shard_connection(target)) as conn:
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                [tuple(user) for user in users],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO favorites (user_id, item_id) VALUES (?, ?)",
+                [tuple(favorite) for favorite in favorites],
+            )
+
+    with closing(database.get_user_shard_connection(source)) as conn:
+        with conn:
+            conn.execute(
+                f"DELETE FROM favorites WHERE user_id IN ({placeholders})",
+                user_ids,
+            )
+            conn.execute(
+                f"DELETE FROM users WHERE user_id IN ({placeholders})",
+                user_ids,
+            )
+
+
+def reshard(shards):
+    """Moves every user to its shard among shards; returns how many."""
+    sources = existing_shards()
+    database.init_user_db(shards)
+
+    moved = 0
+    for source in sources:
+        with closing(
+            database.get_user_shard_connection(source)
+        ) as conn:
+            user_ids = [
+                row["user_id"]
+                for row in conn.execute("SELECT user_id FROM users")
+            ]
+        groups = database.group_by_shard(user_ids, shards)
+        for target, ids in sorted(groups.items()):
+            if target == source:
+                continue
+            for start in range(0, len(ids), BATCH_SIZE):
+                move_users(
+                    source, target, ids[start : start + BATCH_SIZE]
+                )
+            moved += len(ids)
+            print(
+                f"Moved {len(ids)} users from shard {source} to {target}."
+            )
+
+    for source in sources:
+        if source >= shards:
+            print(
+                f"{database.user_shard_path(source)} is empty and can "
+                "be removed."
+            )
+    return moved
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or not sys.argv[1].isdigit():
+        print("Usage: python reshard_users.py <shards>")
+        sys.exit(1)
+    new_shards = int(sys.argv[1])
+    if new_shards < 1:
+        print("There must be at least one shard.")
+        sys.exit(1)
+    total = reshard(new_shards)
+    print(
+        f"Moved {total} users. Restart app.py and server.py with "
+        f"USER_SHARDS={new_shards}."
+    )
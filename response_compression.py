@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+response_compression.py
+Compresses HTML and JSON responses for clients that accept it
+"""
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always offered
+    brotli = None
+
+# Types worth compressing; built assets come precompressed from assets.py
+COMPRESSIBLE = frozenset(
+    ["text/html", "text/plain", "text/csv", "application/json"]
+)
+
+
+def encoders(level):
+    """Returns [(encoding, compress)] in order of preference."""
+    available = []
+    if brotli is not None:
+        # Brotli's quality runs 0 to 11 where gzip's level runs 1 to 9
+        quality = min(11, level + 1)
+        available.append(
+            ("br", lambda body: brotli.compress(body, quality=quality))
+        )
+    available.append(
+        (
+            "gzip",
+            lambda body: gzip.compress(
+                body, compresslevel=level, mtime=0
+            ),
+        )
+    )
+    return available
+
+
+def init_app(app, min_size, level):
+    """Compresses app's responses of min_size bytes or more.
+
+    The encoding is the first of br and gzip the client accepts.
+    Streamed and file responses are left alone, so exports and static
+    files go out as they are; so are smaller bodies, which would gain
+    less from compression than it costs.
+    """
+    available = encoders(level)
+
+    @app.after_request
+    def compress(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        if len(response.get_data()) < min_size:
+            return response
+        for encoding, encode in available:
+            if request.accept_encodings[encoding]:
+                response.set_data(encode(response.get_data()))
+                response.headers["Content-Encoding"] = encoding
+                # A strong ETag names the exact bytes; a weak one still
+                # matches the same content in any encoding
+                etag, weak = response.get_etag()
+                if etag and not weak:
+                    response.set_etag(etag, weak=True)
+                break
+        return response
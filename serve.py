@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+serve.py
+Runs app.py or server.py under gunicorn: the app is loaded and warmed
+up once before workers are forked, each worker is warmed up before it
+takes traffic, and the worker model is chosen per service
+
+Usage: python serve.py <app | server>
+
+Settings come from config.py: APP_BIND, APP_WORKER_CLASS and
+APP_WORKERS (and the SERVER_ equivalents), WORKER_THREADS,
+WORKER_MAX_REQUESTS and WORKER_WARMUP. Unless ADMISSION_MAX_INFLIGHT
+is set, a service's in-flight cap is its workers times their threads.
+Each service writes its pidfile to RUN_DIR, where deploy.py finds it.
+"""
+
+import importlib
+import os
+import sys
+import time
+
+from gunicorn.app.base import BaseApplication
+
+import admission
+import warmup
+from config import (
+    APP_BIND,
+    APP_WORKER_CLASS,
+    APP_WORKERS,
+    RUN_DIR,
+    SERVER_BIND,
+    SERVER_WORKER_CLASS,
+    SERVER_WORKERS,
+    WORKER_MAX_REQUESTS,
+    WORKER_MAX_REQUESTS_JITTER,
+    WORKER_THREADS,
+    WORKER_WARMUP,
+)
+
+# Module, address, worker settings, warm-up requests and whether it
+# renders templates, for each service; the app's home page only
+# redirects to CAS, which is enough to exercise sessions and routing
+# without calling server.py
+SERVICES = {
+    "app": {
+        "module": "app",
+        "bind": APP_BIND,
+        "worker_class": APP_WORKER_CLASS,
+        "workers": APP_WORKERS,
+        "warmup_paths": ("/",),
+        "templates": True,
+    },
+    "server": {
+        "module": "server",
+        "bind": SERVER_BIND,
+        "worker_class": SERVER_WORKER_CLASS,
+        "workers": SERVER_WORKERS,
+        "warmup_paths": ("/items",),
+        "templates": False,
+    },
+}
+
+
+def worker_count(worker_class, cpus=None):
+    """Returns the workers to run for a worker class.
+
+    Sync workers block on their one request, so there are two per
+    CPU; gthread workers overlap waiting with their threads and need
+    only one per CPU.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    if worker_class == "gthread":
+        return cpus + 1
+    return 2 * cpus + 1
+
+
+def pidfile(service):
+    """Returns the path of service's pidfile."""
+    return os.path.join(RUN_DIR, f"tigercart-{service}.pid")
+
+
+def settings(service):
+    """Returns the gunicorn settings for service."""
+    spec = SERVICES[service]
+    worker_class = spec["worker_class"]
+    options = {
+        "bind": spec["bind"],
+        "worker_class": worker_class,
+        "workers": spec["workers"] or worker_count(worker_class),
+        "preload_app": True,
+        "max_requests": WORKER_MAX_REQUESTS,
+        "max_requests_jitter": WORKER_MAX_REQUESTS_JITTER,
+        "proc_name": f"tigercart-{service}",
+        "pidfile": pidfile(service),
+    }
+    # Gunicorn switches sync workers to gthread when given threads
+    if worker_class == "gthread":
+        options["threads"] = WORKER_THREADS
+    if WORKER_WARMUP:
+        paths = spec["warmup_paths"]
+        options["post_worker_init"] = (
+            lambda worker: warmup.request_paths(worker.wsgi, paths)
+        )
+    return options
+
+
+class Service(BaseApplication):  # pylint: disable=abstract-method
+    """One TigerCart service run by gunicorn."""
+
+    def __init__(self, service):
+        self.service = service
+        self.options = settings(service)
+        # Every request a worker thread can take is allowed in flight,
+        # so load shedding starts only once they are nearly all busy
+        admission.set_capacity(
+            self.options["workers"] * self.options.get("threads", 1)
+        )
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        # Newer gunicorn releases listen on a control socket, which
+        # must not be shared by the two services, nor by the old and
+        # new master of a service while deploy.py reloads it
+        if "control_socket" in self.cfg.settings:
+            self.cfg.set(
+                "control_socket",
+                os.path.join(
+                    RUN_DIR,
+                    f"tigercart-{self.service}-{os.getpid()}.ctl",
+                ),
+            )
+
+    def load(self):
+        start = time.perf_counter()
+        spec = SERVICES[self.service]
+        flask_app = importlib.import_module(spec["module"]).app
+        print(
+            f"Loaded {self.service} in "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+        if WORKER_WARMUP:
+            warmup.prime(
+                flask_app, spec["warmup_paths"], spec["templates"]
+            )
+        return flask_app
+
+
+def main():
+    """Runs the service named on the command line."""
+    if len(sys.argv) != 2 or sys.argv[1] not in SERVICES:
+        print(__doc__.split("\n\n")[1])
+        sys.exit(1)
+    os.makedirs(RUN_DIR, exist_ok=True)
+    Service(sys.argv[1]).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,103 +6,183 @@ Serves data for the TigerCart app.
 
 import json
 from flask import Flask, jsonify, request
-from config import get_debug_mode, SECRET_KEY
-from database import get_main_db_connection, get_user_db_connection
+from config import (
+    get_debug_mode,
+    SECRET_KEY,
+    COMPRESS_MIN_SIZE,
+    COMPRESS_LEVEL,
+)
+import admission
+import etags
+import health
+import repository
+import response_compression
+from records import JSONProvider
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 app.secret_key = SECRET_KEY
 
+# Callers are app.py workers, so users are told apart by the user
+# app.py forwards rather than by address; calls made for no user, such
+# as the catalog refresh during warm-up, share the caller's bucket
+admission.init_app(
+    app,
+    service="server",
+    priorities={
+        "batch_cart": admission.CRITICAL,
+        "accept_delivery": admission.CRITICAL,
+        "decline_delivery": admission.CRITICAL,
+        "get_shopper_timeline": admission.BACKGROUND,
+    },
+    user_key=lambda: request.headers.get(admission.USER_HEADER)
+    or (request.get_json(silent=True) or {}).get(
+        "user_id", request.remote_addr
+    ),
+    route_limits={"get_shopper_timeline": (20.0, 40)},
+)
+health.init_app(app, checks=health.data_checks())
+etags.init_app(app)
+response_compression.init_app(app, COMPRESS_MIN_SIZE, COMPRESS_LEVEL)
+
 
 @app.route("/items", methods=["GET"])
 def get_items():
     """Fetches and returns all items available in the store."""
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-    items = cursor.execute("SELECT * FROM items").fetchall()
-    conn.close()
-
-    items_dict = {str(item["id"]): dict(item) for item in items}
-    return jsonify(items_dict)
+    items = repository.get().items
+    unchanged = etags.check(items.catalog_version())
+    if unchanged:
+        return unchanged
+    return jsonify(items.all())
 
 
 @app.route("/cart", methods=["GET", "POST"])
 def manage_cart():
     """Logic to add/remove items and change quantities"""
+    repo = repository.get()
     data = request.json
     user_id = data.get("user_id")
-    conn = get_user_db_connection()
-    cursor = conn.cursor()
-
-    # Retrieve user's cart
-    user = cursor.execute(
-        "SELECT cart FROM users WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    if user is None:
-        conn.close()
+
+    if request.method == "GET":
+        cart = repo.carts.get(user_id)
+        if cart is None:
+            return jsonify({"error": "User not found"}), 404
+        return jsonify(cart)
+
+    item_id = str(data.get("item_id"))
+    refused = refuse_cart_op(data, repo.items.stock([item_id]))
+    if refused:
+        return refused
+
+    # Modify cart based on action
+    cart = repo.carts.update(
+        user_id,
+        lambda cart: apply_cart_op(
+            cart, item_id, data.get("action"), data.get("quantity", 0)
+        ),
+    )
+    if cart is None:
         return jsonify({"error": "User not found"}), 404
+    return jsonify(cart)
 
-    cart = json.loads(user["cart"]) if user["cart"] else {}
-
-    if request.method == "POST":
-        item_id = str(data.get("item_id"))
-        action = data.get("action")
-
-        # Check if the item exists in inventory
-        item_conn = get_main_db_connection()
-        item_cursor = item_conn.cursor()
-        item_exists = item_cursor.execute(
-            "SELECT 1 FROM items WHERE id = ?", (item_id,)
-        ).fetchone()
-        item_conn.close()
-
-        if not item_exists:
-            conn.close()
-            return (
-                jsonify({"error": "Item not found in inventory"}),
-                404,
-            )
 
-        # Modify cart based on action
-        if action == "add":
-            cart[item_id] = {
-                "quantity": cart.get(item_id, {}).get("quantity", 0) + 1
-            }
-        elif action == "delete":
-            cart.pop(item_id, None)
-        elif action == "update":
-            quantity = data.get("quantity", 0)
-            if quantity > 0:
-                cart[item_id] = {"quantity": quantity}
-            else:
-                cart.pop(item_id, None)
-
-        cursor.execute(
-            "UPDATE users SET cart = ? WHERE user_id = ?",
-            (json.dumps(cart), user_id),
-        )
-        conn.commit()
-        conn.close()
-
-    return jsonify(cart)
+CART_ACTIONS = ("add", "increase", "decrease", "delete", "update")
+# Cart actions refused for sold out items; stock itself is only taken
+# when an order is placed
+ADDING_ACTIONS = ("add", "increase")
+
+
+def refuse_cart_op(op, stock):
+    """Returns the error response for a cart op that cannot be applied,
+    or None if it can; stock is {item_id: stock} of the items in it."""
+    action = op.get("action")
+    quantity = op.get("quantity", 0)
+    item_id = str(op.get("item_id"))
+    if action not in CART_ACTIONS:
+        return jsonify({"error": f"Unknown cart action: {action}"}), 400
+    if action == "update" and (
+        isinstance(quantity, bool)
+        or not isinstance(quantity, int)
+        or quantity < 0
+    ):
+        error = "Quantity must be a non-negative integer"
+        return jsonify({"error": error}), 400
+    if item_id not in stock:
+        return jsonify({"error": "Item not found in inventory"}), 404
+    if lacks_stock(action, quantity, stock[item_id]):
+        return jsonify({"error": "Item is out of stock"}), 409
+    return None
+
+
+def lacks_stock(action, quantity, stock):
+    """True if a cart op asks for more of a tracked item than is left.
+
+    Adding a sold out item is refused, as is an update to more than
+    the stock left.
+    """
+    if stock is None:
+        return False
+    if action in ADDING_ACTIONS:
+        return stock <= 0
+    return action == "update" and quantity > stock
+
+
+def apply_cart_op(cart, item_id, action, quantity=0):
+    """Applies one add/increase/decrease/delete/update op to a cart."""
+    current = cart.get(item_id, {}).get("quantity", 0)
+    if action in ("add", "increase"):
+        quantity = current + 1
+    elif action == "decrease":
+        quantity = current - 1
+    elif action == "delete":
+        quantity = 0
+    elif action != "update":
+        return
+
+    if quantity > 0:
+        cart[item_id] = {"quantity": quantity}
+    else:
+        cart.pop(item_id, None)
+
+
+@app.route("/cart/batch", methods=["POST"])
+def batch_cart():
+    """Applies several cart ops at once and returns the priced cart."""
+    repo = repository.get()
+    data = request.json
+    user_id = data.get("user_id")
+    ops = data.get("ops", [])
+
+    stock = repo.items.stock({str(op.get("item_id")) for op in ops})
+    for op in ops:
+        refused = refuse_cart_op(op, stock)
+        if refused:
+            return refused
+
+    def apply_ops(cart):
+        for op in ops:
+            apply_cart_op(
+                cart,
+                str(op.get("item_id")),
+                op.get("action"),
+                op.get("quantity", 0),
+            )
 
+    cart = repo.carts.update(user_id, apply_ops)
+    if cart is None:
+        return jsonify({"error": "User not found"}), 404
 
-def fetch_user_name(user_id, cursor_users):
-    """Fetches the user name for a given user_id from the users database."""
-    user = cursor_users.execute(
-        "SELECT name FROM users WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    return user["name"] if user else "Unknown User"
+    lines, subtotal = fetch_detailed_cart(cart, repo.items.all())
+    return jsonify({"lines": lines, "subtotal": round(subtotal, 2)})
 
 
-def fetch_detailed_cart(cart, cursor_orders):
+def fetch_detailed_cart(cart, items):
     """Fetches detailed item information for each item in the cart."""
     detailed_cart = {}
     subtotal = 0
 
     for item_id, item_info in cart.items():
-        item_data = cursor_orders.execute(
-            "SELECT name, price FROM items WHERE id = ?", (item_id,)
-        ).fetchone()
+        item_data = items.get(item_id)
         if item_data:
             item_price = item_data["price"]
             quantity = item_info["quantity"]
@@ -121,29 +201,25 @@ def fetch_detailed_cart(cart, cursor_orders):
 
 @app.route("/deliveries", methods=["GET"])
 def get_deliveries():
-    """Fetches and returns all deliveries with user names, item details, and earnings."""
+    """Fetches and returns all deliveries with user names, item details, and earnings.
+
+    An optional zone limits available deliveries to one campus zone.
+    """
+    repo = repository.get()
     deliverer_id = request.json.get("user_id")
-    conn_orders = get_main_db_connection()
-    cursor_orders = conn_orders.cursor()
-    conn_users = get_user_db_connection()
-    cursor_users = conn_users.cursor()
-
-    orders = cursor_orders.execute(
-        """
-        SELECT id, timestamp, user_id, total_items, cart, location, status, claimed_by
-        FROM orders
-        WHERE (status = 'placed' OR (status = 'claimed' AND claimed_by = ?))
-        AND status != 'declined'
-        """,
-        (deliverer_id,),
-    ).fetchall()
+    zone_id = request.json.get("zone")
+
+    orders = repo.orders.available(zone_id) + repo.orders.claimed_by(
+        deliverer_id
+    )
+    items = repo.items.all()
+    user_names = repo.users.names(order["user_id"] for order in orders)
 
     deliveries = {}
     for order in orders:
-        user_name = fetch_user_name(order["user_id"], cursor_users)
-        cart = json.loads(order["cart"])
+        user_name = user_names.get(order["user_id"], "Unknown User")
         detailed_cart, subtotal = fetch_detailed_cart(
-            cart, cursor_orders
+            order["cart"], items
         )
         earnings = round(subtotal * 0.1, 2)
 
@@ -155,28 +231,24 @@ def get_deliveries():
             "total_items": order["total_items"],
             "cart": detailed_cart,
             "location": order["location"],
+            "zone_id": order["zone_id"],
             "subtotal": round(subtotal, 2),
             "earnings": earnings,
         }
 
-    conn_orders.close()
-    conn_users.close()
     return jsonify(deliveries)
 
 
 @app.route("/delivery/<delivery_id>", methods=["GET"])
 def get_delivery(delivery_id):
     """Fetches and returns details of a specific delivery."""
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-    order = cursor.execute(
-        "SELECT id, timestamp, user_id, total_items, cart, location FROM orders WHERE id = ?",
-        (delivery_id,),
-    ).fetchone()
+    repo = repository.get()
+    order = repo.orders.get(delivery_id)
 
     if order:
-        cart_data = json.loads(order["cart"])
-        detailed_cart, subtotal = fetch_detailed_cart(cart_data, cursor)
+        detailed_cart, subtotal = fetch_detailed_cart(
+            order["cart"], repo.items.all()
+        )
         earnings = round(subtotal * 0.1, 2)
 
         delivery = {
@@ -189,10 +261,8 @@ def get_delivery(delivery_id):
             "subtotal": round(subtotal, 2),
             "earnings": earnings,
         }
-        conn.close()
         return jsonify(delivery)
 
-    conn.close()
     return jsonify({"error": "Delivery not found"}), 404
 
 
@@ -200,47 +270,38 @@ def get_delivery(delivery_id):
 def accept_delivery(delivery_id):
     """Marks the delivery as accepted by changing its status."""
     user_id = request.json.get("user_id")
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "UPDATE orders SET status = 'claimed', claimed_by = ? WHERE id = ?",
-        (user_id, delivery_id),
-    )
-    conn.commit()
-    conn.close()
+    claimed = repository.get().orders.claim(delivery_id, user_id)
+    if not claimed:
+        return (
+            jsonify({"error": "Delivery is no longer available"}),
+            409,
+        )
     return jsonify({"success": True}), 200
 
 
 @app.route("/decline_delivery/<delivery_id>", methods=["POST"])
 def decline_delivery(delivery_id):
     """Declines the delivery by updating the status to 'declined'."""
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "UPDATE orders SET status = 'declined' WHERE id = ?",
-        (delivery_id,),
+    declined = repository.get().orders.transition(
+        delivery_id, "declined"
     )
-    conn.commit()
-    conn.close()
+    if not declined:
+        return (
+            jsonify({"error": "Delivery is no longer available"}),
+            409,
+        )
     return jsonify({"success": True}), 200
 
 
 @app.route("/get_shopper_timeline", methods=["GET"])
 def get_shopper_timeline():
     """Get the current timeline status of the shopper's order."""
-    order_id = request.args.get("order_id")
-    conn = get_main_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT timeline FROM orders WHERE id = ?", (order_id,)
-    )
-    timeline_status = cursor.fetchone()
-    conn.close()
+    order_id = request.args.get("order_id", type=int)
+    orders = repository.get().orders
 
-    if timeline_status:
-        return jsonify(timeline=timeline_status["timeline"]), 200
+    if orders.get(order_id):
+        timeline = orders.timeline(order_id)
+        return jsonify(timeline=json.dumps(timeline)), 200
 
     return jsonify({"error": "Order not found"}), 404
 
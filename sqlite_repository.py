@@ -0,0 +1,682 @@
+#!/usr/bin/env python
+"""
+sqlite_repository.py
+Repositories backed by tigercart.sqlite3 and the user database shards
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+
+import generations
+import inventory
+import locations
+import order_events
+import order_lifecycle
+import repository
+from records import Item, Order, User
+from config import (
+    EXPORT_CHUNK_ROWS,
+    ORDER_EXPIRY_MINUTES,
+    USER_PROFILE_CACHE_SIZE,
+    USER_SHARDS,
+)
+from database import (
+    get_main_db_connection,
+    get_user_db_connection,
+    get_user_directory_connection,
+    get_user_shard_connection,
+    group_by_shard,
+)
+
+ORDER_COLUMNS = ", ".join(Order.COLUMNS)
+# all_orders spans the archive, which has no change_seq
+HISTORY_COLUMNS = ORDER_COLUMNS.replace(
+    "change_seq", "NULL AS change_seq"
+)
+
+
+@contextmanager
+def _transaction(connect, *args):
+    """Yields a new connection, committing on success and closing it."""
+    with closing(connect(*args)) as conn:
+        with conn:
+            yield conn
+
+
+def _main_query(sql, params=(), factory=None):
+    """Returns all rows of a read-only query on the main database.
+
+    Rows are built by factory, e.g. Order.from_row, if one is given.
+    """
+    with closing(get_main_db_connection()) as conn:
+        if factory is not None:
+            conn.row_factory = factory
+        return conn.execute(sql, params).fetchall()
+
+
+def _chunks(cursor, sql, params, size):
+    """Yields a query's rows in lists of up to size rows."""
+    cursor.execute(sql, params)
+    while rows := cursor.fetchmany(size):
+        yield rows
+
+
+def _order_query(sql, params=()):
+    """Returns the Orders selected by sql from the main database."""
+    return _main_query(sql, params, factory=Order.from_row)
+
+
+def _user_id(user_id):
+    """Returns user_id as an int, or None if it cannot be one.
+
+    Routes pass ids from request bodies, which may leave them out; a
+    user's shard can only be found from an integer id.
+    """
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _user_query(user_id, sql, params=()):
+    """Returns all rows of a read-only query on user_id's shard."""
+    with closing(get_user_db_connection(user_id)) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def _sharded_query(user_ids, sql, factory=None):
+    """Runs sql once per shard for the user_ids it holds.
+
+    sql has a {placeholders} slot for the shard's user ids. Returns
+    the rows of all shards together, built by factory if given.
+    """
+    rows = []
+    for shard, ids in group_by_shard(set(user_ids)).items():
+        placeholders = ", ".join("?" for _ in ids)
+        with closing(get_user_shard_connection(shard)) as conn:
+            if factory is not None:
+                conn.row_factory = factory
+            rows.extend(
+                conn.execute(
+                    sql.format(placeholders=placeholders), sorted(ids)
+                ).fetchall()
+            )
+    return rows
+
+
+class SQLiteItems(repository.ItemRepository):
+    """Items in the main database."""
+
+    def __init__(self):
+        # Catalog pages show availability from this map instead of
+        # putting stock in the cached catalog
+        self._availability = generations.GenerationCache(
+            generations.STOCK, self._load_available_stock
+        )
+
+    def all(self):
+        # Stock is left out: the catalog is cached per catalog
+        # generation, which stock changes do not bump
+        items = _main_query(
+            f"SELECT {', '.join(Item.COLUMNS)} FROM items",
+            factory=Item.from_row,
+        )
+        return {str(item.id): item for item in items}
+
+    def stock(self, item_ids):
+        item_ids = sorted({str(item_id) for item_id in item_ids})
+        placeholders = ", ".join("?" for _ in item_ids)
+        rows = _main_query(
+            f"SELECT id, stock FROM items WHERE id IN ({placeholders})",
+            item_ids,
+        )
+        return {str(row["id"]): row["stock"] for row in rows}
+
+    def available_stock(self):
+        return self._availability.get()
+
+    @staticmethod
+    def _load_available_stock():
+        """Reads {item_id: stock} for tracked items."""
+        rows = _main_query(
+            "SELECT id, stock FROM items WHERE stock IS NOT NULL"
+        )
+        return {str(row["id"]): row["stock"] for row in rows}
+
+    def set_stock(self, item_id, stock):
+        with _transaction(get_main_db_connection) as conn:
+            conn.execute(
+                "UPDATE items SET stock = ? WHERE id = ?",
+                (stock, item_id),
+            )
+
+    def catalog_version(self):
+        return generations.current(generations.CATALOG)
+
+
+class SQLiteCarts(repository.CartRepository):
+    """Carts stored as JSON on the users table of each shard."""
+
+    def get(self, user_id):
+        user_id = _user_id(user_id)
+        if user_id is None:
+            return None
+        rows = _user_query(
+            user_id,
+            "SELECT cart FROM users WHERE user_id = ?",
+            (user_id,),
+        )
+        if not rows:
+            return None
+        return json.loads(rows[0]["cart"] or "{}")
+
+    def update(self, user_id, change):
+        user_id = _user_id(user_id)
+        if user_id is None:
+            return None
+        with closing(get_user_db_connection(user_id)) as conn:
+            cursor = conn.cursor()
+            # Hold the write lock across read-modify-write so concurrent
+            # updates for the same user cannot lose each other's edits
+            cursor.execute("BEGIN IMMEDIATE")
+            user = cursor.execute(
+                "SELECT cart FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if user is None:
+                conn.rollback()
+                return None
+            cart = json.loads(user["cart"] or "{}")
+            change(cart)
+            cursor.execute(
+                """UPDATE users
+                SET cart = ?, cart_updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?""",
+                (json.dumps(cart), user_id),
+            )
+            conn.commit()
+            return cart
+
+    def clear(self, user_id):
+        with _transaction(get_user_db_connection, user_id) as conn:
+            conn.execute(
+                """UPDATE users
+                SET cart = '{}', cart_updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?""",
+                (user_id,),
+            )
+
+    def clear_all(self):
+        for shard in range(USER_SHARDS):
+            with _transaction(get_user_shard_connection, shard) as conn:
+                conn.execute(
+                    """UPDATE users
+                    SET cart = '{}', cart_updated_at = CURRENT_TIMESTAMP"""
+                )
+
+
+class SQLiteUsers(repository.UserRepository):
+    """Users in the user directory and shards.
+
+    Profiles are kept in a per-process LRU cache, which is emptied
+    whenever any process bumps the users generation.
+    """
+
+    def __init__(self, max_profiles=USER_PROFILE_CACHE_SIZE):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        user_id = _user_id(user_id)
+        if user_id is None:
+            return None
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        user_ids = {int(user_id) for user_id in user_ids}
+        generation = generations.current(generations.USERS)
+        profiles = {}
+        with self._lock:
+            if generation != self._generation:
+                self._profiles.clear()
+                self._generation = generation
+            for user_id in user_ids & self._profiles.keys():
+                self._profiles.move_to_end(user_id)
+                profiles[user_id] = self._profiles[user_id]
+
+        missing = user_ids - profiles.keys()
+        if not missing:
+            return {
+                key: value.copy() for key, value in profiles.items()
+            }
+        users = _sharded_query(
+            missing,
+            f"""SELECT {', '.join(User.COLUMNS)} FROM users
+            WHERE user_id IN ({{placeholders}})""",
+            factory=User.from_row,
+        )
+        loaded = {user.user_id: user for user in users}
+        with self._lock:
+            # Rows read under an older generation may be stale already
+            if generation == self._generation:
+                self._profiles.update(loaded)
+                while len(self._profiles) > self.max_profiles:
+                    self._profiles.popitem(last=False)
+        profiles.update(loaded)
+        # Callers get copies so they cannot change the cached profiles
+        return {key: value.copy() for key, value in profiles.items()}
+
+    def get_or_create(self, name):
+        lookup = "SELECT user_id FROM user_directory WHERE name = ?"
+        with _transaction(get_user_directory_connection) as conn:
+            user = conn.execute(lookup, (name,)).fetchone()
+            if user is None:
+                # Only first logins write to the directory; OR IGNORE
+                # lets two of them for the same name share one id
+                conn.execute(
+                    "INSERT OR IGNORE INTO user_directory (name) VALUES (?)",
+                    (name,),
+                )
+                user = conn.execute(lookup, (name,)).fetchone()
+        user_id = user["user_id"]
+
+        # Checked on every login, so a login that failed between the
+        # directory and the shard is repaired by the next one
+        if not _user_query(
+            user_id, "SELECT 1 FROM users WHERE user_id = ?", (user_id,)
+        ):
+            with _transaction(get_user_db_connection, user_id) as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (user_id, name) VALUES (?, ?)",
+                    (user_id, name),
+                )
+        return user_id
+
+    def names(self, user_ids):
+        return {
+            user_id: profile["name"]
+            for user_id, profile in self.get_many(user_ids).items()
+        }
+
+    def set_venmo_handle(self, user_id, venmo_handle):
+        with _transaction(get_user_db_connection, user_id) as conn:
+            conn.execute(
+                "UPDATE users SET venmo_handle = ? WHERE user_id = ?",
+                (venmo_handle, user_id),
+            )
+        # Written through so this process shows the new handle at once;
+        # other processes drop their caches when the generation moves
+        with self._lock:
+            profile = self._profiles.get(int(user_id))
+            if profile is not None:
+                profile["venmo_handle"] = venmo_handle
+        # Users live on the shards; their generation is kept with the
+        # others in the main database
+        with _transaction(get_main_db_connection) as conn:
+            generations.bump(conn.cursor(), generations.USERS)
+
+
+class SQLiteFavorites(repository.FavoriteRepository):
+    """Favorites, kept on the same shard as their user."""
+
+    def list(self, user_id):
+        user_id = _user_id(user_id)
+        if user_id is None:
+            return []
+        rows = _user_query(
+            user_id,
+            "SELECT item_id FROM favorites WHERE user_id = ?",
+            (user_id,),
+        )
+        return [str(row["item_id"]) for row in rows]
+
+    def add(self, user_id, item_id):
+        with _transaction(get_user_db_connection, user_id) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO favorites (user_id, item_id) VALUES (?, ?)",
+                (user_id, item_id),
+            )
+
+    def remove(self, user_id, item_id):
+        with _transaction(get_user_db_connection, user_id) as conn:
+            conn.execute(
+                "DELETE FROM favorites WHERE user_id = ? AND item_id = ?",
+                (user_id, item_id),
+            )
+
+
+class SQLiteOrders(repository.OrderRepository):
+    """Orders, timeline events and statistics in the main database."""
+
+    def place(self, user_id, cart, location):
+        total_items = sum(
+            details["quantity"] for details in cart.values()
+        )
+        with closing(get_main_db_connection()) as conn:
+            cursor = conn.cursor()
+            # Keep the text as typed (it has room numbers) alongside the
+            # building and zone it names, which the dispatch board
+            # filters on
+            building_id, zone_id = locations.normalize_location(
+                cursor, location
+            )
+            # Stock is taken and the order inserted in one transaction,
+            # so a sold out item leaves neither behind
+            cursor.execute("BEGIN IMMEDIATE")
+            sold_out = inventory.take_stock(cursor, cart)
+            if sold_out is not None:
+                conn.rollback()
+                return None, sold_out
+
+            # The timeline starts empty; steps are recorded in
+            # order_events
+            cursor.execute(
+                """INSERT INTO orders
+                (status, user_id, total_items, cart, location, building_id,
+                zone_id) VALUES ('placed', ?, ?, ?, ?, ?, ?)""",
+                (
+                    user_id,
+                    total_items,
+                    json.dumps(cart),
+                    location,
+                    building_id,
+                    zone_id,
+                ),
+            )
+            order_id = cursor.lastrowid
+            inventory.record_reservations(cursor, order_id, cart)
+            conn.commit()
+            return order_id, None
+
+    def get(self, order_id, include_archived=False):
+        if include_archived:
+            rows = _order_query(
+                f"SELECT {HISTORY_COLUMNS} FROM all_orders WHERE id = ?",
+                (order_id,),
+            )
+        else:
+            rows = _order_query(
+                f"SELECT {ORDER_COLUMNS} FROM orders WHERE id = ?",
+                (order_id,),
+            )
+        return rows[0] if rows else None
+
+    def latest_for_user(self, user_id, active_only=False):
+        active = (
+            "AND status IN ('placed', 'claimed')" if active_only else ""
+        )
+        rows = _order_query(
+            f"""SELECT {ORDER_COLUMNS} FROM orders
+            WHERE user_id = ? {active}
+            ORDER BY timestamp DESC LIMIT 1""",
+            (user_id,),
+        )
+        return rows[0] if rows else None
+
+    def history(self, user_id):
+        rows = _order_query(
+            f"""SELECT {HISTORY_COLUMNS} FROM all_orders
+            WHERE user_id = ? ORDER BY timestamp DESC""",
+            (user_id,),
+        )
+        return rows
+
+    def available(self, zone_id=None):
+        if zone_id:
+            rows = _order_query(
+                f"""SELECT {ORDER_COLUMNS} FROM orders
+                WHERE status = 'placed' AND zone_id = ?""",
+                (zone_id,),
+            )
+        else:
+            rows = _order_query(
+                f"SELECT {ORDER_COLUMNS} FROM orders WHERE status = 'placed'"
+            )
+        return rows
+
+    def claimed_by(self, user_id):
+        rows = _order_query(
+            f"""SELECT {ORDER_COLUMNS} FROM orders
+            WHERE status = 'claimed' AND claimed_by = ?""",
+            (user_id,),
+        )
+        return rows
+
+    def changes_since(self, seq, limit):
+        rows = _order_query(
+            f"""SELECT {ORDER_COLUMNS} FROM orders WHERE change_seq > ?
+            ORDER BY change_seq LIMIT ?""",
+            (seq, limit),
+        )
+        return rows
+
+    def latest_change_seq(self):
+        rows = _main_query(
+            "SELECT seq FROM order_change_seq WHERE id = 1"
+        )
+        return rows[0]["seq"] if rows else 0
+
+    def removal_seq(self):
+        rows = _main_query(
+            "SELECT removal_seq FROM order_change_seq WHERE id = 1"
+        )
+        return rows[0]["removal_seq"] if rows else 0
+
+    def claim(self, order_id, user_id):
+        with _transaction(get_main_db_connection) as conn:
+            return order_lifecycle.claim(
+                conn.cursor(), order_id, user_id
+            )
+
+    def transition(self, order_id, status):
+        with _transaction(get_main_db_connection) as conn:
+            return order_lifecycle.transition(
+                conn.cursor(), order_id, status
+            )
+
+    def events(self, order_id):
+        with closing(get_main_db_connection()) as conn:
+            rows = order_events.fetch_events(conn.cursor(), order_id)
+        return [dict(row) for row in rows]
+
+    def timeline(self, order_id):
+        return order_events.project_timeline(self.events(order_id))
+
+    def record_step(self, order_id, step, checked, actor):
+        with _transaction(get_main_db_connection) as conn:
+            cursor = conn.cursor()
+            # The sequential-step rule is enforced by the insert itself
+            if not order_events.record_step(
+                cursor, order_id, step, checked, actor
+            ):
+                return False
+            if step == "Delivered":
+                order_lifecycle.transition(
+                    cursor,
+                    order_id,
+                    "fulfilled" if checked else "claimed",
+                )
+            return True
+
+    def zones(self):
+        with closing(get_main_db_connection()) as conn:
+            return locations.get_zones(conn.cursor())
+
+    def stats(self, user_id):
+        rows = _main_query(
+            """SELECT total_orders, total_items, total_spent
+            FROM user_stats WHERE user_id = ?""",
+            (user_id,),
+        )
+        return dict(rows[0]) if rows else None
+
+    def refresh_stats(self, user_ids):
+        user_ids = sorted(set(user_ids))
+        placeholders = ", ".join("?" for _ in user_ids)
+        with _transaction(get_main_db_connection) as conn:
+            conn.execute(
+                f"""
+                INSERT INTO user_stats
+                (user_id, total_orders, total_items, total_spent, updated_at)
+                SELECT user_id, COUNT(*), COALESCE(SUM(total_items), 0),
+                ROUND(COALESCE(SUM((
+                    SELECT SUM(json_extract(value, '$.quantity')
+                    * json_extract(value, '$.price'))
+                    FROM json_each(all_orders.cart)
+                )), 0), 2), CURRENT_TIMESTAMP
+                FROM all_orders WHERE user_id IN ({placeholders})
+                GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET
+                total_orders = excluded.total_orders,
+                total_items = excluded.total_items,
+                total_spent = excluded.total_spent,
+                updated_at = excluded.updated_at
+                """,
+                user_ids,
+            )
+
+    def expire_stale(self, max_age_minutes):
+        return order_lifecycle.expire_stale_orders(max_age_minutes)
+
+    def archive_finished(self, max_age_days):
+        return order_lifecycle.archive_finished_orders(max_age_days)
+
+    def delete_all(self):
+        with _transaction(get_main_db_connection) as conn:
+            cursor = conn.cursor()
+            held = cursor.execute(
+                """SELECT DISTINCT order_id FROM stock_reservations
+                WHERE status = 'held'"""
+            ).fetchall()
+            for row in held:
+                inventory.release(cursor, row["order_id"])
+            for table in (
+                "stock_reservations",
+                "order_events",
+                "user_stats",
+                "analytics_days",
+                "orders_archive",
+                "orders",
+            ):
+                cursor.execute(f"DELETE FROM {table}")
+
+
+class SQLiteReports(repository.ReportRepository):
+    """Reports read from the main database."""
+
+    def export(self, since=None, until=None, statuses=None):
+        conditions = []
+        params = []
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp < date(?, '+1 day')")
+            params.append(until)
+        if statuses:
+            placeholders = ", ".join("?" for _ in statuses)
+            conditions.append(f"status IN ({placeholders})")
+            params.extend(statuses)
+        where = (
+            f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        )
+        with closing(get_main_db_connection()) as conn:
+            conn.row_factory = Order.from_row
+            # Ordered by id, which both tables are stored by, so
+            # SQLite merges them without sorting the whole result
+            for rows in _chunks(
+                conn.cursor(),
+                f"SELECT {HISTORY_COLUMNS} FROM all_orders {where} "
+                "ORDER BY id",
+                params,
+                EXPORT_CHUNK_ROWS,
+            ):
+                yield from rows
+
+    def daily_analytics(self):
+        # analytics loads NumPy, which only the dashboard needs
+        import analytics  # pylint: disable=import-outside-toplevel
+
+        with closing(get_main_db_connection()) as conn:
+            conn.row_factory = None
+            # One read transaction, so lines match the orders read
+            conn.execute("BEGIN")
+            days = {
+                day: json.loads(aggregates)
+                for day, aggregates in conn.execute(
+                    "SELECT day, aggregates FROM analytics_days"
+                )
+            }
+            # Past days are cached, and later calls start from the day
+            # after the last one. A day with an order placed or claimed
+            # within the expiry window is still moving; older ones that
+            # never finish do not hold it back, as the status trigger
+            # drops the day if they finish later
+            start, settled = conn.execute(
+                """SELECT
+                (SELECT date(MAX(day), '+1 day') FROM analytics_days),
+                MIN(date('now'), COALESCE(
+                    (SELECT date(MIN(timestamp)) FROM orders
+                    WHERE status IN ('placed', 'claimed')
+                    AND timestamp >= datetime('now', ?)),
+                    date('now')
+                ))""",
+                (f"-{ORDER_EXPIRY_MINUTES} minutes",),
+            ).fetchone()
+            start = start or ""
+            fresh = analytics.aggregate_days(
+                _chunks(
+                    conn.cursor(),
+                    """SELECT id, CAST(strftime('%s', timestamp) AS INTEGER),
+                    status = 'fulfilled', claimed_by, (
+                        SELECT CAST(strftime('%s', MAX(at)) AS INTEGER)
+                        FROM order_events
+                        WHERE order_id = all_orders.id
+                        AND step = 'Delivered' AND checked = 1
+                    )
+                    FROM all_orders WHERE timestamp >= ?""",
+                    (start,),
+                    analytics.CHUNK_ROWS,
+                ),
+                _chunks(
+                    conn.cursor(),
+                    """SELECT all_orders.id, CAST(line.key AS INTEGER),
+                    json_extract(line.value, '$.quantity'),
+                    json_extract(line.value, '$.price')
+                    FROM all_orders, json_each(all_orders.cart) AS line
+                    WHERE timestamp >= ? AND status = 'fulfilled'""",
+                    (start,),
+                    analytics.CHUNK_ROWS,
+                ),
+            )
+            conn.rollback()
+
+        settled_days = [
+            (day, json.dumps(aggregates))
+            for day, aggregates in fresh.items()
+            if day < settled
+        ]
+        if settled_days:
+            with _transaction(get_main_db_connection) as conn:
+                conn.executemany(
+                    """INSERT OR REPLACE INTO analytics_days
+                    (day, aggregates) VALUES (?, ?)""",
+                    settled_days,
+                )
+        days.update(fresh)
+        return days
+
+
+def create():
+    """Returns a Repository over the SQLite databases."""
+    return repository.Repository(
+        items=SQLiteItems(),
+        carts=SQLiteCarts(),
+        users=SQLiteUsers(),
+        favorites=SQLiteFavorites(),
+        orders=SQLiteOrders(),
+        reports=SQLiteReports(),
+    )
@@ -8,8 +8,12 @@
 cd /home/app/tigercart
 . tigercart_env/bin/activate
 
-# Start server.py on port 5150
-gunicorn --bind 127.0.0.1:5150 server:app --workers 5 &
+# Start the background job worker
+python3 worker.py &
+
+# Start server.py on port 5150; serve.py sizes, preloads and warms up
+# the gunicorn workers of each service
+python3 serve.py server &
 
 # Start app.py on port 8000
-gunicorn --bind 127.0.0.1:8000 app:app --workers 5
+python3 serve.py app
@@ -16,6 +16,12 @@ function addToCart(itemId) {
         body: JSON.stringify({ user_id: userId })  // Ensure userId is available globally
     }).then(response => {
         if (response.ok) {
+            response.json().then(cart => {
+                const badge = document.querySelector(`.cart-badge[data-item-id="${itemId}"]`);
+                if (badge && cart[itemId]) {
+                    setCartBadge(badge, cart[itemId].quantity);
+                }
+            });
             alert('Item added to cart!');
         } else {
             response.json().then(data => alert('Error: ' + data.error));
@@ -26,34 +32,150 @@ function addToCart(itemId) {
     });
 }
 
-function updateQuantity(itemId, action) {
-    fetch(`/update_cart/${itemId}/${action}`, {
+// Applies per-user state over a cached catalog table
+function applyCatalogOverlay(favorites, cartCounts, stock) {
+    document.querySelectorAll('.favorite-toggle').forEach(button => {
+        setFavorite(button, favorites.includes(button.dataset.itemId));
+    });
+    document.querySelectorAll('.cart-badge').forEach(badge => {
+        setCartBadge(badge, cartCounts[badge.dataset.itemId] || 0);
+    });
+    document.querySelectorAll('.stock-badge').forEach(badge => {
+        setStockBadge(badge, stock[badge.dataset.itemId]);
+    });
+}
+
+// Items missing from the stock map are not tracked and never run out
+function setStockBadge(badge, remaining) {
+    const button = document.querySelector(
+        `.add-to-cart[data-item-id="${badge.dataset.itemId}"]`
+    );
+    if (remaining === undefined || remaining === null) {
+        badge.textContent = '';
+        return;
+    }
+    if (button) {
+        button.disabled = remaining <= 0;
+    }
+    if (remaining <= 0) {
+        badge.textContent = 'Sold out';
+    } else if (remaining <= 5) {
+        badge.textContent = `Only ${remaining} left`;
+    } else {
+        badge.textContent = '';
+    }
+}
+
+function setFavorite(button, favorite) {
+    button.dataset.favorite = favorite;
+    button.textContent = favorite ? '★' : '☆';
+}
+
+function setCartBadge(badge, quantity) {
+    badge.textContent = quantity > 0 ? `(${quantity} in cart)` : '';
+}
+
+function toggleFavorite(button) {
+    const itemId = button.dataset.itemId;
+    const favorite = button.dataset.favorite !== 'true';
+    const action = favorite ? 'add_favorite' : 'remove_favorite';
+    fetch(`/${action}/${itemId}`, { method: 'POST' })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                setFavorite(button, favorite);
+            }
+        })
+        .catch(error => console.error('Error updating favorite:', error));
+}
+
+// Cart edits are queued and sent as one batch once clicking pauses
+const CART_BATCH_DELAY = 400;
+let pendingCartOps = [];
+let cartBatchTimer = null;
+
+function queueCartOp(op) {
+    pendingCartOps.push(op);
+    clearTimeout(cartBatchTimer);
+    cartBatchTimer = setTimeout(flushCartOps, CART_BATCH_DELAY);
+}
+
+function flushCartOps() {
+    const ops = pendingCartOps;
+    pendingCartOps = [];
+    if (ops.length === 0) {
+        return;
+    }
+    fetch('/cart/batch', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ user_id: userId })  // Ensure userId is globally defined
+        body: JSON.stringify({ ops: ops })
     })
     .then(response => response.json())
     .then(cart => {
-        location.reload();  // Refresh to reflect the updated cart view
+        if (cart.error) {
+            throw new Error(cart.error);
+        }
+        renderCart(cart);
     })
     .catch(error => {
-        console.error('Error updating quantity:', error);
-        alert('Failed to update item quantity.');
+        console.error('Error updating cart:', error);
+        alert('Failed to update the cart.');
+        location.reload();  // Show the cart as the server has it
+    });
+}
+
+// Edits still queued when the page is left are sent as a beacon, which
+// the browser delivers after the page is gone
+window.addEventListener('pagehide', () => {
+    clearTimeout(cartBatchTimer);
+    const ops = pendingCartOps;
+    pendingCartOps = [];
+    if (ops.length > 0) {
+        const body = new Blob([JSON.stringify({ ops: ops })], { type: 'application/json' });
+        navigator.sendBeacon('/cart/batch', body);
+    }
+});
+
+// Patches quantities and totals in place from a /cart/batch response
+function renderCart(cart) {
+    document.querySelectorAll('tr[data-cart-item]').forEach(row => {
+        const line = cart.lines[row.dataset.cartItem];
+        if (line) {
+            row.querySelector('.cart-quantity').textContent = line.quantity;
+        } else {
+            row.remove();
+        }
     });
+    document.getElementById('cart-subtotal').textContent = cart.subtotal.toFixed(2);
+    document.getElementById('cart-delivery-fee').textContent = cart.delivery_fee.toFixed(2);
+    document.getElementById('cart-total').textContent = cart.total.toFixed(2);
+}
+
+function updateQuantity(itemId, action) {
+    // Show the new quantity right away; the batch response confirms it
+    const row = document.querySelector(`tr[data-cart-item="${itemId}"]`);
+    if (row) {
+        const cell = row.querySelector('.cart-quantity');
+        const quantity = Number(cell.textContent) + (action === 'increase' ? 1 : -1);
+        if (quantity > 0) {
+            cell.textContent = quantity;
+        } else {
+            row.style.display = 'none';
+        }
+    }
+    queueCartOp({ item_id: itemId, action: action });
 }
 
 function deleteItem(itemId) {
     if (confirm('Are you sure you want to remove this item from your cart?')) {
-        fetch(`/delete_item/${itemId}`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ user_id: userId })
-        }).then(response => response.json())
-          .then(cart => location.reload());  // Refresh to reflect updated cart view
+        const row = document.querySelector(`tr[data-cart-item="${itemId}"]`);
+        if (row) {
+            row.style.display = 'none';
+        }
+        queueCartOp({ item_id: itemId, action: 'delete' });
     }
 }
 
@@ -80,7 +202,9 @@ function placeOrder(itemsInCart) {
                 alert('Order placed successfully!');
                 window.location.href = '/shopper_timeline'; // change to /shopper_timeline
             } else {
-                alert('Failed to place the order.');
+                response.json()
+                    .then(data => alert(data.error || 'Failed to place the order.'))
+                    .catch(() => alert('Failed to place the order.'));
             }
         });
     } else {
@@ -124,3 +248,25 @@ function markStepComplete(stepId) {
     buttonElement.textContent = 'Completed';
     buttonElement.style.backgroundColor = 'green';
 }
+
+function toggleDropdown() {
+    const profileMenu = document.querySelector('.profile');
+    profileMenu.classList.toggle('open');
+}
+
+window.onclick = function(event) {
+    if (!event.target.matches('.profile-icon') && !event.target.closest('.profile')) {
+        const profileMenu = document.querySelector('.profile');
+        if (profileMenu.classList.contains('open')) {
+            profileMenu.classList.remove('open');
+        }
+    }
+}
+
+function goBack() {
+    if (document.referrer && document.referrer.includes(window.location.hostname)) {
+        window.history.back();
+    } else {
+        window.location.href = homeUrl;
+    }
+}
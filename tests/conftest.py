@@ -0,0 +1,158 @@
+"""
+conftest.py
+Fixtures giving every test its own databases, and app.py talking to
+server.py in-process instead of over HTTP
+
+Run with: python -m pytest [--database=file]
+
+Each test runs against both storage backends. Its SQLite databases
+are in memory, or with --database=file in files under its tmp_path,
+so tests never touch the databases next to the code and can run in
+parallel.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import uuid
+
+import pytest
+
+# Modules read these when imported, before any fixture runs
+_scratch = tempfile.mkdtemp(prefix="tigercart-tests-")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+os.environ.update(
+    MAIN_DATABASE="file:tigercart?mode=memory&cache=shared",
+    USER_DATABASE="file:users?mode=memory&cache=shared",
+    ADMISSION_DATABASE=os.path.join(_scratch, "admission.sqlite3"),
+    JOBS_DATABASE=os.path.join(_scratch, "jobs.sqlite3"),
+    CATALOG_SNAPSHOT=os.path.join(_scratch, "catalog_snapshot.json"),
+    TEMPLATE_CACHE_DIR=os.path.join(_scratch, "templates"),
+    RUN_DIR=_scratch,
+)
+
+# pylint: disable=wrong-import-position,redefined-outer-name
+import admission
+import app as app_module
+import backend
+import database
+import jobs
+import repository
+import server
+from config import USER_SHARDS
+from fragment_cache import fragments
+
+
+def pytest_addoption(parser):
+    """Adds --database to pytest's options."""
+    parser.addoption(
+        "--database",
+        choices=("memory", "file"),
+        default="memory",
+        help="keep each test's SQLite databases in memory or in files",
+    )
+
+
+class InProcessResponse:  # pylint: disable=too-few-public-methods
+    """The parts of a requests response app.py uses, over a Flask
+    test client response."""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.response = response
+
+    def json(self):
+        """Returns the decoded JSON body."""
+        return self.response.get_json()
+
+
+@pytest.fixture(autouse=True, params=("sqlite", "memory"))
+def repo(request, tmp_path, monkeypatch):
+    """Gives the test fresh databases and a fresh Repository on the
+    backend it runs against, and returns the Repository."""
+    if request.config.getoption("--database") == "file":
+        main = str(tmp_path / "tigercart.sqlite3")
+        users = str(tmp_path / "users.sqlite3")
+    else:
+        name = uuid.uuid4().hex
+        main = f"file:tigercart-{name}?mode=memory&cache=shared"
+        users = f"file:users-{name}?mode=memory&cache=shared"
+    monkeypatch.setattr(database, "MAIN_DATABASE", main)
+    monkeypatch.setattr(database, "USER_DATABASE", users)
+    monkeypatch.setattr(
+        admission,
+        "ADMISSION_DATABASE",
+        str(tmp_path / "admission.sqlite3"),
+    )
+    monkeypatch.setattr(
+        jobs, "JOBS_DATABASE", str(tmp_path / "jobs.sqlite3")
+    )
+    monkeypatch.setattr(
+        backend,
+        "CATALOG_SNAPSHOT",
+        str(tmp_path / "catalog_snapshot.json"),
+    )
+
+    database.init_all()
+
+    # Caches that outlive a request are keyed by generations, which
+    # start over in every test's databases
+    monkeypatch.setattr(
+        backend, "_snapshot", {"version": None, "items": None}
+    )
+    monkeypatch.setattr(
+        backend,
+        "breaker",
+        backend.CircuitBreaker(
+            backend.breaker.failure_threshold,
+            backend.breaker.reset_seconds,
+        ),
+    )
+    fragments.clear()
+    test_repo = repository.create(request.param)
+    repository.use(test_repo)
+
+    yield test_repo
+
+    repository.use(None)
+    database.close_memory_database(main)
+    for shard in range(USER_SHARDS):
+        database.close_memory_database(database.user_shard_path(shard))
+
+
+@pytest.fixture
+def server_client():
+    """Returns a test client for server.py."""
+    return server.app.test_client()
+
+
+@pytest.fixture
+def app_client(server_client, monkeypatch):
+    """Returns a test client for app.py whose calls to the data server
+    are served by server_client."""
+
+    def send(method, url, timeout=None, **kwargs):
+        del timeout
+        path = url.removeprefix(backend.SERVER_URL)
+        return InProcessResponse(
+            server_client.open(path, method=method, **kwargs)
+        )
+
+    monkeypatch.setattr(backend, "transport", send)
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def login(repo):
+    """Returns a function logging a client in as a CAS username, as
+    auth.authenticate does; it returns the user's id."""
+
+    def log_in(client, username):
+        user_id = repo.users.get_or_create(username)
+        with client.session_transaction() as session:
+            session["username"] = username
+            session["user_id"] = user_id
+        return user_id
+
+    return log_in
@@ -0,0 +1,74 @@
+"""
+test_admission.py
+In-flight accounting and the pruning of the admission store
+"""
+
+# pylint: disable=missing-function-docstring,protected-access
+
+import sqlite3
+import time
+
+import pytest
+
+import admission
+
+
+@pytest.fixture(autouse=True)
+def slots(monkeypatch):
+    """Gives each test an empty in-flight count and two slots."""
+    monkeypatch.setattr(admission, "_inflight", {})
+    monkeypatch.setattr(admission, "_pruned", {"at": 0.0})
+    monkeypatch.setattr(admission, "_max_inflight", 2)
+
+
+def stored_count(service):
+    conn = admission._connect()
+    return conn.execute(
+        "SELECT count FROM inflight WHERE service = ?", (service,)
+    ).fetchone()[0]
+
+
+def admit(user_key):
+    return admission.admit(
+        "test", "endpoint", admission.CRITICAL, user_key
+    )
+
+
+def test_failed_release_does_not_leak_a_slot(monkeypatch):
+    assert admit("a") is None
+    write = admission._write_inflight
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(admission, "_write_inflight", locked)
+    with pytest.raises(sqlite3.Error):
+        admission.release("test")
+
+    # The next write stores the count the process really has
+    monkeypatch.setattr(admission, "_write_inflight", write)
+    assert admit("b") is None
+    assert stored_count("test") == 1
+    assert admit("c") is None
+    assert admit("d") == (503, 1)
+
+
+def test_idle_buckets_and_gone_workers_are_pruned():
+    conn = admission._connect()
+    long_ago = time.time() - admission.IDLE_BUCKET_SECONDS - 1
+    conn.execute(
+        "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+        ("test:user:idle:0", 1.0, long_ago),
+    )
+    conn.execute(
+        """INSERT INTO inflight (service, pid, count, seen)
+        VALUES ('test', -1, 3, ?)""",
+        (long_ago,),
+    )
+    conn.commit()
+
+    assert admit("a") is None
+    keys = [row[0] for row in conn.execute("SELECT key FROM buckets")]
+    assert keys == ["test:user:a:0"]
+    pids = [row[0] for row in conn.execute("SELECT pid FROM inflight")]
+    assert -1 not in pids
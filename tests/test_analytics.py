@@ -0,0 +1,59 @@
+"""
+test_analytics.py
+Daily dashboard aggregates and the cache of past days
+"""
+
+# pylint: disable=missing-function-docstring
+
+from contextlib import closing
+
+import pytest
+
+import database
+from memory_repository import MemoryOrders
+
+CART = {"1": {"quantity": 2, "price": 1.09, "name": "Coke"}}
+DAY = "2000-01-01"
+
+
+def backdate(repo, order_id):
+    """Moves an order back to DAY, long past the expiry window."""
+    placed_at = f"{DAY} 12:00:00"
+    if isinstance(repo.orders, MemoryOrders):
+        repo.orders.state.orders[order_id]["timestamp"] = placed_at
+        return
+    with closing(database.get_main_db_connection()) as conn:
+        conn.execute(
+            "UPDATE orders SET timestamp = ? WHERE id = ?",
+            (placed_at, order_id),
+        )
+        conn.commit()
+
+
+def cached_days(repo):
+    if isinstance(repo.orders, MemoryOrders):
+        return None
+    with closing(database.get_main_db_connection()) as conn:
+        return [
+            row["day"]
+            for row in conn.execute("SELECT day FROM analytics_days")
+        ]
+
+
+def test_abandoned_claim_does_not_keep_days_out_of_the_cache(repo):
+    shopper = repo.users.get_or_create("Jacob")
+    deliverer = repo.users.get_or_create("Alex")
+    order_id, _ = repo.orders.place(shopper, CART, "Frist")
+    repo.orders.claim(order_id, deliverer)
+    backdate(repo, order_id)
+
+    day = repo.reports.daily_analytics()[DAY]
+    assert (day["orders"], day["fulfilled"]) == (1, 0)
+    assert cached_days(repo) in (None, [DAY])
+
+    # Finishing it after all drops the cached day
+    repo.orders.transition(order_id, "fulfilled")
+    day = repo.reports.daily_analytics()[DAY]
+    assert day["fulfilled"] == 1
+    assert day["revenue"] == pytest.approx(2.18)
+    assert day["deliverers"][str(deliverer)][0] == 1
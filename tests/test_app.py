@@ -0,0 +1,399 @@
+"""
+test_app.py
+Routes of app.py, with server.py answering its data requests
+"""
+
+# pylint: disable=missing-function-docstring
+
+import gzip
+from contextlib import closing
+
+import admission
+import app as app_module
+import backend
+import database
+import order_events
+from fragment_cache import fragments
+from memory_repository import MemoryItems
+
+
+def fill_cart(app_client):
+    """Puts two Diet Cokes and a notebook in the cart."""
+    response = app_client.post(
+        "/cart/batch",
+        json={
+            "ops": [
+                {"item_id": "2", "action": "add"},
+                {"item_id": "2", "action": "increase"},
+                {"item_id": "6", "action": "add"},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_home_sends_visitors_to_cas(app_client):
+    response = app_client.get("/")
+    assert response.status_code == 302
+    assert "fed.princeton.edu/cas/login" in response.headers["Location"]
+
+
+def test_shop_pages_render(app_client, login):
+    login(app_client, "Jacob")
+    for path in (
+        "/shop",
+        "/category_view/drinks",
+        "/cart_view",
+        "/profile",
+    ):
+        assert app_client.get(path).status_code == 200, path
+
+
+def rename_item(repo, item_id, name):
+    """Renames an item, which bumps the catalog version."""
+    if isinstance(repo.items, MemoryItems):
+        with repo.items.state.lock:
+            repo.items.state.items[item_id]["name"] = name
+            repo.items.state.catalog_version += 1
+        return
+    with closing(database.get_main_db_connection()) as conn:
+        conn.execute(
+            "UPDATE items SET name = ? WHERE id = ?", (name, item_id)
+        )
+        conn.commit()
+
+
+def test_catalog_change_renders_cached_pages_again(
+    app_client, login, repo
+):
+    login(app_client, "Jacob")
+    category = database.SAMPLE_ITEMS["1"]["category"]
+    path = f"/category_view/{category}"
+    app_client.get(path)
+    hits = fragments.hits
+    assert "Coke" in app_client.get(path).get_data(True)
+    assert fragments.hits == hits + 1
+
+    rename_item(repo, "1", "Cherry Coke")
+    assert "Cherry Coke" in app_client.get(path).get_data(True)
+    assert fragments.hits == hits + 1
+
+
+def test_cart_batch_adds_the_delivery_fee(app_client, login):
+    login(app_client, "Jacob")
+    cart = fill_cart(app_client)
+    assert cart["subtotal"] == round(2 * 1.29 + 2.49, 2)
+    assert cart["delivery_fee"] == round(cart["subtotal"] * 0.1, 2)
+    assert cart["total"] == round(
+        cart["subtotal"] + cart["delivery_fee"], 2
+    )
+
+
+def test_add_and_delete_through_the_data_server(
+    app_client, login, repo
+):
+    user_id = login(app_client, "Jacob")
+    assert app_client.post("/add_to_cart/1").get_json() == {
+        "1": {"quantity": 1}
+    }
+    app_client.post("/update_cart/1/increase")
+    assert repo.carts.get(user_id) == {"1": {"quantity": 2}}
+    assert app_client.post("/delete_item/1").get_json() == {}
+
+
+def test_place_order_empties_the_cart(app_client, login, repo):
+    user_id = login(app_client, "Jacob")
+    fill_cart(app_client)
+
+    missing = app_client.post("/place_order", json={})
+    assert missing.status_code == 400
+    placed = app_client.post(
+        "/place_order", json={"delivery_location": "Whitman 302"}
+    )
+    assert placed.status_code == 200
+    assert not repo.carts.get(user_id)
+
+    order = repo.orders.latest_for_user(user_id)
+    assert order["status"] == "placed"
+    assert order["cart"]["2"]["quantity"] == 2
+    assert order["zone_id"] == 3
+    assert repo.items.available_stock()["2"] == 22
+
+
+def test_place_order_refuses_an_empty_cart(app_client, login):
+    login(app_client, "Jacob")
+    response = app_client.post(
+        "/place_order", json={"delivery_location": "Whitman 302"}
+    )
+    assert response.status_code == 400
+
+
+def test_delivery_from_claim_to_fulfilment(app_client, login, repo):
+    shopper = login(app_client, "Jacob")
+    fill_cart(app_client)
+    app_client.post("/place_order", json={"delivery_location": "Frist"})
+    order_id = repo.orders.latest_for_user(shopper)["id"]
+
+    deliverer = login(app_client, "Alex")
+    assert str(order_id).encode() in app_client.get("/deliver").data
+    accepted = app_client.post(f"/accept_delivery/{order_id}")
+    assert accepted.status_code == 302
+    assert (
+        app_client.post(f"/accept_delivery/{order_id}").status_code
+        == 409
+    )
+    assert repo.orders.get(order_id)["claimed_by"] == deliverer
+
+    skipped = app_client.post(
+        "/update_checklist",
+        json={
+            "order_id": order_id,
+            "step": "Delivered",
+            "checked": True,
+        },
+    )
+    assert skipped.status_code == 400
+    for step in order_events.STEPS:
+        response = app_client.post(
+            "/update_checklist",
+            json={"order_id": order_id, "step": step, "checked": True},
+        )
+        assert response.get_json() == {"success": True}, step
+    assert repo.orders.get(order_id)["status"] == "fulfilled"
+
+    status = app_client.get(f"/order_status/{order_id}").get_json()
+    assert all(status["timeline"].values())
+    assert (
+        app_client.get(f"/delivery_timeline/{order_id}").status_code
+        == 200
+    )
+
+
+def test_only_the_deliverer_updates_the_checklist(
+    app_client, login, repo
+):
+    shopper = login(app_client, "Jacob")
+    fill_cart(app_client)
+    app_client.post("/place_order", json={"delivery_location": "Frist"})
+    order_id = repo.orders.latest_for_user(shopper)["id"]
+    repo.orders.claim(order_id, repo.users.get_or_create("Alex"))
+
+    login(app_client, "Matt")
+    response = app_client.post(
+        "/update_checklist",
+        json={
+            "order_id": order_id,
+            "step": "Order Accepted",
+            "checked": True,
+        },
+    )
+    assert response.status_code == 403
+
+
+def test_order_changes_feed(app_client, login, repo):
+    shopper = login(app_client, "Jacob")
+    fill_cart(app_client)
+    app_client.post("/place_order", json={"delivery_location": "Frist"})
+    order_id = repo.orders.latest_for_user(shopper)["id"]
+
+    login(app_client, "Alex")
+    feed = app_client.get("/orders/changes?since=0").get_json()
+    assert [change["id"] for change in feed["changes"]] == [order_id]
+    assert feed["changes"][0]["board"] == "available"
+    later = app_client.get(f"/orders/changes?since={feed['seq']}")
+    assert later.get_json()["changes"] == []
+
+
+def test_order_changes_hide_orders_off_the_callers_boards(
+    app_client, login, repo
+):
+    shopper = login(app_client, "Jacob")
+    fill_cart(app_client)
+    app_client.post("/place_order", json={"delivery_location": "Frist"})
+    order_id = repo.orders.latest_for_user(shopper)["id"]
+    repo.orders.claim(order_id, repo.users.get_or_create("Alex"))
+
+    login(app_client, "Matt")
+    feed = app_client.get("/orders/changes?since=0").get_json()
+    assert feed["changes"] == [{"id": order_id, "board": None}]
+
+    login(app_client, "Alex")
+    feed = app_client.get("/orders/changes?since=0").get_json()
+    assert feed["changes"][0]["board"] == "mine"
+    assert feed["changes"][0]["location"] == "Frist"
+    assert "cart" not in feed["changes"][0]
+
+
+def test_admin_pages_need_an_admin(app_client, login, monkeypatch):
+    monkeypatch.setattr(
+        app_module, "ADMIN_USERS", frozenset({"admin1"})
+    )
+    login(app_client, "Jacob")
+    assert app_client.get("/admin/analytics").status_code == 403
+    assert app_client.get("/admin/export/orders.csv").status_code == 403
+
+
+def test_admin_analytics_and_export(
+    app_client, login, repo, monkeypatch
+):
+    monkeypatch.setattr(
+        app_module, "ADMIN_USERS", frozenset({"admin1"})
+    )
+    shopper = login(app_client, "Jacob")
+    fill_cart(app_client)
+    app_client.post("/place_order", json={"delivery_location": "Frist"})
+    order_id = repo.orders.latest_for_user(shopper)["id"]
+
+    login(app_client, "admin1")
+    page = app_client.get("/admin/analytics")
+    assert page.status_code == 200
+    assert b"Order Analytics" in page.data
+
+    export = app_client.get("/admin/export/orders.csv")
+    assert export.status_code == 200
+    assert export.headers["Content-Disposition"].startswith(
+        "attachment"
+    )
+    header, row = export.data.decode().splitlines()
+    assert header.startswith("id,timestamp,status")
+    assert row.startswith(f"{order_id},")
+    unknown = app_client.get("/admin/export/orders.xml")
+    assert unknown.status_code == 400
+
+
+def test_health_and_readiness(app_client):
+    assert app_client.get("/healthz").status_code == 200
+    ready = app_client.get("/readyz").get_json()
+    assert ready["status"] == "ready"
+    assert "templates" in ready["checks"]
+
+
+def test_unchanged_dispatch_board_is_not_rendered_again(
+    app_client, login, repo
+):
+    shopper = login(app_client, "Jacob")
+    login(app_client, "Alex")
+    etag = app_client.get("/deliver").headers["ETag"]
+    again = app_client.get("/deliver", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+
+    repo.orders.place(
+        shopper,
+        {"1": {"quantity": 1, "price": 1.09, "name": "Coke"}},
+        "Frist",
+    )
+    changed = app_client.get(
+        "/deliver", headers={"If-None-Match": etag}
+    )
+    assert changed.status_code == 200
+    other_zone = app_client.get(
+        "/deliver?zone=1",
+        headers={"If-None-Match": changed.headers["ETag"]},
+    )
+    assert other_zone.status_code == 200
+
+
+def test_deleted_orders_leave_the_dispatch_board(
+    app_client, login, repo
+):
+    shopper = login(app_client, "Jacob")
+    repo.orders.place(
+        shopper,
+        {"1": {"quantity": 1, "price": 1.09, "name": "Coke"}},
+        "Frist",
+    )
+    login(app_client, "Alex")
+    board = app_client.get("/deliver")
+    since = repo.orders.latest_change_seq()
+    assert (
+        app_client.get(f"/orders/changes?since={since}").get_json()[
+            "changes"
+        ]
+        == []
+    )
+
+    repo.orders.delete_all()
+    again = app_client.get(
+        "/deliver", headers={"If-None-Match": board.headers["ETag"]}
+    )
+    assert again.status_code == 200
+    feed = app_client.get(f"/orders/changes?since={since}").get_json()
+    assert feed == {"reload": True}
+
+    since = repo.orders.latest_change_seq()
+    feed = app_client.get(f"/orders/changes?since={since}").get_json()
+    assert feed["changes"] == []
+
+
+def test_profile_is_tagged_per_user(app_client, login):
+    login(app_client, "Jacob")
+    etag = app_client.get("/profile").headers["ETag"]
+    again = app_client.get("/profile", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert "no-cache" in again.headers["Cache-Control"]
+
+    login(app_client, "Alex")
+    other = app_client.get("/profile", headers={"If-None-Match": etag})
+    assert other.status_code == 200
+
+
+def test_order_status_polls_are_answered_304_until_a_step(
+    app_client, login, repo
+):
+    shopper = login(app_client, "Jacob")
+    fill_cart(app_client)
+    app_client.post("/place_order", json={"delivery_location": "Frist"})
+    order_id = repo.orders.latest_for_user(shopper)["id"]
+    path = f"/order_status/{order_id}"
+
+    etag = app_client.get(path).headers["ETag"]
+    assert (
+        app_client.get(
+            path, headers={"If-None-Match": etag}
+        ).status_code
+        == 304
+    )
+
+    repo.orders.claim(order_id, repo.users.get_or_create("Alex"))
+    repo.orders.record_step(order_id, order_events.STEPS[0], True, 0)
+    polled = app_client.get(path, headers={"If-None-Match": etag})
+    assert polled.status_code == 200
+    assert polled.get_json()["timeline"][order_events.STEPS[0]]
+
+
+def test_pages_are_compressed_for_clients_accepting_gzip(
+    app_client, login
+):
+    login(app_client, "Jacob")
+    plain = app_client.get("/profile")
+    assert "Content-Encoding" not in plain.headers
+
+    compressed = app_client.get(
+        "/profile", headers={"Accept-Encoding": "gzip, deflate"}
+    )
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers["ETag"] == plain.headers["ETag"]
+
+    declined = app_client.get(
+        "/profile", headers={"Accept-Encoding": "gzip;q=0"}
+    )
+    assert "Content-Encoding" not in declined.headers
+
+
+def test_data_server_calls_name_the_user(
+    app_client, login, monkeypatch
+):
+    user_id = login(app_client, "Jacob")
+    sent = []
+    transport = backend.transport
+
+    def record(method, url, timeout=None, **kwargs):
+        sent.append(kwargs.get("headers", {}))
+        return transport(method, url, timeout=timeout, **kwargs)
+
+    monkeypatch.setattr(backend, "transport", record)
+    app_client.post("/add_to_cart/1")
+    assert sent == [{admission.USER_HEADER: str(user_id)}]
@@ -0,0 +1,83 @@
+"""
+test_assets.py
+Built asset generations surviving a deploy, and their pruning
+"""
+
+# pylint: disable=missing-function-docstring,redefined-outer-name
+
+import os
+import shutil
+
+import pytest
+
+import assets
+import build_assets
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    """Builds assets from copies of static/ under tmp_path, and returns
+    the directory holding the copies."""
+    source = tmp_path / "static"
+    source.mkdir()
+    for name in build_assets.ASSETS:
+        shutil.copy(os.path.join(build_assets.STATIC_DIR, name), source)
+    dist = source / "dist"
+    paths = {
+        "DIST_DIR": str(dist),
+        "MANIFEST": str(dist / "manifest.json"),
+        "DEPLOYED_MANIFEST": str(dist / "deployed.json"),
+    }
+    monkeypatch.setattr(build_assets, "STATIC_DIR", str(source))
+    for name, path in paths.items():
+        monkeypatch.setattr(build_assets, name, path)
+        monkeypatch.setattr(assets, name, path)
+    assets.load_manifest.cache_clear()
+    assets.servable.cache_clear()
+    yield source
+    assets.load_manifest.cache_clear()
+    assets.servable.cache_clear()
+
+
+def rebuild(static):
+    """Changes the stylesheet and builds again; returns the manifest."""
+    with open(static / "style.css", "a", encoding="utf-8") as f:
+        f.write("\nbody { margin: 1px; }\n")
+    build_assets.build()
+    return build_assets.read_manifest(build_assets.MANIFEST)
+
+
+def test_build_keeps_earlier_files_until_pruned(static):
+    build_assets.build()
+    first = build_assets.read_manifest(build_assets.MANIFEST)
+    second = rebuild(static)
+    assert first["style.css"] != second["style.css"]
+
+    old = os.path.join(build_assets.DIST_DIR, first["style.css"])
+    assert os.path.exists(old)
+    assert os.path.exists(old + ".gz")
+
+    build_assets.prune()
+    assert not os.path.exists(old)
+    assert not os.path.exists(old + ".gz")
+    for built in second.values():
+        assert os.path.exists(
+            os.path.join(build_assets.DIST_DIR, built)
+        )
+    deployed = build_assets.read_manifest(
+        build_assets.DEPLOYED_MANIFEST
+    )
+    assert deployed == second
+
+
+def test_new_workers_serve_the_deployed_build(static, app_client):
+    build_assets.build()
+    build_assets.prune()
+    deployed = build_assets.read_manifest(build_assets.MANIFEST)
+    built = rebuild(static)
+
+    for name in (deployed["style.css"], built["style.css"]):
+        response = app_client.get(f"/assets/{name}")
+        assert response.status_code == 200
+        response.close()
+    assert app_client.get("/assets/manifest.json").status_code == 404
@@ -0,0 +1,100 @@
+"""
+test_backend.py
+The circuit breaker and catalog snapshot app.py calls the data
+server through
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+import os
+
+import pytest
+
+import backend
+from database import SAMPLE_ITEMS
+
+
+class Refusal:  # pylint: disable=too-few-public-methods
+    """A data server answer that is not the catalog."""
+
+    status_code = 429
+
+    @staticmethod
+    def json():
+        return {"error": "Too many requests, please slow down"}
+
+
+def refuse(method, url, timeout=None, **kwargs):
+    del method, url, timeout, kwargs
+    return Refusal()
+
+
+def test_refused_catalog_is_not_cached(monkeypatch):
+    monkeypatch.setattr(backend, "transport", refuse)
+    with pytest.raises(backend.BackendUnavailable):
+        backend.get_items()
+    assert not os.path.exists(backend.CATALOG_SNAPSHOT)
+
+
+@pytest.mark.usefixtures("app_client")
+def test_refused_catalog_falls_back_to_the_snapshot(repo, monkeypatch):
+    items = backend.get_items()
+    assert set(items) == set(SAMPLE_ITEMS)
+
+    # A new catalog version makes the next call ask the data server
+    version = repo.items.catalog_version()
+    monkeypatch.setattr(
+        repo.items, "catalog_version", lambda: version + 1
+    )
+    monkeypatch.setattr(backend, "transport", refuse)
+    assert backend.get_items() == items
+    with open(backend.CATALOG_SNAPSHOT, encoding="utf-8") as f:
+        assert set(json.load(f)) == set(SAMPLE_ITEMS)
+
+
+def test_breaker_recovers_after_a_trial_raises(monkeypatch):
+    breaker = backend.CircuitBreaker(
+        failure_threshold=1, reset_seconds=0
+    )
+    monkeypatch.setattr(backend, "breaker", breaker)
+
+    def broken(method, url, timeout=None, **kwargs):
+        del method, url, timeout, kwargs
+        raise ValueError("unexpected answer")
+
+    monkeypatch.setattr(backend, "transport", broken)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            backend.get("/items")
+    assert breaker.is_open
+
+    monkeypatch.setattr(backend, "transport", refuse)
+    assert backend.get("/items").status_code == 429
+    assert not breaker.is_open
+
+
+def test_pages_built_from_a_stale_catalog_are_not_cached(
+    app_client, login, monkeypatch
+):
+    login(app_client, "Jacob")
+    category = SAMPLE_ITEMS["1"]["category"]
+    name = SAMPLE_ITEMS["1"]["name"]
+    stale = {
+        item_id: {**item, "name": f"Old {item['name']}"}
+        for item_id, item in backend.get_items().items()
+    }
+
+    # The data server is down, and the snapshot predates a rename
+    transport = backend.transport
+    monkeypatch.setattr(backend, "transport", refuse)
+    monkeypatch.setattr(
+        backend, "_snapshot", {"version": None, "items": stale}
+    )
+    page = app_client.get(f"/category_view/{category}").get_data(True)
+    assert f"Old {name}" in page
+
+    monkeypatch.setattr(backend, "transport", transport)
+    page = app_client.get(f"/category_view/{category}").get_data(True)
+    assert f"Old {name}" not in page
+    assert name in page
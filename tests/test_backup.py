@@ -0,0 +1,93 @@
+"""
+test_backup.py
+Snapshots of the live databases, and restoring them
+"""
+
+# pylint: disable=missing-function-docstring,redefined-outer-name
+
+import os
+
+import pytest
+
+import backup
+import database
+import repository
+from config import USER_SHARDS
+
+CART = {"1": {"quantity": 2}}
+
+
+@pytest.fixture
+def live(tmp_path, monkeypatch):
+    """Moves the databases into files under tmp_path, which the online
+    backup API can copy, and returns a SQLite Repository over them."""
+    # The in-memory shards the repo fixture made are not used here
+    for shard in range(USER_SHARDS):
+        database.close_memory_database(database.user_shard_path(shard))
+    monkeypatch.setattr(
+        database, "MAIN_DATABASE", str(tmp_path / "tigercart.sqlite3")
+    )
+    monkeypatch.setattr(
+        database, "USER_DATABASE", str(tmp_path / "users.sqlite3")
+    )
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backups"))
+    database.init_all()
+    return repository.create("sqlite")
+
+
+def fill_cart(repo, user_id):
+    repo.carts.update(user_id, lambda cart: cart.update(CART))
+
+
+def test_order_placed_during_a_backup_is_not_lost(live, monkeypatch):
+    shopper = live.users.get_or_create("Jacob")
+    fill_cart(live, shopper)
+    copy_database = backup.copy_database
+    copied = []
+
+    def copy_then_order(source_path, target_path):
+        restarts = copy_database(source_path, target_path)
+        copied.append(source_path)
+        if len(copied) == 1:
+            live.orders.place(shopper, CART, "Frist")
+            live.carts.clear(shopper)
+        return restarts
+
+    monkeypatch.setattr(backup, "copy_database", copy_then_order)
+    name = backup.backup()
+    backup.restore(name)
+
+    order = live.orders.latest_for_user(shopper)
+    assert order is not None or live.carts.get(shopper) == CART
+
+
+def test_restore_brings_back_the_snapshot(live):
+    shopper = live.users.get_or_create("Jacob")
+    fill_cart(live, shopper)
+    order_id, _ = live.orders.place(shopper, CART, "Frist")
+    name = backup.backup()
+    backup.verify(name)
+
+    live.orders.delete_all()
+    live.carts.clear(shopper)
+    newcomer = live.users.get_or_create("Maya")
+
+    # Restores run with the app stopped, so it starts over afterwards
+    backup.restore(name)
+    restored = repository.create("sqlite")
+    assert restored.orders.get(order_id)["user_id"] == shopper
+    assert restored.carts.get(shopper) == CART
+    assert restored.users.get(newcomer) is None
+
+
+def test_corrupted_snapshot_is_not_restored(live):
+    shopper = live.users.get_or_create("Jacob")
+    name = backup.backup()
+    fill_cart(live, shopper)
+    packed = os.path.join(backup.BACKUP_DIR, name, "users.sqlite3.gz")
+    with open(packed, "ab") as f:
+        f.write(b"garbage")
+
+    with pytest.raises(backup.BackupError):
+        backup.restore(name)
+    assert live.carts.get(shopper) == CART
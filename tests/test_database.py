@@ -0,0 +1,104 @@
+"""
+test_database.py
+Schema migrations that run while the previous code still serves, and
+the routing of users to their database shard
+"""
+
+# pylint: disable=missing-function-docstring,unused-argument
+# pylint: disable=redefined-outer-name
+
+from contextlib import closing
+
+import pytest
+
+import database
+import repository
+import sqlite_repository
+
+SHARDS = 3
+CART = {"1": {"quantity": 2}}
+
+
+def schema_names(conn):
+    """Returns the names of the tables, indexes, views and triggers."""
+    return {
+        row["name"]
+        for row in conn.execute("SELECT name FROM sqlite_master")
+    }
+
+
+def test_catalog_version_is_kept_until_contract(repo):
+    with closing(database.get_main_db_connection()) as conn:
+        conn.execute("""CREATE TABLE catalog_version (
+            id INTEGER PRIMARY KEY, version INTEGER NOT NULL)""")
+        conn.execute("INSERT INTO catalog_version VALUES (1, 41)")
+        conn.execute("""CREATE TRIGGER items_insert_version
+            AFTER INSERT ON items BEGIN
+            UPDATE catalog_version SET version = version + 1;
+            END""")
+        conn.execute(
+            "DELETE FROM cache_generation WHERE namespace = 'catalog'"
+        )
+        conn.commit()
+
+    database.init_main_db()
+    with closing(database.get_main_db_connection()) as conn:
+        assert {"catalog_version", "items_insert_version"} <= (
+            schema_names(conn)
+        )
+        generation = conn.execute(
+            """SELECT generation
+            FROM cache_generation WHERE namespace = 'catalog'"""
+        ).fetchone()
+        assert generation[0] == 41
+
+    database.contract_main_db()
+    with closing(database.get_main_db_connection()) as conn:
+        names = schema_names(conn)
+    assert "catalog_version" not in names
+    assert "items_insert_version" not in names
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    """Spreads users over SHARDS shards, and returns a SQLite
+    Repository over them."""
+    for module in (database, sqlite_repository):
+        monkeypatch.setattr(module, "USER_SHARDS", SHARDS)
+    database.init_user_db()
+    yield repository.create("sqlite")
+    for shard in range(1, SHARDS):
+        database.close_memory_database(database.user_shard_path(shard))
+
+
+def test_adding_a_shard_only_moves_users_to_it():
+    user_ids = range(1, 1001)
+    before = database.group_by_shard(user_ids, SHARDS)
+    after = database.group_by_shard(user_ids, SHARDS + 1)
+    assert sorted(sum(after.values(), [])) == list(user_ids)
+    for shard, users in before.items():
+        assert set(users) - set(after[shard]) <= set(after[SHARDS])
+    assert 0 < len(after[SHARDS]) < len(user_ids) / 2
+
+
+def test_users_are_stored_on_their_shard(sharded):
+    names = [f"user{number}" for number in range(20)]
+    user_ids = [sharded.users.get_or_create(name) for name in names]
+    for user_id in user_ids:
+        sharded.carts.update(user_id, lambda cart: cart.update(CART))
+
+    shards = database.group_by_shard(user_ids)
+    assert len(shards) == SHARDS
+    for shard, users in shards.items():
+        with closing(database.get_user_shard_connection(shard)) as conn:
+            stored = {
+                row["user_id"]
+                for row in conn.execute("SELECT user_id FROM users")
+            }
+        assert set(users) <= stored
+        assert not stored & (set(user_ids) - set(users))
+
+    for name, user_id in zip(names, user_ids):
+        assert sharded.users.get_or_create(name) == user_id
+        assert sharded.users.get(user_id)["name"] == name
+        assert sharded.carts.get(user_id) == CART
@@ -0,0 +1,44 @@
+"""
+test_inventory.py
+Stock taken by orders, and given back or sold when they finish
+"""
+
+# pylint: disable=missing-function-docstring
+
+ITEM = "1"
+
+
+def cart(quantity):
+    return {ITEM: {"quantity": quantity, "price": 1.09, "name": "Coke"}}
+
+
+def test_orders_take_stock_until_the_item_is_sold_out(repo):
+    shopper = repo.users.get_or_create("Jacob")
+    repo.items.set_stock(ITEM, 3)
+
+    order_id, sold_out = repo.orders.place(shopper, cart(2), "Frist")
+    assert order_id is not None and sold_out is None
+    assert repo.items.stock([ITEM]) == {ITEM: 1}
+
+    order_id, sold_out = repo.orders.place(shopper, cart(2), "Frist")
+    assert order_id is None and sold_out == ITEM
+    assert repo.items.stock([ITEM]) == {ITEM: 1}
+    assert len(repo.orders.history(shopper)) == 1
+
+
+def test_declined_orders_give_stock_back(repo):
+    shopper = repo.users.get_or_create("Jacob")
+    deliverer = repo.users.get_or_create("Alex")
+    repo.items.set_stock(ITEM, 3)
+    declined, _ = repo.orders.place(shopper, cart(2), "Frist")
+    delivered, _ = repo.orders.place(shopper, cart(1), "Frist")
+    assert repo.items.stock([ITEM]) == {ITEM: 0}
+
+    assert repo.orders.transition(declined, "declined")
+    repo.orders.claim(delivered, deliverer)
+    assert repo.orders.transition(delivered, "fulfilled")
+    assert repo.items.stock([ITEM]) == {ITEM: 2}
+
+    # Declining twice does not give the stock back twice
+    assert not repo.orders.transition(declined, "declined")
+    assert repo.items.stock([ITEM]) == {ITEM: 2}
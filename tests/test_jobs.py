@@ -0,0 +1,63 @@
+"""
+test_jobs.py
+Claiming, retrying and deduplicating background jobs
+"""
+
+# pylint: disable=missing-function-docstring,redefined-outer-name
+# pylint: disable=protected-access
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Registers a "test" handler that fails while payloads ask it to,
+    retries at once, and returns the batches it was called with."""
+    batches = []
+
+    def run(payloads):
+        batches.append(payloads)
+        if any(payload.get("fail") for payload in payloads):
+            raise RuntimeError("asked to fail")
+
+    monkeypatch.setitem(jobs._handlers, "test", (run, 2))
+    monkeypatch.setattr(jobs, "RETRY_BASE_SECONDS", 0)
+    return batches
+
+
+def test_failed_job_is_retried_then_given_up(runs):
+    assert jobs.enqueue("test", {"fail": True}, max_attempts=2)
+    assert jobs.run_once("worker") == 1
+    assert jobs.counts() == {"queued": 1}
+
+    assert jobs.run_once("worker") == 1
+    assert jobs.counts() == {"failed": 1}
+    assert jobs.run_once("worker") == 0
+    assert len(runs) == 2
+
+
+def test_ready_jobs_of_a_kind_run_as_one_batch(runs):
+    for number in range(3):
+        jobs.enqueue("test", {"number": number})
+    assert jobs.run_once("worker") == 2
+    assert jobs.run_once("worker") == 1
+    assert runs == [[{"number": 0}, {"number": 1}], [{"number": 2}]]
+    assert jobs.counts() == {"done": 3}
+
+
+def test_claimed_job_is_hidden_until_its_visibility_ends(runs):
+    assert jobs.enqueue("test", dedupe_key="once")
+    assert not jobs.enqueue("test", dedupe_key="once")
+
+    kind, rows = jobs.claim("first", visibility=0)
+    assert (kind, len(rows)) == ("test", 1)
+    # The first worker died; the job is claimed again after it
+    kind, rows = jobs.claim("second", visibility=60)
+    assert (rows[0]["locked_by"], rows[0]["attempts"]) == ("first", 1)
+    assert jobs.claim("third") == (None, [])
+
+    jobs.complete([rows[0]["id"]])
+    assert jobs.counts() == {"done": 1}
+    assert not runs
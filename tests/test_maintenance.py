@@ -0,0 +1,65 @@
+"""
+test_maintenance.py
+Purging old orders and clearing abandoned carts in batches
+"""
+
+# pylint: disable=missing-function-docstring,redefined-outer-name
+
+from contextlib import closing
+
+import pytest
+
+import database
+import maintenance
+import repository
+
+CART = {"1": {"quantity": 2, "price": 1.09, "name": "Coke"}}
+LONG_AGO = "2000-01-01 00:00:00"
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Runs maintenance in batches of two without pausing, and returns
+    a SQLite Repository over the databases it works on."""
+    monkeypatch.setattr(maintenance, "MAINTENANCE_BATCH_SIZE", 2)
+    monkeypatch.setattr(maintenance, "MAINTENANCE_PAUSE", 0)
+    return repository.create("sqlite")
+
+
+def test_purged_orders_give_their_stock_back(store):
+    shopper = store.users.get_or_create("Jacob")
+    store.items.set_stock("1", 10)
+    old = [
+        store.orders.place(shopper, CART, "Frist")[0] for _ in range(3)
+    ]
+    recent, _ = store.orders.place(shopper, CART, "Frist")
+    with closing(database.get_main_db_connection()) as conn:
+        conn.executemany(
+            "UPDATE orders SET timestamp = ? WHERE id = ?",
+            [(LONG_AGO, order_id) for order_id in old],
+        )
+        conn.commit()
+
+    assert maintenance.purge_orders(30, dry_run=True) == 3
+    assert store.orders.get(old[0]) is not None
+    assert maintenance.purge_orders(30) == 3
+    assert not any(store.orders.get(order_id) for order_id in old)
+    assert store.orders.get(recent)["status"] == "placed"
+    assert store.items.stock(["1"]) == {"1": 8}
+
+
+def test_only_idle_carts_are_cleared(store):
+    idle = store.users.get_or_create("Jacob")
+    active = store.users.get_or_create("Alex")
+    for user_id in (idle, active):
+        store.carts.update(user_id, lambda cart: cart.update(CART))
+    with closing(database.get_user_db_connection(idle)) as conn:
+        conn.execute(
+            "UPDATE users SET cart_updated_at = ? WHERE user_id = ?",
+            (LONG_AGO, idle),
+        )
+        conn.commit()
+
+    assert maintenance.clear_carts(idle_days=7) == 1
+    assert store.carts.get(idle) == {}
+    assert store.carts.get(active) == CART
@@ -0,0 +1,88 @@
+"""
+test_order_lifecycle.py
+Archiving finished orders and the delivery timeline, on both
+storage backends
+"""
+
+# pylint: disable=missing-function-docstring
+
+import sqlite3
+from contextlib import closing
+
+import database
+import order_events
+from memory_repository import MemoryOrders
+
+CART = {"1": {"quantity": 1, "price": 1.09, "name": "Coke"}}
+
+
+def finish_long_ago(repo, order_id):
+    """Fulfils an order and backdates it past the archive cutoff."""
+    repo.orders.claim(order_id, repo.users.get_or_create("Alex"))
+    repo.orders.transition(order_id, "fulfilled")
+    long_ago = "2000-01-01 00:00:00"
+    if isinstance(repo.orders, MemoryOrders):
+        repo.orders.state.orders[order_id]["timestamp"] = long_ago
+        return
+    with closing(database.get_main_db_connection()) as conn:
+        conn.execute(
+            "UPDATE orders SET timestamp = ? WHERE id = ?",
+            (long_ago, order_id),
+        )
+        conn.commit()
+
+
+def test_archived_order_ids_are_not_reused(repo):
+    shopper = repo.users.get_or_create("Jacob")
+    first, _ = repo.orders.place(shopper, CART, "Frist")
+    finish_long_ago(repo, first)
+    assert repo.orders.archive_finished(30) == 1
+
+    second, _ = repo.orders.place(shopper, CART, "Frist")
+    assert second != first
+    finish_long_ago(repo, second)
+    assert repo.orders.archive_finished(30) == 1
+
+    history = repo.orders.history(shopper)
+    assert sorted(order["id"] for order in history) == sorted(
+        [first, second]
+    )
+
+
+def test_rechecking_a_step_adds_no_event(repo):
+    shopper = repo.users.get_or_create("Jacob")
+    deliverer = repo.users.get_or_create("Alex")
+    order_id, _ = repo.orders.place(shopper, CART, "Frist")
+    repo.orders.claim(order_id, deliverer)
+    first = order_events.STEPS[0]
+
+    for checked in (True, True, False, False):
+        assert repo.orders.record_step(
+            order_id, first, checked, deliverer
+        )
+    events = repo.orders.events(order_id)
+    assert [event["checked"] for event in events] == [1, 0]
+
+
+def test_orders_without_autoincrement_are_rebuilt():
+    with closing(sqlite3.connect(":memory:")) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, status TEXT)"
+        )
+        cursor.executemany(
+            "INSERT INTO orders (id, status) VALUES (?, ?)",
+            [(1, "placed"), (7, "fulfilled")],
+        )
+        database.make_order_ids_monotonic(cursor)
+
+        (sql,) = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'orders'"
+        ).fetchone()
+        assert "AUTOINCREMENT" in sql
+        assert cursor.execute(
+            "SELECT id, status FROM orders ORDER BY id"
+        ).fetchall() == [(1, "placed"), (7, "fulfilled")]
+        cursor.execute("DELETE FROM orders WHERE id = 7")
+        cursor.execute("INSERT INTO orders (status) VALUES ('placed')")
+        assert cursor.lastrowid == 8
@@ -0,0 +1,237 @@
+"""
+test_server.py
+Routes of server.py, the data server
+"""
+
+# pylint: disable=missing-function-docstring
+
+import admission
+from config import COMPRESS_MIN_SIZE
+from database import SAMPLE_ITEMS
+
+
+def place_order(repo, user_id, cart=None):
+    """Places an order for user_id and returns its id."""
+    cart = cart or {"1": {"quantity": 2, "price": 1.09, "name": "Coke"}}
+    order_id, sold_out = repo.orders.place(user_id, cart, "Whitman 302")
+    assert sold_out is None
+    return order_id
+
+
+def test_items_lists_the_catalog(server_client):
+    response = server_client.get("/items")
+    assert response.status_code == 200
+    items = response.get_json()
+    assert set(items) == set(SAMPLE_ITEMS)
+    assert items["1"]["name"] == "Coke"
+
+
+def test_cart_add_increase_and_delete(server_client):
+    def post(item_id, action):
+        return server_client.post(
+            "/cart",
+            json={"user_id": 2, "item_id": item_id, "action": action},
+        )
+
+    assert post("1", "add").get_json() == {"1": {"quantity": 1}}
+    assert post("1", "increase").get_json() == {"1": {"quantity": 2}}
+    assert post("2", "add").status_code == 200
+    assert post("1", "delete").get_json() == {"2": {"quantity": 1}}
+    cart = server_client.get("/cart", json={"user_id": 2}).get_json()
+    assert cart == {"2": {"quantity": 1}}
+
+
+def test_cart_refuses_unknown_and_sold_out_items(repo, server_client):
+    unknown = server_client.post(
+        "/cart", json={"user_id": 2, "item_id": "999", "action": "add"}
+    )
+    assert unknown.status_code == 404
+
+    repo.items.set_stock(5, 0)
+    sold_out = server_client.post(
+        "/cart", json={"user_id": 2, "item_id": "5", "action": "add"}
+    )
+    assert sold_out.status_code == 409
+
+
+def test_cart_of_unknown_user_is_not_found(server_client):
+    response = server_client.get("/cart", json={"user_id": 999})
+    assert response.status_code == 404
+
+
+def test_cart_without_a_valid_user_id_is_not_found(server_client):
+    for body in ({}, {"user_id": None}, {"user_id": "nobody"}):
+        assert server_client.get("/cart", json=body).status_code == 404
+        response = server_client.post(
+            "/cart", json={**body, "item_id": "1", "action": "add"}
+        )
+        assert response.status_code == 404, body
+
+
+def test_cart_refuses_malformed_ops(server_client):
+    for op in (
+        {"action": "update", "quantity": "3"},
+        {"action": "update", "quantity": -1},
+        {"action": "update", "quantity": True},
+        {"action": "empty"},
+    ):
+        single = server_client.post(
+            "/cart", json={"user_id": 2, "item_id": "1", **op}
+        )
+        assert single.status_code == 400, op
+        batch = server_client.post(
+            "/cart/batch",
+            json={"user_id": 2, "ops": [{"item_id": "1", **op}]},
+        )
+        assert batch.status_code == 400, op
+
+
+def test_cart_update_is_checked_against_stock(repo, server_client):
+    repo.items.set_stock(6, 12)
+
+    def update(quantity):
+        return server_client.post(
+            "/cart/batch",
+            json={
+                "user_id": 2,
+                "ops": [
+                    {
+                        "item_id": "6",
+                        "action": "update",
+                        "quantity": quantity,
+                    }
+                ],
+            },
+        )
+
+    assert update(500).status_code == 409
+    assert update(12).get_json()["lines"]["6"]["quantity"] == 12
+
+
+def test_batch_cart_prices_the_cart(server_client):
+    response = server_client.post(
+        "/cart/batch",
+        json={
+            "user_id": 2,
+            "ops": [
+                {"item_id": "2", "action": "add"},
+                {"item_id": "2", "action": "increase"},
+                {"item_id": "4", "action": "update", "quantity": 3},
+            ],
+        },
+    )
+    assert response.status_code == 200
+    cart = response.get_json()
+    assert cart["lines"]["2"]["quantity"] == 2
+    assert cart["lines"]["4"]["quantity"] == 3
+    assert cart["subtotal"] == round(2 * 1.29 + 3 * 1.59, 2)
+
+
+def test_deliveries_and_delivery_details(repo, server_client):
+    order_id = place_order(repo, 2)
+
+    deliveries = server_client.get(
+        "/deliveries", json={"user_id": 3}
+    ).get_json()
+    assert list(deliveries) == [str(order_id)]
+    assert deliveries[str(order_id)]["user_name"] == "Jacob"
+
+    delivery = server_client.get(f"/delivery/{order_id}").get_json()
+    assert delivery["subtotal"] == 2.18
+    assert delivery["earnings"] == 0.22
+    assert server_client.get("/delivery/99999").status_code == 404
+
+
+def test_accept_delivery_only_once(repo, server_client):
+    order_id = place_order(repo, 2)
+
+    first = server_client.post(
+        f"/accept_delivery/{order_id}", json={"user_id": 3}
+    )
+    second = server_client.post(
+        f"/accept_delivery/{order_id}", json={"user_id": 4}
+    )
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert repo.orders.get(order_id)["claimed_by"] == 3
+
+
+def test_decline_delivery(repo, server_client):
+    order_id = place_order(repo, 2)
+
+    assert (
+        server_client.post(f"/decline_delivery/{order_id}").status_code
+        == 200
+    )
+    assert repo.orders.get(order_id)["status"] == "declined"
+    assert (
+        server_client.post("/decline_delivery/99999").status_code == 409
+    )
+
+
+def test_shopper_timeline(repo, server_client):
+    order_id = place_order(repo, 2)
+
+    response = server_client.get(
+        f"/get_shopper_timeline?order_id={order_id}"
+    )
+    assert response.status_code == 200
+    assert (
+        server_client.get(
+            "/get_shopper_timeline?order_id=99999"
+        ).status_code
+        == 404
+    )
+
+
+def test_health_and_readiness(server_client):
+    assert server_client.get("/healthz").get_json()["status"] == "ok"
+    ready = server_client.get("/readyz")
+    assert ready.status_code == 200
+    assert set(ready.get_json()["checks"]) == {
+        "catalog",
+        "orders",
+        "users",
+    }
+
+
+def test_items_are_not_resent_while_the_catalog_is_unchanged(
+    repo, server_client, monkeypatch
+):
+    first = server_client.get("/items")
+    etag = first.headers["ETag"]
+    assert etag.startswith("W/")
+
+    again = server_client.get("/items", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert not again.data
+
+    version = repo.items.catalog_version()
+    monkeypatch.setattr(
+        repo.items, "catalog_version", lambda: version + 1
+    )
+    changed = server_client.get(
+        "/items", headers={"If-None-Match": etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_small_responses_are_not_compressed(server_client):
+    response = server_client.get(
+        "/items", headers={"Accept-Encoding": "gzip"}
+    )
+    assert len(response.data) < COMPRESS_MIN_SIZE
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_rate_limits_follow_the_forwarded_user(server_client):
+    def get_items(user_id):
+        return server_client.get(
+            "/items", headers={admission.USER_HEADER: str(user_id)}
+        ).status_code
+
+    assert [get_items(user_id) for user_id in range(25)] == [200] * 25
+    statuses = [get_items(1) for _ in range(25)]
+    assert 429 in statuses
@@ -1,11 +0,0 @@
-#!/usr/bin/env python
-""" top.py Author: Bob Dondero"""
-
-# -----------------------------------------------------------------------
-# top.py
-# Author: Bob Dondero
-# -----------------------------------------------------------------------
-
-import flask
-
-app = flask.Flask("app", template_folder="templates")
@@ -15,18 +15,35 @@ if [ "$LOCAL" != "$REMOTE" ]; then
     echo "New changes detected. Pulling changes..."
     /usr/local/bin/git pull origin main  # Replace 'main' with your branch name if different
 
-    # Restart the server after pulling changes
-    echo "Restarting Gunicorn for app and server..."
-    doas /usr/bin/pkill -f "gunicorn --bind 127.0.0.1:8000"
-    doas /usr/bin/pkill -f "gunicorn --bind 127.0.0.1:5150"
-    sleep 10
     . tigercart_env/bin/activate
 
-    # Restart server.py on port 5150
-    gunicorn --bind 127.0.0.1:5150 server:app --workers 5 &
+    # Apply schema changes; they only add to the schema, which the
+    # running workers keep using until the new ones are ready
+    python3 database.py
 
-    # Restart app.py on port 8000
-    gunicorn --bind 127.0.0.1:8000 app:app --workers 5 &
+    # Build the new fingerprinted and precompressed static assets next
+    # to the ones the running workers serve
+    python3 build_assets.py build
+
+    # Compile changed templates into the bytecode cache, so the new
+    # masters load them rather than compiling them as they start
+    python3 warmup.py
+
+    # Restart the background job worker; jobs it was running are
+    # picked up again once their visibility timeout passes
+    doas /usr/bin/pkill -f "python3 worker.py"
+    python3 worker.py &
+
+    # Reload server.py and then app.py without dropping requests: the
+    # running workers keep serving until the new ones report ready, and
+    # a service whose new workers never do is left on the old code
+    echo "Reloading Gunicorn for server and app..."
+    if python3 deploy.py server && python3 deploy.py app; then
+        # Only the new workers are left, so the tables and assets only
+        # the previous code used can go; a failed deploy keeps them
+        python3 database.py contract
+        python3 build_assets.py prune
+    fi
 else
     echo "No changes detected. No restart needed."
 fi
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+warmup.py
+Work done before a service takes traffic, so the first requests each
+worker serves are as fast as the ones after them
+
+Usage: python warmup.py
+
+Run on its own, it compiles app.py's templates into TEMPLATE_CACHE_DIR
+ahead of a restart.
+"""
+
+import hashlib
+import importlib
+import inspect
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def bytecode_cache(directory, extensions=()):
+    """Returns a Jinja bytecode cache keeping templates in directory.
+
+    Jinja recompiles a template whose source changed. The code a
+    template compiles to also depends on the extensions it uses, so
+    their source is part of the file names.
+    """
+    digest = hashlib.sha1()
+    for extension in extensions:
+        digest.update(inspect.getsource(extension).encode("utf-8"))
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(
+        directory, f"__jinja2_{digest.hexdigest()[:12]}_%s.cache"
+    )
+
+
+def compile_templates(flask_app):
+    """Compiles every template into the app's Jinja cache.
+
+    Returns how many there are.
+    """
+    env = flask_app.jinja_env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def request_paths(flask_app, paths):
+    """Serves a GET request for each path; returns the status codes.
+
+    This builds Flask's URL map, opens this process's database
+    connections and fills the caches the handlers read through.
+    """
+    client = flask_app.test_client()
+    statuses = []
+    for path in paths:
+        try:
+            statuses.append(client.get(path).status_code)
+        except Exception as error:  # pylint: disable=broad-except
+            # A cold cache is no reason to refuse to start
+            print(f"Warm-up request to {path} failed: {error}")
+            statuses.append(None)
+    return statuses
+
+
+def prime(flask_app, paths, templates=False):
+    """Warms a service up in the process loading it.
+
+    Run before workers are forked, everything it caches is shared
+    with them. templates says whether the service renders any.
+    """
+    start = time.perf_counter()
+    compiled = compile_templates(flask_app) if templates else 0
+    statuses = request_paths(flask_app, paths)
+    print(
+        f"Warmed up {flask_app.import_name}: {compiled} templates, "
+        f"requests {statuses}, in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def main():
+    """Compiles app.py's templates into the bytecode cache."""
+    start = time.perf_counter()
+    # app.py uses this module, so it is looked up by name, as serve.py
+    # does, rather than imported back
+    flask_app = importlib.import_module("app").app
+    compiled = compile_templates(flask_app)
+    print(
+        f"Compiled {compiled} templates in "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
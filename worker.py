@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+worker.py
+Runs background jobs from the queue in jobs.py: user statistics,
+order expiry and archival, and catalog snapshot warming
+
+Usage: python worker.py [--once]
+"""
+
+import os
+import socket
+import sys
+import time
+
+import backend
+import jobs
+import repository
+from config import (
+    ORDER_ARCHIVE_DAYS,
+    ORDER_EXPIRY_MINUTES,
+    ORDER_SWEEP_INTERVAL,
+    WORKER_POLL_SECONDS,
+)
+
+# Jobs the worker schedules itself: kind -> (seconds between runs,
+# priority). An interval of 0 disables the job.
+PERIODIC = {
+    "expire_orders": (ORDER_SWEEP_INTERVAL, jobs.NORMAL),
+    "archive_orders": (60 * 60, jobs.BACKGROUND),
+    "warm_catalog": (5 * 60, jobs.BACKGROUND),
+}
+
+
+@jobs.handler("refresh_user_stats", batch_size=50)
+def refresh_user_stats(payloads):
+    """Recomputes the user_stats rows of every user in payloads."""
+    repository.get().orders.refresh_stats(
+        payload["user_id"] for payload in payloads
+    )
+
+
+@jobs.handler("expire_orders")
+def expire_orders(_payloads):
+    """Cancels placed orders nobody claimed in time."""
+    expired = repository.get().orders.expire_stale(ORDER_EXPIRY_MINUTES)
+    if expired:
+        print(f"Expired {expired} stale orders.")
+
+
+@jobs.handler("archive_orders")
+def archive_orders(_payloads):
+    """Archives old finished orders and purges old finished jobs."""
+    archived = repository.get().orders.archive_finished(
+        ORDER_ARCHIVE_DAYS
+    )
+    purged = jobs.purge_finished()
+    if archived or purged:
+        print(f"Archived {archived} orders, purged {purged} jobs.")
+
+
+@jobs.handler("warm_catalog")
+def warm_catalog(_payloads):
+    """Refreshes the catalog snapshot app.py falls back on at startup."""
+    backend.get_items()
+
+
+def schedule_periodic(next_runs, now):
+    """Queues periodic jobs that are due; returns the updated schedule."""
+    for kind, (interval, priority) in PERIODIC.items():
+        if interval <= 0 or now < next_runs.get(kind, 0):
+            continue
+        # The dedupe key keeps several workers from piling them up
+        jobs.enqueue(kind, priority=priority, dedupe_key=kind)
+        next_runs[kind] = now + interval
+    return next_runs
+
+
+def run(once=False):
+    """Runs jobs until interrupted, or until the queue is empty if once."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    next_runs = {}
+    print(f"Worker {worker_id} started.")
+    while True:
+        if not once:
+            next_runs = schedule_periodic(next_runs, time.time())
+        if jobs.run_once(worker_id):
+            continue
+        if once:
+            return
+        time.sleep(WORKER_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    try:
+        run(once="--once" in sys.argv[1:])
+    except KeyboardInterrupt:
+        pass